@@ -1,18 +1,23 @@
+import hashlib
 import json
 import time
 import datetime as dt
-from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
-from scipy.stats import linregress
 import argparse
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
-import requests
-import xml.etree.ElementTree as ET
+from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 import os
-import htmlmin
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from markupsafe import Markup
+from awsClients import get_client
+from dbSchema import connect
+from forecastStore import STORES, ForecastCache, S3Store, open_store
+from bandPlan import CONTEST_BANDS, WARC_BANDS
+from zoneAggregator import ZoneAggregator, SpotterAggregator
+from zoneStats import ZONES, BAND_COLUMNS, spot_grid, query_grids
+from spotHistory import raw_boundary
+from pageRenderer import PageRenderer
+from solarData import SolarProvider
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', None)
@@ -27,13 +32,42 @@ parser.add_argument("-l", "--lower",
 parser.add_argument("-u", "--upper",
                     help="Specify the upper end of the data count threshold (filled square). Default = 10",
                     type=int, default=10)
-parser.add_argument("-r", "--range", type=int, default=0.25,
+parser.add_argument("-r", "--range", type=float, default=0.25,
                     help="Specify # of hours of data from current time to analyze. Default = 0.25")
+parser.add_argument("-w", "--windows",
+                    help="Specify a table per window, as comma-separated # of hours, e.g. 0.25,1,6. All windows are "
+                         "computed from the same data read. Default = the range")
+parser.add_argument("-b", "--backend", choices=["incremental", "sql", "pandas"], default="incremental",
+                    help="Specify how the tables are computed: 'incremental' keeps running totals and only reads new "
+                         "spots, 'sql' aggregates the window inside SQLite, 'pandas' reads every spot of the window "
+                         "every run. 'pandas' only sees the raw spots, not the part of longer windows already "
+                         "compacted into the history. Default = incremental")
+parser.add_argument("-p", "--per-spotter", action="store_true",
+                    help="Publish a page per spotter at <spotter>/index.html, next to the page of all skimmers at "
+                         "index.html")
+parser.add_argument("--forecast-store", choices=STORES, default="file",
+                    help="Specify where bedrockAnalysis.py stores the band conditions: 'file' is bedrock.json and "
+                         "'sqlite' the database, both on this host; 's3' is bedrock.json in the S3 bucket. "
+                         "Default = file")
+parser.add_argument("--workers", type=int, default=4,
+                    help="Specify # of pages rendered and uploaded at once. Default = 4")
+parser.add_argument("--max-skips", type=int, default=10,
+                    help="Specify # of runs in a row an unchanged page isn't re-rendered and re-uploaded for, before "
+                         "it is published anyway to refresh its time. 0 publishes every run. Default = 10")
 args = parser.parse_args()
 frequency = args.frequency
 sparse = args.lower
 busy = args.upper
 span = args.range
+windows = sorted({float(hours) for hours in args.windows.split(',')}) if args.windows else [span]
+backend = args.backend
+per_spotter = args.per_spotter
+workers = args.workers
+max_skips = args.max_skips
+forecast_store = args.forecast_store
+fetch_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix='fetch')  # the inputs of each run, read at once
+page_renderer = PageRenderer(sparse, busy)  # the static shell of the page is rendered once, at startup
+solar_provider = SolarProvider()  # cache of the solar data, shared with bedrockAnalysis through its file
 
 # mapping zone numbers to descriptions...
 zone_name_map = {
@@ -79,43 +113,56 @@ zone_name_map = {
     40: 'North Atlantic Zone: JW, JX, OX, R1FJ (Franz Josef Land), and TF.'
 }
 
+# Zone column of the tables: the zone number with its description as a CSS tooltip, one per zone of the grid
+ZONE_TOOLTIPS = np.array([Markup('<span class="tooltip">{:02d}<span class="tooltiptext">{}</span></span>').format(
+    zone, zone_name_map.get(zone, "")) for zone in ZONES], dtype=object)
+
+# Grid columns of the bands shown in the tables; spots on other bands of the plan, e.g. 60m or 2m, aren't displayed
+DISPLAYED_COLUMNS = BAND_COLUMNS[CONTEST_BANDS + WARC_BANDS]
+
+# Solar data shown on the page, by SolarData field
+SOLAR_FIELDS = {
+    "SFI": "sfi",
+    "Sunspots": "sunspots",
+    "A-Index": "a_index",
+    "K-Index": "k_index",
+    "X-Ray": "xray",
+    "Signal_Noise": "signal_noise",
+    "Aurora": "aurora",
+    "Lat.": "aurora_latitude",
+}
+
+# Count symbols by count level (no spots, quiet, moderate, busy), in the second row marked for CW spotted
+COUNT_SYMBOLS = np.array([[' ', '\u25CB', '\u25d1', '\u25cf'],
+                          [' ', '\u25CB+', '\u25d1+', '\u25cf+']], dtype=object)
+
+# Upper bounds of the mean SNR levels, in dB, and the cell CSS class of each level: marginal, normal, above average,
+# hot, then no spots
+SNR_BOUNDS = [-15, -10, -3]
+SNR_CLASSES = np.array(['marginal', 'normal', 'above', 'hot', 'nodata'], dtype=object)
+
+# SNR slope arrows by slope level: falling fast, falling, flat, rising, rising fast, then unknown
+SLOPE_SYMBOLS = np.array(['\u21D3', '\u21D8', '\u21D4', '\u21D7', '\u21D1', ''], dtype=object)
+
 
 def get_s3_client():
     """
-    Retrieve the temporary credentials from the instance profile and create an S3 client.
+    Returns the S3 client shared by every run. It is created once and refreshes the instance profile credentials
+    itself, so runs don't pay for a new session, client and connection.
     """
-    try:
-        # Use the boto3 session to get the credentials from the instance profile
-        session = boto3.Session()
-        credentials = session.get_credentials().get_frozen_credentials()
-
-        # Create the S3 client using the temporary credentials
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=credentials.access_key,
-            aws_secret_access_key=credentials.secret_key,
-            aws_session_token=credentials.token
-        )
-        return s3
-    except ClientError as e:
-        print(f"Error getting S3 client: {e}")
-        return None
+    return get_client('s3')
 
 
-def retrieve_bedrock_json(bucket_name):
+def retrieve_bedrock_json(forecasts):
     """
-    Retrieves json file containing Bedrock response from S3 bucket.
-    :return: bedrock.json file.
+    Retrieves the Bedrock band conditions from the forecast store. They are only reloaded when bedrockAnalysis
+    stored a new forecast.
+
+    :param forecasts: The ForecastCache of the forecast store.
+    :return: The band conditions, None if no forecast was stored yet, or False if they can't be read.
     """
-    file_name = "bedrock.json"
-    s3_client = get_s3_client()
     try:
-        response = s3_client.get_object(Bucket=bucket_name, Key=file_name)
-        json_data = response['Body'].read().decode('utf-8')
-        data = json.loads(json_data)
-        return data
-    except FileNotFoundError:
-        print(f"The file {file_name} was not found")
+        return forecasts.get()
     except NoCredentialsError:
         print("Credentials not available")
     except PartialCredentialsError:
@@ -125,17 +172,16 @@ def retrieve_bedrock_json(bucket_name):
     return False
 
 
-
-def upload_file_to_s3(file_name, bucket_name):
+def upload_file_to_s3(file_name, bucket_name, obj_name='index.html'):
     """
     Uploads the html file to the AWS S3 bucket using the IAM role credentials.
 
     :param file_name: The name of the html file being uploaded.
     :param bucket_name: The name of the bucket being uploaded to.
+    :param obj_name: The key the file is uploaded to.
     :return: Boolean True if the file was uploaded successfully. False if not uploaded successfully.
     """
     s3_client = get_s3_client()
-    obj_name = 'index.html'
 
     try:
         s3_client.upload_file(file_name, bucket_name, obj_name, ExtraArgs={'ContentType': 'text/html; charset=utf-8'})
@@ -152,323 +198,237 @@ def upload_file_to_s3(file_name, bucket_name):
     return False
 
 
-def reformat_table(table):
+def reformat_table(grid, values):
     """
-    Reformats our pivot table into a dataframe convenient for HTML display.
+    Lays out one statistic of the zone grid as a dataframe convenient for HTML display: a row per zone with spots on
+    a displayed band, the contest bands, a blank column, then the WARC bands. The columns are sliced straight out of
+    the dense grid.
 
-    :param table: The pivot table being reformatted.
-    :return: A dataframe reformatted from the pivot table.
+    :param grid: The ZoneGrid the statistic belongs to.
+    :param values: The zones x bands array of the statistic.
+    :return: A dataframe with the zone tooltips and a column per band.
     """
-    flattened = pd.DataFrame(table.to_records())
-    flattened['zone'] = pd.to_numeric(flattened['zone'], errors='coerce')
-    flattened = flattened.sort_values(by='zone')
-    # Updated lambda function to use CSS tooltips
-    flattened['zone'] = flattened['zone'].apply(
-        lambda
-            x: f'<span class="tooltip">{str(x).zfill(2)}<span class="tooltiptext">{zone_name_map.get(x, "")}</span></span>'
-    )
-    flattened.reset_index(drop=True)
-    flattened1 = (flattened.reindex(
-        ['zone', '160', '80', '40', '20', '15', '10', '6', ' ', '30', '17', '12'], axis=1))
-
-    flattened1 = flattened1.fillna({' ': ' '})
+    rows = grid.count[:, DISPLAYED_COLUMNS].any(axis=1)
+    shown = values[rows]
+    columns = {'zone': ZONE_TOOLTIPS[rows]}
+    columns.update({str(band): shown[:, BAND_COLUMNS[band]] for band in CONTEST_BANDS})
+    columns[' '] = ' '
+    columns.update({str(band): shown[:, BAND_COLUMNS[band]] for band in WARC_BANDS})
 
-    return flattened1
+    return pd.DataFrame(columns)
 
 
-def replace_values(df):
+def count_symbols(counts, cw_counts=None):
     """
-    Replaces numbers in the dataframe with symbols, replaces NaN with an empty space.
+    Replaces spot counts with symbols, marked with a '+' where CW was spotted. No spots, or NaN, is an empty space.
 
-    :param df: The dataframe being modified.
-    :return: A dataframe with modified entries.
+    :param counts: Array of spot counts.
+    :param cw_counts: Array of CW spot counts, the shape of counts. Nothing is marked if None.
+    :return: An object array of the symbols.
     """
-    df = df.fillna(0)
+    counts = np.nan_to_num(np.asarray(counts, dtype=np.float64))
+    levels = np.select([counts <= 0, counts <= sparse, counts < busy], [0, 1, 2], 3)
+    marked = np.zeros(counts.shape, dtype=np.intp) if cw_counts is None else \
+        (np.nan_to_num(np.asarray(cw_counts, dtype=np.float64)) >= 1).astype(np.intp)
+    return COUNT_SYMBOLS[marked, levels]
 
-    def replace_value(x):
-        if isinstance(x, (int, float)):
-            if x == 0:
-                return ' '
-            elif x <= sparse:
-                return '\u25CB'
-            elif sparse < x < busy:
-                return '\u25d1'
-            elif x >= busy:
-                return '\u25cf'
-        return x
 
-    return df.map(replace_value)
-
-
-def slope_to_unicode(slope):
+def snr_classes(means):
     """
-    Converts a slope value to a corresponding Unicode character based on the specified ranges.
+    Classes mean SNRs by how Hot or Marginal they are, for the cell colors.
 
-    :param slope: The slope value (float) to convert.
-    :return: A Unicode character representing the direction of the slope.
+    :param means: Array of mean SNRs in dB, NaN where there are no spots.
+    :return: An object array of the CSS classes.
     """
-    if -0.1 <= slope <= 0.1:
-        return '\u21D4'  # ⇔
-    elif 0.1 < slope <= 0.3:
-        return '\u21D7'  # ⇗
-    elif slope > 0.3:
-        return '\u21D1'  # ⇑
-    elif -0.3 <= slope < -0.1:
-        return '\u21D8'  # ⇘
-    elif slope < -0.3:
-        return '\u21D3'  # ⇓
-    else:
-        return ''  # In case of NaN or other unexpected values
+    means = np.asarray(means, dtype=np.float64)
+    levels = np.where(np.isnan(means), len(SNR_BOUNDS) + 1, np.digitize(means, SNR_BOUNDS, right=True))
+    return SNR_CLASSES[levels]
 
 
-def update_count_table(count_df, cw_df):
+def slope_symbols(slopes):
     """
-    Updates the count dataframe by appending a '+' wherever the CW table has a value >= 1.
+    Converts SNR slopes to arrows: flat within 0.1 dB per minute, steep beyond 0.3.
 
-    :param count_df: The dataframe containing counts (SNR).
-    :param cw_df: The dataframe containing CW counts.
-    :return: Modified count_df with '+' added where necessary.
+    :param slopes: Array of SNR slopes in dB per minute.
+    :return: An object array of the arrows, empty where the slope is NaN.
     """
-    count_df = count_df.fillna(0)  # fill NaNs with 0 for consistency in count_df
-    cw_df = cw_df.fillna(0)  # fill NaNs with 0 in cw_df as well
-
-    for col in count_df.columns:
-        if col in cw_df.columns:  # make sure the columns match
-            for i in range(len(count_df)):
-                try:
-                    if cw_df[col].iloc[i] >= 1:  # check if CW table has 1 or more
-                        count_df.loc[i, col] = f"{count_df.loc[i, col]}+"  # append '+' in count table
+    slopes = np.asarray(slopes, dtype=np.float64)
+    levels = np.select([np.isnan(slopes), slopes < -0.3, slopes < -0.1, slopes <= 0.1, slopes <= 0.3],
+                       [5, 0, 1, 2, 3], 4)
+    return SLOPE_SYMBOLS[levels]
 
-                finally:
-                    continue
-
-    return count_df
-
-
-def custom_agg(x):
-    if len(x) >= 5:
-        try:
-            slope, _, _, _, _ = linregress(pd.to_numeric(x.index.values), x.values)
-            return slope
-        except:
-            return np.nan
-    else:
-        return np.nan
 
+def read_spots(db_file='callsigns.db', since=None):
+    """
+    Reads the spots from the SQLite database into a dataframe.
 
-def run(s3_bucket):
+    :param db_file: The SQLite database file.
+    :param since: Unix time of the oldest spot to read. All spots are read if None.
+    :return: A dataframe with zone, band, snr, timestamp, spotter and mode columns, or None if the database can't be
+             read.
+    """
     # Connect to the SQLite database
-    conn = sqlite3.connect('callsigns.db')
+    conn = connect(db_file)
 
-    # Read data from the SQLite table `callsigns` into a pandas DataFrame
+    # Read data from the SQLite table `callsigns` into a pandas DataFrame; the timestamp index limits the read
+    # to the analyzed window
     query = """
-    SELECT zone, band, snr, timestamp, spotter
+    SELECT zone, band, snr, timestamp, spotter, mode
     FROM callsigns
+    WHERE timestamp >= ?
     """
 
     try:
-        df = pd.read_sql_query(query, conn)
+        df = pd.read_sql_query(query, conn, params=(since if since is not None else 0,))
         num_records = len(df)  # Count the number of rows in the DataFrame
         print(f"Number of records read from the database: {num_records}")
+        # the compactor keeps raw spots for a few minutes only; the rest of a longer window is in the rollups, which
+        # only the sql and incremental backends read
+        boundary = raw_boundary(conn, since if since is not None else 0, time.time())
+        if boundary is not None:
+            print(f"Warning: spots before {dt.datetime.fromtimestamp(boundary[1]):%H:%M} were already compacted and "
+                  f"are missing from the window. Use --backend sql or incremental for windows longer than the raw "
+                  f"spots are kept.")
     except Exception as e:
         print(f"Error: Unable to read data from the SQLite database. {e}")
-        return
+        return None
     finally:
         conn.close()  # Close the database connection after reading the data
 
     # Convert 'timestamp' column to integer if necessary
     df['timestamp'] = pd.to_numeric(df['timestamp'], downcast='integer')
+    return df
 
-    spotter = df['spotter'].iloc[0]
-
-    # 1. Count Table (Number of SNR records per zone and band)
-    count_table = df.pivot_table(values='snr', index=['zone'], columns=['band'], aggfunc='count')
-    count_table = count_table.fillna(0)  # Fill missing values with 0
-    count_table = count_table.astype(int)  # Convert to integers since it's a count
-    count_table = reformat_table(count_table)  # Reformat the table as needed
-
-    # 2. Mean Table (Average SNR per zone and band)
-    mean_table = df.pivot_table(values='snr', index=['zone'], columns=['band'], aggfunc='mean')
-    mean_table = reformat_table(mean_table)  # Reformat the table as needed
-
-    # 3. Slope Table (Slope of SNR over time per zone and band using custom_agg)
-    slope_table = df.pivot_table(values='snr', index=['zone'], columns=['band'], aggfunc=custom_agg)
-    slope_table = slope_table.fillna(0)  # Optionally fill missing values
-    slope_table = reformat_table(slope_table)  # Reformat the table as needed
-
-    # count_table = df.pivot_table(values='snr', index=['zone'], columns=['band'], aggfunc='count')  # pivot based on Zones and Bands with snr being the value.
-    # count_table = count_table.fillna(0)
-    # count_table = count_table.astype(int)
-    # count_table = reformat_table(count_table)
-
-    # mean_table = df.pivot_table(values='snr', index=['zone'], columns=['band'], aggfunc='mean')  # turn dataframe into pivot table.
-    # mean_table = reformat_table(mean_table)
-
-    def apply_color(val):  # colors cells based on if the zone/Bands are Hot or Marginal.
-        if pd.isna(val):
-            return 'background-color: #f0f0f0'
-        elif val <= -15:
-            return 'background-color: #a3cce9'
-        elif -15 < val <= -10:
-            return 'background-color: #b6e3b5'
-        elif -10 < val <= -3:
-            return 'background-color: #f7c896'
-        else:
-            return 'background-color: #e57373'
 
-    # apply color map to numeric columns only.
-    means_no_zone = mean_table.drop(columns=['zone', ' '])
-    color_table1 = means_no_zone.map(apply_color)
+def build_grid(df):
+    """
+    Computes every per zone and band statistic of the spots in one pass.
 
-    count_table = replace_values(count_table)
+    :param df: The dataframe of spots, as returned by read_spots.
+    :return: The ZoneGrid of the spots.
+    """
+    return spot_grid(df['zone'].to_numpy(), df['band'].to_numpy(), df['snr'].to_numpy(), df['timestamp'].to_numpy(),
+                     df['mode'].to_numpy())
 
-    # add the 'zone' column back without applying the color map to it.
-    count_table['zone'] = mean_table['zone']
-    count_table[' '] = mean_table[' ']
 
-    now = dt.datetime.now(dt.timezone.utc).strftime("%b %d, %Y %H:%M")
-    caption_string = "Last 15-min data - " + spotter + " - " + now + " GMT"  # table caption
-
-    # apply the styles to the dataframes.
-    styled_table1 = count_table.style.apply(lambda x: color_table1, axis=None).set_caption(caption_string)
-
-    styled_table1.set_properties(subset=['zone'], **{'font-weight': 'bold'})
-    styled_table1.set_properties(**{'text-align': 'center'})
-
-    # set table styles to different parts of the table.
-    styled_table1.set_table_styles([
-        {'selector': 'caption', 'props': [('font-size', '13pt'), ('font-weight', 'bold')]},
-        {'selector': 'th',
-         'props': [('font-size', '12pt'), ('word-wrap', 'break-word'), ('position', 'sticky'),
-                   ('top', '0'), ('background-color', 'rgba(255, 255, 255, 0.75)'), ('z-index', '1')]},
-        {'selector': 'td:first-child', 'props': [('font-size', '12pt')]},  # First column
-        {'selector': 'td',
-         'props': [('font-size', '10pt'), ('padding-left', 'calc(5px + 1vw)'), ('padding-top', '4px'),
-                   ('padding-bottom', '4px'), ('padding-right', 'calc(5px + 1vw)')]}
-    ])
-
-    # convert the styled table to HTML.
-    html1 = styled_table1.hide(axis="index").to_html()
-
-    html1 = html1.replace('<table ',
-                          '<table style="width: 60vw; table-layout: fixed; margin-left: auto; margin-right: auto;" ')
-
-    # legend HTML block.
-    legend_html = f"""
-     <head> <meta http-equiv="refresh" content="60"> </head> 
-     <div style="position: fixed; bottom: 0; left: 50%; transform: translateX(-50%); width: 90%; background-color: rgba(255, 255, 255, 0.75); font-weight: bold; padding: 10px; border: 1px solid gray; box-sizing: border-box; z-index: 1000;">
-         <div style="display: flex; justify-content: space-around; margin-bottom: 10px;">
-             <div style="display: flex; align-items: center; margin-right: 20px; font-size: 12pt;">
-                 <div style="width: 20px; height: 20px; background-color: #a3cce9; margin-right: 5px;"></div>
-                 <div>Marginal (≤ -15 dB)</div>
-             </div>
-             <div style="display: flex; align-items: center; margin-right: 20px; font-size: 12pt;">
-                 <div style="width: 20px; height: 20px; background-color: #b6e3b5; margin-right: 5px;"></div>
-                 <div>Normal (-15 to -10 dB)</div>
-             </div>
-             <div style="display: flex; align-items: center; margin-right: 20px; font-size: 12pt;">
-                 <div style="width: 20px; height: 20px; background-color: #f7c896; margin-right: 5px;"></div>
-                 <div>Above Average (-10 to -3 dB)</div>
-             </div>
-             <div style="display: flex; align-items: center; font-size: 12pt;">
-                 <div style="width: 20px; height: 20px; background-color: #e57373; margin-right: 5px;"></div>
-                 <div>Hot (> -3 dB)</div>
-             </div>
-         </div>
-         <div style="display: flex; justify-content: space-around;">
-             <div style="display: flex; align-items: center; margin-right: 20px; font-size: 12pt;">
-                 <div style="font-size: 20px; margin-right: 5px;">\u25CB</div>
-                 <div>Quiet (≤ {sparse} spots)</div>
-             </div>
-             <div style="display: flex; align-items: center; margin-right: 20px; font-size: 12pt;">
-                 <div style="font-size: 20px; margin-right: 5px;">\u25d1</div>
-                 <div>Moderate ({sparse + 1} to {busy - 1} spots)</div>
-             </div>
-             <div style="display: flex; align-items: center; font-size: 12pt;">
-                 <div style="font-size: 20px; margin-right: 5px;">\u25cf</div>
-                 <div>Busy (≥ {busy} spots)</div>
-             </div>
-         </div>
-     </div>
-     """
-
-    # fetch solar widget XML data.
-    solar_response = requests.get("https://www.hamqsl.com/solarxml.php")
-    xml_data = solar_response.content
-    root = ET.fromstring(xml_data)
-
-    # Extract solar and band condition data
-    solar_data = {
-        "SFI": root.findtext("solardata/solarflux"),
-        "Sunspots": root.findtext("solardata/sunspots"),
-        "A-Index": root.findtext("solardata/aindex"),
-        "K-Index": root.findtext("solardata/kindex"),
-        "X-Ray": root.findtext("solardata/xray"),
-        "Signal_Noise": root.findtext("solardata/signalnoise"),  # Replace space with an underscore for key safety
-        "Aurora": root.findtext("solardata/aurora"),
-        "Lat.": root.findtext("solardata/latdegree"),
-    }
-
-    conditions = {
-        "80m-40m": {"Day": "", "Night": ""},
-        "30m-20m": {"Day": "", "Night": ""},
-        "17m-15m": {"Day": "", "Night": ""},
-        "12m-10m": {"Day": "", "Night": ""},
-    }
-
-    for band in root.findall("solardata/calculatedconditions/band"):
-        band_name = band.get("name")
-        time = band.get("time")
-        condition = band.text
-        if band_name in conditions:
-            conditions[band_name][time.capitalize()] = condition
-
-    bedrock_data = retrieve_bedrock_json(s3_bucket)
-
-    # Updated HTML content with modified CSS for right-aligned tooltips
-    solar_table_html = f"""
-    <div style="width: 100%; text-align: center; font-weight: bold; margin-bottom: 5px;">Solar Data by N0NBH</div>
-    <hr>
-    <div style="display: flex; justify-content: center; margin-bottom: 5px;">
-        <div style="margin-right: 20px;">
-            <span style="font-weight: bold;">SFI:</span> <span style="font-weight: bold;">{solar_data['SFI']}</span>
-        </div>
-        <div>
-            <span style="font-weight: bold;">SSN:</span> <span style="font-weight: bold;">{solar_data['Sunspots']}</span>
-        </div>
-    </div>
-    <div style="display: inline-flex; justify-content: center; align-items: center; width: 100%; text-align: center; white-space: nowrap;">
-        <div style="margin-right: 10px;">
-            <span style="font-weight: bold;">A:</span> <span style="font-weight: bold;">{solar_data['A-Index']}</span>
-        </div>
-        <div style="margin-right: 10px;">
-            <span style="font-weight: bold;">K:</span> <span style="font-weight: bold;">{solar_data['K-Index']}</span>
-        </div>
-        <div>
-            <span style="font-weight: bold;">X:</span> <span style="font-weight: bold;">{solar_data['X-Ray']}</span>
-        </div>
-    </div>
-
-    <div style="display: flex; justify-content: center; align-items: center; white-space: nowrap;">
-        <div style="margin-right: 20px;">
-            <span style="font-weight: bold;">Aurora:</span> <span style="font-weight: bold;">{solar_data['Aurora']}</span>
-        </div>
-        <div>
-            <span style="font-weight: bold;">Lat.:</span> <span style="font-weight: bold;">{solar_data['Lat.']}</span>
-        </div>
-    </div>
-
-    <hr>
-    <div style="width: 100%; text-align: center; font-weight: bold; margin-top: 10px; margin-bottom: 10px">Band Conditions</div>
-    <table style="width: 60%; margin: 0 auto; border-collapse: collapse; font-size: 15px;">
-        <tbody>
-    """
-    summary = bedrock_data["Summary"]
-    # Generate table rows with CSS tooltips
+def read_grids(db_file='callsigns.db', starts=(0,)):
+    """
+    Aggregates the spots inside the SQLite database, so only the sums of each zone and band are read. Every window,
+    and every spotter's windows with per_spotter, are computed from the same scan.
+
+    :param db_file: The SQLite database file.
+    :param starts: Unix time of the oldest spot counted in each window.
+    :return: The ZoneGrid of each window per spotter, with all spotters together under None, and the spotter of
+             the first spot; or None if the database can't be read.
+    """
+    conn = connect(db_file)
+    try:
+        views = query_grids(conn, list(starts), by_spotter=True) if per_spotter else \
+            {None: query_grids(conn, list(starts))}
+        row = conn.execute("SELECT spotter FROM callsigns WHERE timestamp >= ? ORDER BY id LIMIT 1",
+                           (min(starts),)).fetchone()
+        print(f"Number of records aggregated in the database: {max(grid.count.sum() for grid in views[None])}")
+    except Exception as e:
+        print(f"Error: Unable to read data from the SQLite database. {e}")
+        return None
+    finally:
+        conn.close()
+
+    return views, row[0] if row else ''
+
+
+def refresh_grids(aggregator, db_file='callsigns.db', window_seconds=(None,)):
+    """
+    Brings the running totals of an aggregator up to date with the new spots in the database.
+
+    :param aggregator: The ZoneAggregator holding the totals of the longest window, or the SpotterAggregator also
+                       holding each spotter's; it is updated in place.
+    :param db_file: The SQLite database file.
+    :param window_seconds: The length in seconds of each window. None for the aggregator's whole window.
+    :return: The ZoneGrid of each window per spotter, with all spotters together under None, or None if the
+             database can't be read.
+    """
+    conn = connect(db_file)
+    try:
+        now = time.time()
+        new_records = aggregator.refresh(conn, now)
+        print(f"Number of new records read from the database: {new_records}")
+    except Exception as e:
+        print(f"Error: Unable to read data from the SQLite database. {e}")
+        return None
+    finally:
+        conn.close()
+
+    views = {None: [aggregator.grid(now, window) for window in window_seconds]}
+    for spotter, spotter_aggregator in getattr(aggregator, 'spotters', {}).items():
+        views[spotter] = [spotter_aggregator.grid(now, window) for window in window_seconds]
+    return views
+
+
+def build_tables(grid):
+    """
+    Lays out the count, mean SNR, SNR slope and CW count tables per zone and band.
+
+    :param grid: The ZoneGrid of the spots, as returned by build_grid, read_grids or refresh_grids.
+    :return: The count, mean, slope and CW count tables, reformatted for HTML display.
+    """
+    count_table = reformat_table(grid, grid.count)
+    mean_table = reformat_table(grid, grid.mean)
+    slope_table = reformat_table(grid, np.nan_to_num(grid.slope))  # Slope of SNR in dB per minute, 0 if unknown
+    cw_table = reformat_table(grid, grid.cw_count)
+    return count_table, mean_table, slope_table, cw_table
+
+
+def render_table(count_table, mean_table, caption_string, cw_table=None):
+    """
+    Renders the zone table: count symbols, marked with '+' where CW was spotted, cells colored by mean SNR.
+
+    :param count_table: The count table, as returned by build_tables.
+    :param mean_table: The mean SNR table, as returned by build_tables.
+    :param caption_string: The table caption.
+    :param cw_table: The CW count table, as returned by build_tables. No cells are marked if None.
+    :return: The HTML of the table.
+    """
+    # format the band columns only, leaving the 'zone' and blank columns as they are.
+    bands = [i for i, column in enumerate(count_table.columns) if column not in ('zone', ' ')]
+    texts = count_table.to_numpy(dtype=object)
+    classes = np.full(texts.shape, '', dtype=object)
+    cw_counts = None if cw_table is None else cw_table.iloc[:, bands].to_numpy(dtype=np.float64)
+    texts[:, bands] = count_symbols(texts[:, bands].astype(np.float64), cw_counts)
+    classes[:, bands] = snr_classes(mean_table.iloc[:, bands].to_numpy(dtype=np.float64))
+
+    rows = [list(zip(row_classes, row_texts)) for row_classes, row_texts in zip(classes.tolist(), texts.tolist())]
+    return page_renderer.render_table(caption_string, list(count_table.columns), rows)
+
+
+def fetch_solar_data():
+    """
+    Gets the solar widget data of hamqsl.com from the shared cache. Stale data is returned at once and revalidated
+    in the background, so the page never waits on the feed once it was fetched.
+
+    :return: The solar data and the calculated band conditions, as dictionaries. None if the solar data was never
+             fetched and the feed can't be reached.
+    """
+    solar = solar_provider.get()
+    if solar is None:
+        return None
+    solar_data = {key: '' if getattr(solar, field) is None else getattr(solar, field)
+                  for key, field in SOLAR_FIELDS.items()}
+    return solar_data, solar.conditions
+
+
+def build_solar_html(solar_data, bedrock_data):
+    """
+    Builds the solar data and band conditions panel shown on the left of the page.
+
+    :param solar_data: The solar data, as returned by fetch_solar_data.
+    :param bedrock_data: The Bedrock band conditions, as returned by retrieve_bedrock_json.
+    :return: The HTML of the panel.
+    """
+    bands = []
     for band, data in bedrock_data.items():
         if isinstance(data, dict) and "Rating" in data and "Explanation" in data:
             rating = data["Rating"]
-            explanation = data["Explanation"]
             if band == "Low_Bands":
                 band = "Low Bands (160 & 80)"
             elif band == "Medium_Bands":
@@ -490,124 +450,309 @@ def run(s3_bucket):
             else:
                 color = "red"
 
-            # Add row with a CSS-styled tooltip for the explanation
-            solar_table_html += f"""
-                <tr>
-                    <td style="padding: 5px; text-align: center; font-weight: bold; white-space: nowrap;">{band}</td>
-                    <td style="padding: 5px; text-align: center; font-weight: bold; color: {color}; position: relative;">
-                        <span class="tooltip">{rating}
-                            <span class="tooltiptext">{explanation}</span>
-                        </span>
-                    </td>
-                </tr>
-                """
+            # the explanation is shown in a CSS tooltip
+            bands.append((band, rating, color, data["Explanation"]))
         else:
             # Skip items that don't contain the required fields
             continue
 
-    solar_table_html += """
-        </tbody>
-    </table>
-
-    <style>
-    /* CSS for tooltip */
-    .tooltip {
-        position: relative;
-        display: inline-block;
-        cursor: pointer;
-    }
-
-    .tooltip .tooltiptext {
-        visibility: hidden;
-        width: 450px;
-        background-color: #333;
-        color: #fff;
-        text-align: left;
-        border-radius: 5px;
-        padding: 8px;
-        position: absolute;
-        z-index: 1;
-        left: 111%; /* Position to the right */
-        top: 50%;
-        transform: translateY(-50%);
-        opacity: 0;
-        transition: opacity 0.3s, transform 0.3s;
-        white-space: normal;
-        font-size: 12px;
-    }
-
-    /* Tooltip arrow pointing to the left */
-    .tooltip .tooltiptext::after {
-        content: "";
-        position: absolute;
-        top: 50%;
-        right: 100%;
-        margin-top: -5px;
-        border-width: 5px;
-        border-style: solid;
-        border-color: transparent #333 transparent transparent;
-    }
-
-    .tooltip:hover .tooltiptext {
-        visibility: visible;
-        opacity: 1;
-    }
-    </style>
-    """
-
-    # Add the Summary text after the table
-    solar_table_html += f"""
-        <div style="width: 300px; margin: 10px auto; text-align: left; font-size: 12px; color: #333;">
-            {summary}
-        </div>
+    return page_renderer.render_solar(solar_data, bands, bedrock_data["Summary"])
+
+
+def build_page(table_html, solar_table_html):
+    """
+    Assembles the page: the zone tables and the solar panel go into the shell rendered at startup, so the page comes
+    out minified without a minification pass.
+
+    :param table_html: The HTML of the zone tables.
+    :param solar_table_html: The HTML of the solar data panel.
+    :return: The minified HTML of the page.
+    """
+    return page_renderer.render_page(solar_table_html, table_html)
+
+
+def window_label(hours):
+    """
+    Describes a window for the table caption.
+
+    :param hours: The length of the window in hours.
+    :return: The length, in minutes below an hour, e.g. '15-min' or '6-h'.
+    """
+    if hours < 1:
+        return f"{hours * 60:g}-min"
+    return f"{hours:g}-h"
+
+
+def page_key(spotter):
+    """
+    Names the S3 object a page is uploaded to, which is also the local file it is written to.
+
+    :param spotter: The spotter of the page, None for the page of all spotters.
+    :return: index.html for all spotters, <spotter>/index.html for one.
+    """
+    if spotter is None:
+        return 'index.html'
+    return spotter.replace('/', '_') + '/index.html'
+
+
+def publish_page(s3_bucket, spotter, name, grids, now, solar_table_html):
+    """
+    Renders the page of one spotter, or of all spotters, writes it and uploads it to its own key.
+
+    :param s3_bucket: The name of the bucket the page is uploaded to.
+    :param spotter: The spotter of the page, None for the page of all spotters.
+    :param name: The name shown in the table captions.
+    :param grids: The ZoneGrid of each window.
+    :param now: The time shown in the table captions.
+    :param solar_table_html: The HTML of the solar data panel.
+    :return: Boolean True if the page was uploaded successfully. False if not uploaded successfully.
+    """
+    table_htmls = []
+    for hours, grid in zip(windows, grids):
+        count_table, mean_table, slope_table, cw_table = build_tables(grid)
+        caption_string = f"Last {window_label(hours)} data - {name} - {now} GMT"  # table caption
+        table_htmls.append(render_table(count_table, mean_table, caption_string, cw_table))
+
+    # Assemble the page before writing it to the file
+    minified_html = build_page('<br>'.join(table_htmls), solar_table_html)
+
+    key = page_key(spotter)
+    if os.path.dirname(key):
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+    with open(key, "w", encoding="utf-8") as text_file:  # write minified HTML data to the page's file.
+        text_file.write(minified_html)
+
+    print(f"Table updated in {key} at {now}")
+
+    return upload_file_to_s3(key, s3_bucket, key)  # upload the page to the S3 bucket
+
+
+def page_fingerprint(name, grids, solar_data, bedrock_data):
+    """
+    Fingerprints what a page shows, leaving out its time: the symbols and colors of every displayed table cell, the
+    captions' name and the solar and Bedrock data.
+
+    :param name: The name shown in the table captions.
+    :param grids: The ZoneGrid of each window.
+    :param solar_data: The solar data, as returned by fetch_solar_data.
+    :param bedrock_data: The Bedrock band conditions, as returned by retrieve_bedrock_json.
+    :return: The hex digest of the page content.
+    """
+    digest = hashlib.sha256(name.encode('utf-8'))
+    for grid in grids:
+        counts, cw_counts = grid.count[:, DISPLAYED_COLUMNS], grid.cw_count[:, DISPLAYED_COLUMNS]
+        digest.update('\0'.join(count_symbols(counts, cw_counts).ravel()).encode('utf-8'))
+        digest.update('\0'.join(snr_classes(grid.mean[:, DISPLAYED_COLUMNS]).ravel()).encode('utf-8'))
+    digest.update(json.dumps([solar_data, bedrock_data], sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PublishTracker:
+    """
+    Remembers the fingerprint of the last upload of every page, so a page whose content didn't change is neither
+    rendered nor uploaded again, up to max_skips runs in a row. Counts the pages published and skipped.
+    """
+
+    def __init__(self, max_skips=10):
         """
+        :param max_skips: The # of runs in a row an unchanged page is skipped for. 0 publishes every run.
+        """
+        self.max_skips = max_skips
+        self.fingerprints = {}  # fingerprint of the last upload of each page key
+        self.skips = {}  # runs in a row each page key was skipped
+        self.published = 0  # pages uploaded
+        self.skipped = 0  # pages skipped as unchanged
 
-    # Wrap the entire content in a fixed div for positioning
-    solar_table_html = f"""
-        <div style="position: fixed; left: 2%; padding-top: 0.75%; padding: 10px; z-index: 1000; font-family: 'Roboto', monospace;">
-            {solar_table_html}
-        </div>
+    def should_publish(self, key, fingerprint):
         """
+        Decides if a page is published this run, counting it as skipped if not.
+
+        :param key: The page key, as returned by page_key.
+        :param fingerprint: The fingerprint of the page this run, as returned by page_fingerprint.
+        :return: False if the page is unchanged since its last upload and was skipped fewer than max_skips times.
+        """
+        skips = self.skips.get(key, 0)
+        if self.fingerprints.get(key) == fingerprint and skips < self.max_skips:
+            self.skips[key] = skips + 1
+            self.skipped += 1
+            return False
+        return True
+
+    def record(self, key, fingerprint):
+        """
+        Records the upload of a page.
+
+        :param key: The page key, as returned by page_key.
+        :param fingerprint: The fingerprint of the uploaded page.
+        """
+        self.fingerprints[key] = fingerprint
+        self.skips[key] = 0
+        self.published += 1
+
+
+# Seconds each input of a run is waited for before its last-known-good value is used
+SPOTS_TIMEOUT = 30
+SOLAR_TIMEOUT = 10
+BEDROCK_TIMEOUT = 10
+
+
+def read_views(db_file, aggregator, starts, window_seconds):
+    """
+    Reads the grids of each window, with the backend in use.
+
+    :param db_file: The SQLite database file.
+    :param aggregator: The ZoneAggregator of the incremental backend, None for the sql and pandas backends.
+    :param starts: Unix time of the start of each window.
+    :param window_seconds: The length of each window in seconds.
+    :return: The ZoneGrids of each window per view, as returned by read_grids, and the spotter, or None if the
+             database can't be read.
+    """
+    if aggregator is not None:
+        views = refresh_grids(aggregator, db_file, window_seconds)
+        if views is None:
+            return None
+        return views, aggregator.last_spotter or ''
+    elif backend == "sql":
+        return read_grids(db_file, starts)
+
+    df = read_spots(db_file, since=min(starts))  # one read of the longest window
+    if df is None:
+        return None
+
+    spotter = df['spotter'].iloc[0] if len(df) else ''
+    views = {None: [build_grid(df[df['timestamp'] >= start]) for start in starts]}
+    if per_spotter:
+        for name, spots in df.groupby('spotter'):
+            views[name] = [build_grid(spots[spots['timestamp'] >= start]) for start in starts]
+    return views, spotter
 
-    final_html = f"""
-    <style>
-        body {{
-            margin: 0;
-            padding: 0;
-            overflow-y: hidden;
-        }}
-        html {{
-            height: 100%;
-        }}
-    </style>
-    <div style="display: flex; width: 100%; height: 100%;">
-        {solar_table_html}
-        <div style="position: relative; flex-grow: 1; padding-left: 160px; overflow-y: auto; font-family: 'Roboto', monospace;">
-            <div style="max-height: 80vh; overflow-y: auto; padding-top: 0.75%; padding-bottom: 10%;">
-                {html1}
-            </div>
-            <div>{legend_html}</div>
-        </div>
-    </div>
-    """
-
-    # Minify the final_html before writing it to the file
-    minified_html = htmlmin.minify(final_html, remove_empty_space=True, remove_comments=True)
-
-    # Write the minified HTML to index.html
-    with open("index.html", "w", encoding="utf-8") as text_file:  # write minified HTML data to index.html file.
-        text_file.write(minified_html)
 
-    print("Table updated in index.html at " + now)
+class Source:
+    """
+    An input of every run, fetched on the fetch pool within a timeout. When the fetch fails or times out, the last
+    value fetched in time is used instead. A fetch still running from an earlier run is waited on rather than
+    started again, so a hanging source never runs twice at once.
+    """
 
-    upload_file_to_s3("index.html", s3_bucket)  # upload index.html to S3 bucket
+    def __init__(self, name, fetch, timeout, default=None):
+        """
+        :param name: The name of the input, for the messages.
+        :param fetch: The function fetching the input. It returns None or False when it fails.
+        :param timeout: Seconds the fetch is waited for.
+        :param default: The value used until a fetch succeeds.
+        """
+        self.name = name
+        self.fetch = fetch
+        self.timeout = timeout
+        self.value = default  # last-known-good value
+        self.future = None
+        self.started = 0.0
+        self.timeouts = 0  # fetches that took longer than timeout
+        self.failures = 0  # fetches that failed
+
+    def start(self, *args):
+        """
+        Starts fetching the input in the background, unless the fetch of an earlier run is still running.
 
+        :param args: The arguments of the fetch.
+        """
+        if self.future is None or self.future.done():
+            self.future = fetch_pool.submit(self.fetch, *args)
+            self.started = time.monotonic()
+
+    def result(self):
+        """
+        Waits for the fetch until timeout seconds after it started.
+
+        :return: The value fetched, or the last-known-good value if the fetch failed or is still running.
+        """
+        try:
+            value = self.future.result(timeout=max(0.0, self.started + self.timeout - time.monotonic()))
+        except TimeoutError:
+            self.timeouts += 1
+            print(f"{self.name} not read within {self.timeout} s, using the last value read")
+            return self.value
+        except Exception as e:
+            value = None
+            print(f"Error: Unable to read {self.name}. {e}")
+        if value is None or value is False:
+            self.failures += 1
+            return self.value
+        self.value = value
+        return value
+
+
+# the inputs of each run: fetched concurrently, so a run waits for the slowest of them rather than their sum.
+spots_source = Source("spot data", read_views, SPOTS_TIMEOUT)
+solar_source = Source("solar data", fetch_solar_data, SOLAR_TIMEOUT, default=({key: '' for key in SOLAR_FIELDS}, {}))
+bedrock_source = Source("Bedrock band conditions", retrieve_bedrock_json, BEDROCK_TIMEOUT,
+                        default={"Summary": ""})
+
+
+def run(s3_bucket, db_file='callsigns.db', aggregator=None, tracker=None, forecasts=None):
+    """
+    Analyzes the spots of each window and uploads the page, with a table per window. With per_spotter, every
+    spotter also gets a page of their own spots, rendered and uploaded by a pool of workers. Pages the tracker finds
+    unchanged since their last upload are skipped. The spots, solar data and Bedrock band conditions are read at
+    once, each falling back to its last value read when it fails or is too slow.
+
+    :param s3_bucket: The name of the bucket the page is uploaded to.
+    :param db_file: The SQLite database file.
+    :param aggregator: The ZoneAggregator kept between runs by the incremental backend, covering the longest
+                       window; a SpotterAggregator with per_spotter. The windows are re-read with the sql or pandas
+                       backend if None.
+    :param tracker: The PublishTracker kept between runs. Every page is published if None.
+    :param forecasts: The ForecastCache of the forecast store, kept between runs. The band conditions are read from
+                      the S3 bucket if None.
+    """
+    window_seconds = [int(hours * 3600) for hours in windows]
+    starts = [int(time.time()) - seconds for seconds in window_seconds]
+    spots_source.start(db_file, aggregator, starts, window_seconds)
+    solar_source.start()
+    bedrock_source.start(forecasts or ForecastCache(S3Store(s3_bucket)))
+
+    result = spots_source.result()
+    if result is None:  # the spots were never read
+        return
+    views, spotter = result
+    solar_data, _ = solar_source.result()
+    bedrock_data = bedrock_source.result()
+    now = dt.datetime.now(dt.timezone.utc).strftime("%b %d, %Y %H:%M")
+
+    # the page of all spotters is captioned with the spotter when there is a single one
+    names = {view: view or ("All skimmers" if per_spotter else spotter) for view in views}
+    fingerprints = {view: page_fingerprint(names[view], grids, solar_data, bedrock_data)
+                    for view, grids in views.items()}
+    changed = [view for view in views
+               if tracker is None or tracker.should_publish(page_key(view), fingerprints[view])]
+    if changed:
+        solar_table_html = build_solar_html(solar_data, bedrock_data)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pages = {view: executor.submit(publish_page, s3_bucket, view, names[view], views[view], now,
+                                           solar_table_html) for view in changed}
+            for view, page in pages.items():
+                if page.result() and tracker is not None:
+                    tracker.record(page_key(view), fingerprints[view])
+
+    if tracker is not None:
+        print(f"{len(changed)} of {len(views)} pages published, {len(views) - len(changed)} unchanged. "
+              f"Since start: {tracker.published} published, {tracker.skipped} skipped.")
 
 
 if __name__ == '__main__':
     time_to_wait = frequency * 60  # time to wait in between re-running program
     s3_bucket = input("Enter the name of the S3 Bucket you'd like to write to: ")
+    # the incremental backend keeps its running totals between runs, so each run only reads the new spots.
+    window = int(max(windows) * 3600)
+    if backend != "incremental":
+        aggregator = None
+    elif per_spotter:
+        aggregator = SpotterAggregator(window=window)
+    else:
+        aggregator = ZoneAggregator(window=window)
+    tracker = PublishTracker(max_skips=max_skips)  # skips re-uploading pages that didn't change
+    forecasts = ForecastCache(open_store(forecast_store, s3_bucket))  # reloaded only when a new forecast is stored
 
     while True:  # run program every 'n' minutes, which will re-analyze data and upload a new index.html to the S3 bucket.
-        run(s3_bucket)
-        time.sleep(time_to_wait)
\ No newline at end of file
+        run(s3_bucket, aggregator=aggregator, tracker=tracker, forecasts=forecasts)
+        time.sleep(time_to_wait)
@@ -0,0 +1,104 @@
+import threading
+
+import boto3
+import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+
+# Seconds to wait for a connection, and for a response once connected
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# Connections kept open per host, enough for every analyzeData worker to upload at once
+POOL_SIZE = 16
+
+# Retries of failed HTTP requests, on top of the first attempt
+RETRIES = 2
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_bedrock = None
+_http = None
+
+
+def get_session():
+    """
+    Returns:
+        boto3.Session: The session shared by every client. Its credentials come from the default chain, e.g. the
+        instance profile, and are refreshed by botocore before they expire.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session()
+        return _session
+
+
+def get_client(service):
+    """
+    Returns the long-lived client of an AWS service, creating it on first use. Clients are thread safe and keep
+    their connections open between calls, so they are shared by every refresh cycle and worker thread.
+
+    Args:
+        service (str): The service name, e.g. 's3'.
+
+    Returns:
+        botocore.client.BaseClient: The client.
+    """
+    session = get_session()
+    with _lock:
+        if service not in _clients:
+            config = Config(connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                            max_pool_connections=POOL_SIZE, retries={"max_attempts": RETRIES + 1, "mode": "standard"})
+            _clients[service] = session.client(service, config=config)
+        return _clients[service]
+
+
+def get_bedrock_client():
+    """
+    Returns the long-lived Anthropic Bedrock client, creating it on first use. Without explicit keys it signs every
+    request with the current credentials of the default chain, so it outlives temporary credentials.
+
+    Returns:
+        anthropic.AnthropicBedrock: The client.
+    """
+    global _bedrock
+    from anthropic import AnthropicBedrock  # Only bedrockAnalysis needs anthropic
+
+    region = get_session().region_name
+    with _lock:
+        if _bedrock is None:
+            _bedrock = AnthropicBedrock(aws_region=region, timeout=READ_TIMEOUT * 4, max_retries=RETRIES)
+        return _bedrock
+
+
+def get_http_session():
+    """
+    Returns:
+        requests.Session: The HTTP session shared by every refresh cycle, keeping its connections alive and
+        retrying connection errors.
+    """
+    global _http
+    with _lock:
+        if _http is None:
+            _http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRIES)
+            _http.mount("https://", adapter)
+            _http.mount("http://", adapter)
+        return _http
+
+
+def http_get(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs):
+    """
+    GETs a URL on the shared HTTP session.
+
+    Args:
+        url (str): The URL.
+        timeout (tuple): Seconds to wait for the connection and for the response.
+        **kwargs: Passed on to requests.Session.get.
+
+    Returns:
+        requests.Response: The response.
+    """
+    return get_http_session().get(url, timeout=timeout, **kwargs)
@@ -0,0 +1,104 @@
+import bisect
+
+import numpy as np
+
+# Amateur band segments per IARU region, as (band in meters, lower edge kHz, upper edge kHz). Edges are inclusive.
+BAND_PLANS = {
+    'region1': [
+        (160, 1810, 2000), (80, 3500, 3800), (60, 5351.5, 5366.5), (40, 7000, 7200), (30, 10100, 10150),
+        (20, 14000, 14350), (17, 18068, 18168), (15, 21000, 21450), (12, 24890, 24990), (10, 28000, 29700),
+        (6, 50000, 52000), (4, 70000, 70500), (2, 144000, 146000),
+    ],
+    'region2': [
+        (160, 1800, 2000), (80, 3500, 4000), (60, 5330.5, 5406.5), (40, 7000, 7300), (30, 10100, 10150),
+        (20, 14000, 14350), (17, 18068, 18168), (15, 21000, 21450), (12, 24890, 24990), (10, 28000, 29700),
+        (6, 50000, 54000), (2, 144000, 148000),
+    ],
+    'region3': [
+        (160, 1800, 2000), (80, 3500, 3900), (60, 5351.5, 5366.5), (40, 7000, 7300), (30, 10100, 10150),
+        (20, 14000, 14350), (17, 18068, 18168), (15, 21000, 21450), (12, 24890, 24990), (10, 28000, 29700),
+        (6, 50000, 54000), (2, 144000, 148000),
+    ],
+}
+
+# Every band of any region, longest wavelength first
+ALL_BANDS = sorted({segment[0] for segments in BAND_PLANS.values() for segment in segments}, reverse=True)
+
+# Band plan used when none is configured
+DEFAULT_PLAN = 'region2'
+
+# Bands shown in the zone table, contest bands first, then the WARC bands after a spacer column
+CONTEST_BANDS = [160, 80, 40, 20, 15, 10, 6]
+WARC_BANDS = [30, 17, 12]
+
+
+class BandPlan:
+    """
+    Maps frequencies to ham radio bands using sorted band edge arrays.
+
+    Scalar lookups bisect the lower edges; batch lookups classify a whole array of frequencies at once with
+    NumPy ``searchsorted``.
+    """
+
+    def __init__(self, segments):
+        """
+        Args:
+            segments (list): (band, lower edge kHz, upper edge kHz) tuples. Segments must not overlap.
+        """
+        segments = sorted(segments, key=lambda segment: segment[1])
+        for previous, segment in zip(segments, segments[1:]):
+            if segment[1] <= previous[2]:
+                raise ValueError(f"Band segments {previous} and {segment} overlap")
+        self.bands = [segment[0] for segment in segments]
+        self.lows = [segment[1] for segment in segments]
+        self.highs = [segment[2] for segment in segments]
+        self.band_array = np.array(self.bands, dtype=np.int16)
+        self.low_array = np.array(self.lows, dtype=np.float64)
+        self.high_array = np.array(self.highs, dtype=np.float64)
+
+    def band(self, freq):
+        """
+        Calculate the ham radio band based on the frequency.
+
+        Args:
+            freq (float): The frequency in kilohertz (kHz).
+
+        Returns:
+            int or None: Band number corresponding to the frequency, or None if outside known bands.
+        """
+        i = bisect.bisect_right(self.lows, freq) - 1
+        if i >= 0 and freq <= self.highs[i]:
+            return self.bands[i]
+        return None
+
+    def bands_for(self, freqs):
+        """
+        Calculate the ham radio band of every frequency in an array.
+
+        Args:
+            freqs (array_like): Frequencies in kilohertz (kHz).
+
+        Returns:
+            numpy.ndarray: Band numbers, with 0 for frequencies outside known bands.
+        """
+        freqs = np.asarray(freqs, dtype=np.float64)
+        i = np.searchsorted(self.low_array, freqs, side='right') - 1
+        clipped = i.clip(0)
+        inside = (i >= 0) & (freqs <= self.high_array[clipped])
+        return np.where(inside, self.band_array[clipped], 0)
+
+
+def get_band_plan(name=DEFAULT_PLAN):
+    """
+    Builds the band plan of an IARU region.
+
+    Args:
+        name (str): One of the keys of BAND_PLANS.
+
+    Returns:
+        BandPlan: The band plan.
+    """
+    try:
+        return BandPlan(BAND_PLANS[name])
+    except KeyError:
+        raise ValueError(f"Unknown band plan {name!r}, expected one of {', '.join(BAND_PLANS)}")
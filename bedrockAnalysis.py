@@ -2,35 +2,38 @@ import time
 import datetime as dt
 from datetime import datetime, timedelta, date
 import argparse
-import boto3
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
-import requests
-import xml.etree.ElementTree as ET
-from anthropic import AnthropicBedrock
 from astral import LocationInfo
 from astral.sun import sun
-import re
 import json
-from collections import OrderedDict
+from forecastClient import ForecastClient, ForecastError, cache_key
+from forecastStore import STORES, open_store
+from solarData import SolarProvider
 
 parser = argparse.ArgumentParser()  # argument parser
 parser.add_argument("-f", "--frequency", help="Specify how often data is collected (in minutes). Default = 60",
                     type=float, default=60)
 parser.add_argument("-m", "--maidenhead", type=str, default="FN05GK",
                     help="Specify the Maidenhead Grid Locator you'd like to track conditions at. Default = FN05GK")
+parser.add_argument("--forecast-store", choices=STORES, default="file",
+                    help="Specify where the forecast is stored for analyzeData.py: 'file' is bedrock.json and "
+                         "'sqlite' the database, both on this host; 's3' is bedrock.json in the S3 bucket. "
+                         "Default = file")
 args = parser.parse_args()
 maidenhead_grid_locator = args.maidenhead
 frequency = args.frequency
+forecast_store = args.forecast_store
+solar_provider = SolarProvider()  # cache of the solar data, shared with analyzeData through its file
+forecast_client = ForecastClient()  # reuses the forecast of the same conditions instead of calling the model
 
 
-def call_bedrock(current_data):
+def call_bedrock(current_data, key=None):
     """
-    Makes an API call to AWS Bedrock.
+    Asks the model on AWS Bedrock for the band forecast, unless one was made for the same conditions recently.
 
-    :param access_key: AWS Access Key ID.
-    :param secret_key: AWS Secret Access Key.
     :param current_data: Solar data to provide to model.
-    :return: json containing data.
+    :param key: The cache key of the conditions, as returned by forecastClient.cache_key. Not cached if None.
+    :return: The validated forecast, Summary first and then a Rating and Explanation per band group.
+    :raises ForecastError: If the model gave no valid forecast.
     """
     xml_request = f"""
     <persona>:"You are a professional shortwave propagation prediction expert. Your writing style is clear, concise, and highly actionable."
@@ -48,14 +51,6 @@ def call_bedrock(current_data):
        <Good>: "Propagation is generally reliable, but conditions are not ideal or changing. Regional and DX contacts are feasible, though signals may experience occasional fading, distortion, or degradation. Good for moderate-distance contacts; DX is possible, but paths may be somewhat variable depending on geomagnetic conditions"
        <Excellent>: "Propagation is strong and stable. Ideal for long-distance (DX) communication. Signals are clear, with minimal fading or noise. Consistent openings for regional and global contacts, offering reliable communication across a wide range of distances and paths"
     </rating criteria>
-    <JSON output format>
-       <Summary>:200 word summary of current solar and geomagnetic conditions and their impact on short wave propagation
-       <Low_Bands>:one word rating+":" + propagation prediction
-       <Medium_Bands>:one word rating+":" + propagation prediction
-       <Upper_Bands>:one word rating+":" + propagation prediction
-       <High_Bands>:one word rating+":" + propagation prediction
-       <Magic_Band>:one word rating+":" + propagation prediction
-    </JSON output format>
     <task>:”For each band group, create a single word rating using the rating criteria and propagation prediction for the next 2 to 8 hours in the JSON output format. Consider seasonal, daytime, nighttime, dusk, and dawn differences. Consider east-west, cross-equatorial, and polar paths. Consider CW, SSB, and FT8/FT modes. Consider both regional and DX contacts impact. Be specific with distances and regions (East Coast of USA and Canada, West Coast of USA and Canada, Southern Canada and Midwest, Southern USA and Mexico, Central America, Caribbean, South America, Eastern Europe, Central Europe, Western Europe, Northern Europe, Africa, Middle East, Asia, Australia and New Zealand, Pacific Islands). Use the following station, space weather, and geomagnetic data.”
     <station data>
        <Maidenhead_grid_locator>:{maidenhead_grid_locator}
@@ -66,79 +61,7 @@ def call_bedrock(current_data):
     {current_data}
     """
 
-    session = boto3.Session()
-    credentials = session.get_credentials().get_frozen_credentials()
-
-    client = AnthropicBedrock(
-        aws_access_key=credentials.access_key,
-        aws_secret_key=credentials.secret_key,
-        aws_session_token=credentials.token,
-        aws_region=session.region_name
-    )
-
-    message = client.messages.create(
-        model="us.anthropic.claude-3-5-sonnet-20240620-v1:0",
-        messages=[{"role": "user", "content": f"{xml_request}"}],
-        temperature=0.1,
-        max_tokens=1500
-    )
-
-    output = message.content[0].text
-
-    # Updated regex pattern
-    pattern = r'"(?P<band>Summary|[A-Za-z_]+)":\s*"(?P<rating>Good|Excellent|Fair|Poor)?:?\s*(?P<explanation>.+?)"(?=\s*[,}])'
-    # Use re.finditer to find all matches in the output text
-    matches = re.finditer(pattern, output, re.DOTALL)
-
-    # Parse the matches into the desired dictionary structure
-    parsed_data = OrderedDict()
-
-    for match in matches:
-        band = match.group("band")
-        rating = match.group("rating") or ""
-        explanation = match.group("explanation").strip()
-
-        if rating:
-            parsed_data[band] = {
-                "Rating": rating,
-                "Explanation": explanation
-            }
-        else:
-            # Handle "Summary" which has no rating
-            parsed_data[band] = explanation
-
-    # Convert to JSON string
-    json_output = json.dumps(parsed_data, indent=4)
-
-    return json_output
-
-
-def upload_to_s3(file_name, bucket_name):
-    session = boto3.Session()
-    credentials = session.get_credentials().get_frozen_credentials()
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=credentials.access_key,
-        aws_secret_access_key=credentials.secret_key,
-        aws_session_token=credentials.token
-    )
-    obj_name = 'bedrock.json'
-
-    try:
-        s3_client.upload_file(file_name, bucket_name, obj_name, ExtraArgs={'ContentType':'application/json; charset=utf-8'})
-        print(f"File {file_name} uploaded successfully to {bucket_name}/{obj_name}")
-        return True
-    except FileNotFoundError:
-        print(f"The file {file_name} was not found")
-    except NoCredentialsError:
-        print("Credentials not available")
-    except PartialCredentialsError:
-        print("Incomplete credentials provided")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    return False
-
-
+    return forecast_client.forecast(xml_request, key)
 
 
 def location_sunrise_sunset(grid, input_date):
@@ -183,11 +106,12 @@ def location_sunrise_sunset(grid, input_date):
     }
 
 
-def run(s3_bucket):
-    # fetch solar widget XML data.
-    solar_response = requests.get("https://www.hamqsl.com/solarxml.php")
-    xml_data = solar_response.content
-    root = ET.fromstring(xml_data)
+def run(store):
+    # solar widget data, revalidated now since the hourly runs always find the shared cache stale.
+    solar = solar_provider.get(block=True)
+    if solar is None:
+        print("Solar data unavailable, skipping this run")
+        return
 
     today = date.today()
     tomorrow = today + timedelta(days=1)
@@ -196,16 +120,16 @@ def run(s3_bucket):
     now = dt.datetime.now(dt.timezone.utc).strftime("%b %d, %Y %H:%M")
 
     solar_data_bedrock_adjusted = {
-        "SFI": root.findtext("solardata/solarflux"),
-        "Sunspots": root.findtext("solardata/sunspots"),
-        "K-Index": root.findtext("solardata/kindex"),
-        "X-Ray": root.findtext("solardata/xray"),
-        "Aurora Latitude": root.findtext("solardata/latdegree"),
-        "Helium Line": root.findtext("solardata/heliumline"),
-        "Proton Flux": root.findtext("solardata/protonflux"),
-        "Electron Flux": root.findtext("solardata/electonflux"),
-        "Solar Wind": root.findtext("solardata/solarwind"),
-        "Bz": root.findtext("solardata/magneticfield"),
+        "SFI": solar.sfi,
+        "Sunspots": solar.sunspots,
+        "K-Index": solar.k_index,
+        "X-Ray": solar.xray,
+        "Aurora Latitude": solar.aurora_latitude,
+        "Helium Line": solar.helium_line,
+        "Proton Flux": solar.proton_flux,
+        "Electron Flux": solar.electron_flux,
+        "Solar Wind": solar.solar_wind,
+        "Bz": solar.bz,
         "Date and Time": (now + " UTC"),
         "Latitude": loc_rise_set.get('latitude'),
         "Longitude": loc_rise_set.get('longitude'),
@@ -225,18 +149,23 @@ def run(s3_bucket):
         xml_current_data += f"   <{key}>{value}</{key}>\n"
     xml_current_data += "</current_data>"
 
-    json_file = call_bedrock(xml_current_data)
-
-    with open("bedrock.json", "w", encoding="utf-8") as file:
-        file.write(json_file)
+    key = cache_key(solar.sfi, solar.k_index, solar.sunspots, dt.datetime.now(dt.timezone.utc),
+                    maidenhead_grid_locator)
+    try:
+        forecast = call_bedrock(xml_current_data, key)
+    except ForecastError as e:
+        print(f"No forecast this run, keeping the last one: {e}")
+        return
 
-    upload_to_s3("bedrock.json", s3_bucket)
+    store.save(json.dumps(forecast, indent=4))  # analyzeData.py reloads the forecast when it sees the new version
+    print(f"Forecast stored in the {forecast_store} store")
 
 
 if __name__ == '__main__':
     time_to_wait = frequency * 60  # time to wait in between re-running program
 
-    s3_bucket = input("Enter the name of the S3 Bucket you'd like to write to: ")
+    s3_bucket = input("Enter the name of the S3 Bucket you'd like to write to: ") if forecast_store == "s3" else None
+    store = open_store(forecast_store, s3_bucket)
     while True:
-        run(s3_bucket)
+        run(store)
         time.sleep(time_to_wait)
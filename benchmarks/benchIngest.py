@@ -0,0 +1,127 @@
+"""
+End-to-end ingest benchmark: replays a capture from a local ReplayServer into the processData ingester and
+reports spots ingested per second, database commit latency, writer queue depth and drops, and reconnects.
+
+At a paced --speed, the server keeps its timeline while the ingester reconnects and the reads due meanwhile are
+lost, as on a live cluster; records_missed counts them. spots_written is then short of the capture by design, and
+spots_per_sec is bounded by the capture's own rate. At --speed 0 nothing is missed, the server waits for the
+reconnect instead.
+
+Run from the repository root: python3 -m benchmarks.benchIngest [--capture FILE] [--speed 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import processData
+from bandPlan import get_band_plan
+from dxReplay import ReplayServer, read_capture
+from spotParser import SpotParser
+from spotWriter import DEFAULT_QUEUE_SIZE, QUEUE_POLICIES, SpotWriter
+from benchmarks.spotGenerator import generate_capture, synthetic_cty_index
+
+
+async def bench(records, spotters, cty_index, db_file, speed=0, queue_size=DEFAULT_QUEUE_SIZE,
+                queue_policy='block', **faults):
+    """
+    Replays the records into the ingester until the whole capture has been sent and stored.
+
+    Args:
+        records (list): (seconds since start, bytes) records, as returned by read_capture.
+        spotters (list): Spotters to track.
+        cty_index (CtyIndex): Prefix index used to resolve CQ zones.
+        db_file (str): SQLite database file the spots are written to.
+        speed (float): Replay speed factor; 0 replays as fast as the ingester reads.
+        queue_size (int): Maximum number of entries waiting for the database writer.
+        queue_policy (str): What to do when the writer queue is full, one of QUEUE_POLICIES.
+        **faults: Fault injection options passed to ReplayServer.
+
+    Returns:
+        dict: Throughput, commit latency, queue and reconnect figures.
+    """
+    server = ReplayServer(records, speed=speed, **faults)
+    port = await server.start('127.0.0.1', 0)
+
+    writer = SpotWriter(db_file, queue_size=queue_size, policy=queue_policy)
+    writer.start()
+    parser = SpotParser(spotters)
+    cluster_task = asyncio.create_task(processData.follow_cluster(
+        '127.0.0.1', port, parser, cty_index, get_band_plan(), writer, initial_backoff=0.05, max_backoff=0.05))
+
+    started = time.perf_counter()
+    await server.replay()
+    await server.close()
+    cluster_task.cancel()
+    await asyncio.gather(cluster_task, return_exceptions=True)
+    await asyncio.to_thread(writer.close)
+    elapsed = time.perf_counter() - started
+
+    stats = writer.stats()
+    return {
+        "bytes": server.bytes_sent,
+        "spots_written": writer.spots_written,
+        "seconds": elapsed,
+        "spots_per_sec": writer.spots_written / elapsed,
+        "commits": writer.commit_count,
+        "mean_commit_ms": stats["mean_commit_ms"],
+        "max_commit_ms": stats["max_commit_ms"],
+        "max_queue_depth": writer.max_queue_depth,
+        "dropped": writer.dropped,
+        "connections": server.connections,
+        "injected_disconnects": server.disconnects,
+        "records_missed": server.records_missed,
+    }
+
+
+def run(records, spotters=('VE3EID',), cty_index=None, speed=0, queue_size=DEFAULT_QUEUE_SIZE, queue_policy='block',
+        **faults):
+    """
+    Runs the benchmark against a throwaway database.
+
+    Args:
+        records (list): (seconds since start, bytes) records.
+        spotters (tuple): Spotters to track.
+        cty_index (CtyIndex): Prefix index. A synthetic one is used if not given.
+        speed (float): Replay speed factor; 0 replays as fast as the ingester reads.
+        queue_size (int): Maximum number of entries waiting for the database writer.
+        queue_policy (str): What to do when the writer queue is full, one of QUEUE_POLICIES.
+        **faults: Fault injection options passed to ReplayServer.
+
+    Returns:
+        dict: Throughput, commit latency, queue and reconnect figures.
+    """
+    cty_index = cty_index or synthetic_cty_index()
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(bench(records, list(spotters), cty_index, os.path.join(directory, 'callsigns.db'),
+                                 speed, queue_size, queue_policy, **faults))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark ingestion end to end against a replayed DX Cluster.")
+    parser.add_argument("-c", "--capture", help="Capture to replay. Synthetic if not given")
+    parser.add_argument("-n", "--lines", help="Number of synthetic lines. Default = 200000", type=int,
+                        default=200000)
+    parser.add_argument("-s", "--spotter", help="Spotter to track. Default = VE3EID", default="VE3EID")
+    parser.add_argument("-x", "--speed", help="Replay speed factor, 0 for as fast as possible. Default = 0",
+                        type=float, default=0)
+    parser.add_argument("--queue-size", help=f"Writer queue bound. Default = {DEFAULT_QUEUE_SIZE}", type=int,
+                        default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--queue-policy", help="Writer queue policy. Default = block", choices=QUEUE_POLICIES,
+                        default="block")
+    parser.add_argument("--disconnect-every", help="Drop the connection every this many seconds", type=float)
+    parser.add_argument("--partial-lines", help="Split reads at random positions", action="store_true")
+    parser.add_argument("--garbage-rate", help="Probability per read of inserting invalid bytes", type=float,
+                        default=0.0)
+    args = parser.parse_args()
+
+    if args.capture:
+        capture = read_capture(args.capture)
+    else:
+        capture = generate_capture(args.lines, spotters=(args.spotter, 'W3LPL', 'K1TTT'))
+
+    print(json.dumps(run(capture, (args.spotter,), speed=args.speed, queue_size=args.queue_size,
+                         queue_policy=args.queue_policy, disconnect_every=args.disconnect_every,
+                         partial_lines=args.partial_lines, garbage_rate=args.garbage_rate), indent=4))
@@ -0,0 +1,170 @@
+"""
+Micro-benchmark of the DX Cluster receive path: the original string-based framing, substring prefilter and
+unanchored DX_PATTERN.search, against LineFramer + SpotParser, on a recorded or synthetic corpus.
+
+Run from the repository root: python3 -m benchmarks.benchParser [--corpus FILE]
+"""
+import argparse
+import json
+import re
+import time
+
+from lineFramer import LineFramer
+from spotParser import SpotParser
+from benchmarks.spotGenerator import generate_stream
+
+# Pattern used by processData before SpotParser existed
+LEGACY_PATTERN = re.compile(r'(\d+\.\d{1,2})\s+([A-Z0-9/]+)\s+([+-]?\s?\d{1,2})\s*dB\s+\d+\s+(?:FT8|FT4|CW)')
+
+# Bytes returned by each socket read in the original receive path
+LEGACY_READ_SIZE = 1024
+
+# Line shapes the unanchored DX_PATTERN.search accepted that the synthetic corpus doesn't hold: a control byte such
+# as BEL before "DX de", and tab-separated fields
+EDGE_LINES = (
+    b"\x07DX de {spotter}-#:  14074.0  K1ABC        -12 dB  0 FT8  CQ  1842Z\r\n"
+    b"\x00\x07DX de {spotter}-#:   7074.0  W1AW          5 dB  0 FT8  CQ  1842Z\r\n"
+    b"DX de {spotter}-#:\t21074.0\tVE3ABC\t-7 dB\t0 FT4  CQ  1842Z\r\n"
+    b"\x07DX de {spotter}-#:\t28074.0\tJA1XYZ\t+3\tdB\t0 FT8  CQ  1842Z\r\n"
+)
+
+
+def chunked(data, size):
+    """
+    Splits a stream into the chunks a socket read would return.
+
+    Args:
+        data (bytes): The raw stream.
+        size (int): Bytes per read.
+
+    Returns:
+        list: The chunks.
+    """
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def legacy_path(chunks, spotter):
+    """
+    The original receive path: decode each chunk, append to a string buffer, split, filter, search.
+
+    Args:
+        chunks (list): Chunks returned by the socket reads.
+        spotter (str): Spotter to track.
+
+    Returns:
+        list: (frequency, call_sign, snr) of every accepted spot.
+    """
+    spots = []
+    buffer = ""
+    for chunk in chunks:
+        try:
+            data = chunk.decode()
+        except UnicodeDecodeError:
+            continue
+        buffer += data
+        lines = buffer.split('\n')
+        buffer = lines[-1]
+        for line in lines[:-1]:
+            spotter_string = spotter + "-#:"
+            if ((" FT4 " in line) or (" FT8 " in line)) and spotter_string in line:
+                match = LEGACY_PATTERN.search(line)
+                if match:
+                    spots.append((float(match.group(1)), match.group(2), int(match.group(3).replace(" ", ""))))
+    return spots
+
+
+def framed_path(chunks, spotter, modes=('FT8', 'FT4')):
+    """
+    The current receive path: recv_into a LineFramer, scan each block of complete lines once with SpotParser.
+
+    Args:
+        chunks (list): Chunks returned by the socket reads.
+        spotter (str): Spotter to track.
+        modes (tuple): Modes to accept.
+
+    Returns:
+        list: (frequency, call_sign, snr) of every accepted spot.
+    """
+    spots = []
+    framer = LineFramer()
+    parse = SpotParser([spotter], modes).parse
+    buffer = framer.buffer
+    for chunk in chunks:
+        view = framer.reserve()
+        view[:len(chunk)] = chunk
+        framer.commit(len(chunk))
+        start, end = framer.complete_lines()
+        for spot in parse(buffer, start, end):
+            spots.append((spot.frequency, spot.call_sign, spot.snr))
+    return spots
+
+
+def best_of(function, repeat, *args):
+    """
+    Times a function and keeps the fastest of several runs.
+
+    Args:
+        function (callable): Function to time.
+        repeat (int): Number of runs.
+        *args: Arguments passed to the function.
+
+    Returns:
+        tuple: (fastest run in seconds, result of the last run).
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(data, spotter='VE3EID', repeat=5):
+    """
+    Benchmarks both receive paths on the same stream and checks that they accept the same spots.
+
+    Args:
+        data (bytes): The raw stream.
+        spotter (str): Spotter to track.
+        repeat (int): Number of runs of each path; the fastest is reported.
+
+    Returns:
+        dict: Lines in the corpus, lines per second of each path, speedup, and whether the outputs match, on the
+        corpus and on EDGE_LINES.
+    """
+    edge_lines = b'\n' + EDGE_LINES.replace(b'{spotter}', spotter.encode('ascii'))
+    edge_legacy = legacy_path(chunked(edge_lines, LEGACY_READ_SIZE), spotter)
+    edge_framed = framed_path(chunked(edge_lines, 65536), spotter)
+
+    line_count = data.count(b'\n')
+    legacy_time, legacy_spots = best_of(legacy_path, repeat, chunked(data, LEGACY_READ_SIZE), spotter)
+    framed_time, framed_spots = best_of(framed_path, repeat, chunked(data, 65536), spotter)
+    return {
+        "lines": line_count,
+        "spots": len(framed_spots),
+        "legacy_lines_per_sec": line_count / legacy_time,
+        "framed_lines_per_sec": line_count / framed_time,
+        "speedup": legacy_time / framed_time,
+        "outputs_match": legacy_spots == framed_spots,
+        "edge_spots": len(edge_framed),
+        "edge_outputs_match": edge_legacy == edge_framed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the DX Cluster line parser.")
+    parser.add_argument("-c", "--corpus", help="Raw DX Cluster stream to replay. Synthetic if not given")
+    parser.add_argument("-n", "--lines", help="Number of synthetic lines. Default = 200000", type=int,
+                        default=200000)
+    parser.add_argument("-s", "--spotter", help="Spotter to track. Default = VE3EID", default="VE3EID")
+    parser.add_argument("-r", "--repeat", help="Runs of each path. Default = 5", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, 'rb') as infile:
+            corpus = infile.read()
+    else:
+        corpus = generate_stream(args.lines, spotters=(args.spotter, 'W3LPL', 'K1TTT'))
+
+    print(json.dumps(run(corpus, args.spotter, args.repeat), indent=4))
@@ -0,0 +1,425 @@
+"""
+Benchmark suite for the hot paths of the pipeline: line parsing, CQ zone and band lookups, database writes and
+history compaction, analyzeData's zone tables, its pandas, sql and incremental backends and the template page
+render.
+
+The stream stages are measured once on a synthetic stream. The storage, analysis and rendering stages are
+measured for each spot rate profile, a normal evening and 10x and 100x contest weekend rates, with the table
+holding one analysis window of spots at that rate. Results are written as JSON, so a run can be saved per
+commit and compared against a baseline to catch regressions.
+
+Run from the repository root: python3 -m benchmarks.benchSuite [-o results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import dbSchema
+import processData
+import spotHistory
+import spotWriter
+from bandPlan import get_band_plan
+from ctyIndex import load_index
+from zoneAggregator import ZoneAggregator
+from benchmarks.benchParser import best_of, chunked, framed_path
+from benchmarks.spotGenerator import (CONTEST_RATES, DIGITAL_FREQUENCIES, CW_FREQUENCIES, REALISTIC_RATE,
+                                      generate_spot_frame, generate_stream, random_call_sign, synthetic_cty_index)
+
+# Spot rate profiles (spots per second)
+RATE_PROFILES = {'realistic': REALISTIC_RATE, **CONTEST_RATES}
+
+# Seconds of spots analyzeData works on, matching the default retention of raw spots
+WINDOW = spotHistory.RAW_RETENTION
+
+# Solar data used for the render benchmark, so it runs offline
+SOLAR_DATA = {"SFI": "172", "Sunspots": "116", "A-Index": "5", "K-Index": "1", "X-Ray": "C1.0",
+              "Signal_Noise": "S1-S2", "Aurora": "1", "Lat.": "66.5"}
+
+
+def import_analyze_data():
+    """
+    Imports analyzeData, which parses the command line at import time, without handing it our arguments.
+
+    Returns:
+        module: The analyzeData module.
+    """
+    argv = sys.argv
+    sys.argv = argv[:1]
+    try:
+        import analyzeData
+    finally:
+        sys.argv = argv
+    return analyzeData
+
+
+def timing(seconds, items):
+    """
+    Formats the result of one stage.
+
+    Args:
+        seconds (float): Fastest run of the stage.
+        items (int): Items processed per run.
+
+    Returns:
+        dict: Items, seconds and items per second.
+    """
+    return {"items": items, "seconds": seconds, "per_sec": items / seconds if seconds else 0.0}
+
+
+def bench_parse(stream, spotter, repeat):
+    """
+    Times LineFramer + SpotParser over a stream delivered in socket-sized reads.
+
+    Returns:
+        dict: Lines, seconds and lines per second.
+    """
+    seconds, _ = best_of(framed_path, repeat, chunked(stream, 65536), spotter)
+    return timing(seconds, stream.count(b'\n'))
+
+
+def bench_cty_lookup(cty_index, call_signs, repeat):
+    """
+    Times get_cq_zone, once against an empty cache and once against a warm one.
+
+    Returns:
+        dict: Lookups, seconds and lookups per second of the cold and warm passes.
+    """
+    def lookups():
+        for call_sign in call_signs:
+            processData.get_cq_zone(call_sign, cty_index)
+
+    def cold():
+        cty_index.clear_cache()
+        lookups()
+
+    cold_seconds, _ = best_of(cold, repeat)
+    warm_seconds, _ = best_of(lookups, repeat)
+    return {"cold": timing(cold_seconds, len(call_signs)), "warm": timing(warm_seconds, len(call_signs))}
+
+
+def bench_band(band_plan, frequencies, repeat):
+    """
+    Times calculate_band.
+
+    Returns:
+        dict: Lookups, seconds and lookups per second.
+    """
+    def bands():
+        for frequency in frequencies:
+            processData.calculate_band(frequency, band_plan)
+
+    seconds, _ = best_of(bands, repeat)
+    return timing(seconds, len(frequencies))
+
+
+def spot_entries(rng, timestamps):
+    """
+    Builds writer entries for synthetic spots.
+
+    Args:
+        rng (random.Random): Random number generator.
+        timestamps (iterable): Unix time of every spot.
+
+    Returns:
+        list: (zone, band, snr, timestamp, spotter, mode) entries.
+    """
+    bands = [160, 80, 40, 30, 20, 17, 15, 12, 10, 6]
+    modes = ['FT8', 'FT8', 'FT8', 'FT4', 'CW']
+    return [(rng.randint(1, 40), rng.choice(bands), rng.randint(-24, 12), timestamp, 'VE3EID', rng.choice(modes))
+            for timestamp in timestamps]
+
+
+def fill_window(directory, name, rate, rng, now):
+    """
+    Creates a database holding one window of spots at the rate, ending now.
+
+    Returns:
+        tuple: Connection and cursor objects.
+    """
+    conn, cursor = dbSchema.setup_database(os.path.join(directory, f"bench-{name}.db"))
+    count = rate * WINDOW
+    spotWriter.insert_batch(cursor, spot_entries(rng, (now - WINDOW + i * WINDOW // count for i in range(count))))
+    conn.commit()
+    return conn, cursor
+
+
+def bench_db_write(directory, rate, batches, batch_size, seed):
+    """
+    Times the writer's insert_batch + commit against a table holding one window of spots at the rate.
+
+    Returns:
+        dict: Spots written, seconds, spots per second and the latency of the batches.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    conn, cursor = fill_window(directory, f"write-{rate}", rate, rng, now)
+
+    latencies = []
+    for _ in range(batches):
+        callsign_entries = spot_entries(rng, [now] * batch_size)
+        started = time.perf_counter()
+        spotWriter.insert_batch(cursor, callsign_entries)
+        conn.commit()
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+    result = timing(sum(latencies), batches * batch_size)
+    result.update({"mean_batch_ms": sum(latencies) / batches * 1000, "max_batch_ms": max(latencies) * 1000})
+    return result
+
+
+def bench_compaction(directory, rate, seed):
+    """
+    Times a steady state compaction pass: one compaction interval of new spots rolled up into the history
+    while the spots that left the raw window expire.
+
+    Returns:
+        dict: Spots rolled up, seconds, spots per second and the raw spots expired.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    conn, cursor = fill_window(directory, f"compact-{rate}", rate, rng, now)
+    spotHistory.compact(conn, now)  # Catch up, as after a restart
+
+    interval = spotHistory.COMPACT_INTERVAL
+    count = rate * interval
+    spotWriter.insert_batch(cursor, spot_entries(rng, (now + i * interval // count for i in range(count))))
+    conn.commit()
+    started = time.perf_counter()
+    result = spotHistory.compact(conn, now + interval)
+    seconds = time.perf_counter() - started
+    conn.close()
+
+    stats = timing(seconds, count)
+    stats["raw_deleted"] = result["raw_deleted"]
+    return stats
+
+
+def bench_tables(analyze_data, df, repeat):
+    """
+    Times analyzeData's zone grid of the spots and its count, mean, slope and CW count tables.
+
+    Returns:
+        tuple: (result dict, the tables of the last run).
+    """
+    seconds, tables = best_of(lambda: analyze_data.build_tables(analyze_data.build_grid(df)), repeat)
+    return timing(seconds, len(df)), tables
+
+
+def bench_incremental(directory, rate, seed):
+    """
+    Times a steady state refresh of the incremental aggregator: one minute of new spots read past the
+    high-water mark, then the zone x band grid of the window.
+
+    Returns:
+        dict: New spots read, seconds, spots per second and the seconds of the grid alone.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    conn, cursor = fill_window(directory, f"incremental-{rate}", rate, rng, now)
+    aggregator = ZoneAggregator(WINDOW)
+    aggregator.refresh(conn, now)  # The first refresh reads the whole window
+
+    interval = 60
+    count = rate * interval
+    spotWriter.insert_batch(cursor, spot_entries(rng, (now + i * interval // count for i in range(count))))
+    conn.commit()
+    started = time.perf_counter()
+    aggregator.refresh(conn, now + interval)
+    refreshed = time.perf_counter()
+    aggregator.grid(now + interval)
+    finished = time.perf_counter()
+    conn.close()
+
+    result = timing(finished - started, count)
+    result["grid_seconds"] = finished - refreshed
+    return result
+
+
+def bench_backends(analyze_data, directory, rate, seed, repeat):
+    """
+    Times the zone grid of one window of spots read from the database by the pandas and sql backends of
+    analyzeData: every spot read into a dataframe and aggregated in Python, against one GROUP BY query.
+
+    Returns:
+        dict: Timing of each backend, per spot of the window.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    conn, _ = fill_window(directory, f"backends-{rate}", rate, rng, now)
+    conn.close()
+    db_file = os.path.join(directory, f"bench-backends-{rate}.db")
+    since = now - WINDOW
+
+    pandas_seconds, _ = best_of(lambda: analyze_data.build_grid(analyze_data.read_spots(db_file, since)), repeat)
+    sql_seconds, _ = best_of(analyze_data.read_grids, repeat, db_file, [since])
+    count = rate * WINDOW
+    return {"pandas": timing(pandas_seconds, count), "sql": timing(sql_seconds, count)}
+
+
+def bench_render(analyze_data, tables, bedrock_data, repeat):
+    """
+    Times the template render of the zone table and the assembly of the page into its prerendered shell.
+
+    Returns:
+        dict: Seconds of the table render, of the page build, and page size.
+    """
+    count_table, mean_table, _, cw_table = tables
+    caption = "Last 15-min data - VE3EID - benchmark GMT"
+    table_seconds, table_html = best_of(analyze_data.render_table, repeat, count_table.copy(), mean_table, caption,
+                                        cw_table)
+
+    solar_html = analyze_data.build_solar_html(SOLAR_DATA, bedrock_data)
+    page_seconds, page = best_of(analyze_data.build_page, repeat, table_html, solar_html)
+    return {"table_seconds": table_seconds, "page_seconds": page_seconds, "seconds": table_seconds + page_seconds,
+            "page_bytes": len(page.encode('utf-8'))}
+
+
+def git_commit():
+    """
+    Returns:
+        str or None: Hash of the checked out commit, if run from a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(lines=200000, profiles=tuple(RATE_PROFILES), repeat=3, batches=20, batch_size=500, cty_plist=None,
+        seed=0):
+    """
+    Runs every stage and collects the results.
+
+    Args:
+        lines (int): Lines in the synthetic stream used by the stream stages.
+        profiles (tuple): Names of the rate profiles to run the storage, analysis and render stages for.
+        repeat (int): Runs of each stage; the fastest is reported.
+        batches (int): Database batches written per profile.
+        batch_size (int): Entries per database batch.
+        cty_plist (str): cty.plist to resolve zones with. A synthetic index is used if not given.
+        seed (int): Seed of the random number generators.
+
+    Returns:
+        dict: Run metadata and the results of every stage.
+    """
+    analyze_data = import_analyze_data()
+    cty_index = load_index(cty_plist) if cty_plist else synthetic_cty_index()
+    band_plan = get_band_plan()
+    rng = random.Random(seed)
+    with open('bedrock.json', encoding='utf-8') as infile:
+        bedrock_data = json.load(infile)
+
+    call_signs = [random_call_sign(rng) for _ in range(lines // 2)]
+    frequencies = [rng.choice(DIGITAL_FREQUENCIES + CW_FREQUENCIES) for _ in range(lines // 2)]
+    results = {
+        "parse": bench_parse(generate_stream(lines, spotters=('VE3EID', 'W3LPL', 'K1TTT'), seed=seed), 'VE3EID',
+                             repeat),
+        "cty_lookup": bench_cty_lookup(cty_index, call_signs, repeat),
+        "calculate_band": bench_band(band_plan, frequencies, repeat),
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in profiles:
+            rate = RATE_PROFILES[name]
+            df = generate_spot_frame(rate * WINDOW, WINDOW, seed=seed)
+            tables_result, tables = bench_tables(analyze_data, df, repeat)
+            results[name] = {
+                "rate": rate,
+                "db_write": bench_db_write(directory, rate, batches, batch_size, seed),
+                "compaction": bench_compaction(directory, rate, seed),
+                "pivot_tables": tables_result,
+                "incremental": bench_incremental(directory, rate, seed),
+                "backends": bench_backends(analyze_data, directory, rate, seed, repeat),
+                "render": bench_render(analyze_data, tables, bedrock_data, repeat),
+            }
+
+    return {
+        "commit": git_commit(),
+        "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def stage_costs(results, prefix=''):
+    """
+    Flattens the results into the cost of every stage: seconds per item where the stage counts items, so runs
+    over streams of different sizes stay comparable, and seconds otherwise.
+
+    Returns:
+        dict: Dotted stage name to cost.
+    """
+    costs = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if value.get('items'):
+                costs[prefix + key] = value['seconds'] / value['items']
+            elif 'seconds' in value:
+                costs[prefix + key] = value['seconds']
+            costs.update(stage_costs(value, f"{prefix}{key}."))
+    return costs
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Compares the stage costs of two runs.
+
+    Args:
+        baseline (dict): Results of the reference run, as returned by run.
+        current (dict): Results of the run being checked.
+        tolerance (float): Slowdown tolerated before a stage counts as a regression, 0.1 being 10 %.
+
+    Returns:
+        tuple: (stage, baseline cost, current cost, ratio) of every stage present in both runs, and the same rows
+        for the stages that regressed.
+    """
+    before = stage_costs(baseline['results'])
+    after = stage_costs(current['results'])
+    rows = [(stage, before[stage], after[stage], after[stage] / before[stage] if before[stage] else float('inf'))
+            for stage in before if stage in after]
+    return rows, [row for row in rows if row[3] > 1 + tolerance]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the ingest, storage, analysis and rendering stages.")
+    parser.add_argument("-n", "--lines", help="Lines in the synthetic stream. Default = 200000", type=int,
+                        default=200000)
+    parser.add_argument("-p", "--profiles", help="Comma-separated rate profiles. Default = " +
+                        ",".join(RATE_PROFILES), default=",".join(RATE_PROFILES))
+    parser.add_argument("-r", "--repeat", help="Runs of each stage. Default = 3", type=int, default=3)
+    parser.add_argument("--cty", help="cty.plist to resolve zones with. Synthetic if not given")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare the results against")
+    parser.add_argument("--tolerance", help="Slowdown tolerated by --compare. Default = 0.1", type=float,
+                        default=0.1)
+    args = parser.parse_args()
+
+    profiles = [profile.strip() for profile in args.profiles.split(',') if profile.strip()]
+    unknown = [profile for profile in profiles if profile not in RATE_PROFILES]
+    if unknown:
+        parser.error(f"Unknown rate profiles {', '.join(unknown)}, expected {', '.join(RATE_PROFILES)}")
+
+    report = run(args.lines, profiles, args.repeat, cty_plist=args.cty)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as outfile:
+            json.dump(report, outfile, indent=4)
+    print(json.dumps(report, indent=4))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as infile:
+            baseline = json.load(infile)
+        rows, regressions = compare(baseline, report, args.tolerance)
+        for stage, before, after, ratio in rows:
+            print(f"{stage:<30} {before:12.3e} s {after:12.3e} s {ratio:6.2f}x", file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} stages regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
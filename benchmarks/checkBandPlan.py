@@ -0,0 +1,53 @@
+"""
+Checks the NumPy batch band lookup against the scalar one: for every band plan, BandPlan.bands_for must give the band
+of BandPlan.band for every segment edge, frequencies just inside and just outside each edge, the middle of every
+segment and of every gap between segments, and frequencies below and above the plan.
+
+Run from the repository root: python3 -m benchmarks.checkBandPlan
+"""
+import numpy as np
+
+from bandPlan import BAND_PLANS, get_band_plan
+
+# kHz either side of an edge; below the 0.1 kHz resolution of cluster frequencies
+OFFSETS = (-0.5, -0.01, 0.0, 0.01, 0.5)
+
+
+def probe_frequencies(segments):
+    """
+    Returns:
+        list: Frequencies in kHz around every edge and in the middle of every segment and gap of a band plan.
+    """
+    segments = sorted(segments, key=lambda segment: segment[1])
+    freqs = [0.0, segments[0][1] / 2, segments[-1][2] * 2]
+    for _, low, high in segments:
+        freqs.extend(edge + offset for edge in (low, high) for offset in OFFSETS)
+        freqs.append((low + high) / 2)
+    freqs.extend((previous[2] + segment[1]) / 2 for previous, segment in zip(segments, segments[1:]))
+    return freqs
+
+
+def run():
+    """
+    Compares the batch and scalar lookups of every band plan.
+
+    Returns:
+        dict: Frequencies probed and frequencies inside a band, per plan.
+    """
+    results = {}
+    for name, segments in BAND_PLANS.items():
+        band_plan = get_band_plan(name)
+        freqs = probe_frequencies(segments)
+        batch = band_plan.bands_for(freqs)
+        for freq, band in zip(freqs, batch.tolist()):
+            expected = band_plan.band(freq) or 0
+            assert band == expected, f"{name}: bands_for gives {band} for {freq} kHz, band gives {expected}"
+        for band, low, high in segments:
+            assert band_plan.band(low) == band and band_plan.band(high) == band, f"{name}: {band}m edges excluded"
+        results[name] = {"frequencies": len(freqs), "in_band": int(np.count_nonzero(batch))}
+    return results
+
+
+if __name__ == '__main__':
+    print(run())
+    print("OK")
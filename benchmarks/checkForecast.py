@@ -0,0 +1,169 @@
+"""
+Checks the forecast client against FakeClient, without AWS: strict JSON parsing and validation of the reply, the
+retry with the validation error after an invalid reply, giving up after the retries, the quantized cache key, the
+forecast cache in memory and on disk, and its expiry after an hour bucket.
+
+Run from the repository root: python3 -m benchmarks.checkForecast
+"""
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from forecastClient import BAND_GROUPS, CACHE_MAX_AGE, HOUR_BUCKET, OUTPUT_FORMAT, FakeClient, ForecastClient, \
+    ForecastError, cache_key, parse_forecast
+
+PROMPT = "Forecast the band conditions."
+
+
+def reply(rating="Good", summary="Quiet geomagnetic field, good high band openings."):
+    """
+    Returns:
+        str: A valid forecast reply, without the prefilled opening brace.
+    """
+    forecast = {"Summary": summary}
+    forecast.update({group: {"Rating": rating, "Explanation": f"{group} explanation"} for group in BAND_GROUPS})
+    return json.dumps(forecast)[1:]
+
+
+def expect_error(text, message):
+    """
+    Checks that parsing a reply fails with a ForecastError mentioning message.
+    """
+    try:
+        parse_forecast(text)
+    except ForecastError as e:
+        assert message in str(e), f"expected {message!r} in {e}"
+        return str(e)
+    raise AssertionError(f"{text[:40]!r} was accepted")
+
+
+def check_parsing():
+    """
+    Returns:
+        dict: The validation error of each invalid reply.
+    """
+    forecast = parse_forecast("{" + reply())
+    assert list(forecast) == ["Summary"] + list(BAND_GROUPS)
+    assert parse_forecast("```json\n{" + reply() + "\n```") == forecast  # A code fence around the object
+    assert "Extra" not in parse_forecast("{" + reply()[:-1] + ', "Extra": 1}')  # Other keys are dropped
+    return {
+        "not_json": expect_error("no forecast", "no JSON object"),
+        "truncated": expect_error("{" + reply()[:-20] + "}", "invalid JSON"),
+        "bad_rating": expect_error("{" + reply(rating="Superb"), "Rating must be one of"),
+        "empty_summary": expect_error("{" + reply(summary=" "), "Summary must be a non-empty string"),
+        "missing_group": expect_error(json.dumps({"Summary": "x"}), f"{BAND_GROUPS[0]} must be an object"),
+    }
+
+
+def check_retries():
+    """
+    Returns:
+        dict: Model calls for a valid first reply, a valid reply after an invalid one, and only invalid replies.
+    """
+    fake = FakeClient([reply()])
+    ForecastClient(fake, cache_file=None).forecast(PROMPT)
+    request = fake.requests[0]
+    assert request["messages"][0]["content"] == PROMPT + OUTPUT_FORMAT
+    assert request["messages"][-1] == {"role": "assistant", "content": "{"}  # The reply is prefilled
+    first_try = len(fake.requests)
+
+    fake = FakeClient(['"Summary": "cut short', reply()])
+    client = ForecastClient(fake, cache_file=None)
+    assert client.forecast(PROMPT)["Summary"]
+    feedback = fake.requests[1]["messages"]
+    assert feedback[1]["content"] == '{"Summary": "cut short'  # The invalid reply, then what is wrong with it
+    assert feedback[2]["role"] == "user" and "no JSON object" in feedback[2]["content"]
+    assert feedback[-1] == {"role": "assistant", "content": "{"}
+    assert client.invalid_replies == 1
+    second_try = len(fake.requests)
+
+    fake = FakeClient([reply(rating="Superb")])
+    client = ForecastClient(fake, retries=2, cache_file=None)
+    try:
+        client.forecast(PROMPT)
+    except ForecastError as e:
+        assert "after 3 calls" in str(e)
+    else:
+        raise AssertionError("only invalid replies were accepted")
+    return {"valid": first_try, "valid_after_invalid": second_try, "all_invalid": len(fake.requests)}
+
+
+def check_cache_key():
+    """
+    Returns:
+        dict: The key of nearby conditions, and of conditions that differ in each quantized input.
+    """
+    morning = datetime(2026, 10, 18, 6, 10)
+    key = cache_key(171, 1.2, 118, morning, "FN03ab")
+    assert cache_key(174, 0.8, 112, datetime(2026, 10, 18, 8, 50), "fn03") == key  # Same buckets, same key
+    different = {
+        "sfi": cache_key(186, 1.2, 118, morning, "FN03ab"),
+        "k_index": cache_key(171, 3, 118, morning, "FN03ab"),
+        "sunspots": cache_key(171, 1.2, 140, morning, "FN03ab"),
+        "hour": cache_key(171, 1.2, 118, datetime(2026, 10, 18, 9, 0), "FN03ab"),
+        "locator": cache_key(171, 1.2, 118, morning, "FN04ab"),
+    }
+    for field, other in different.items():
+        assert other != key, f"a different {field} has the same key"
+    assert "None" in cache_key(None, None, None, morning, "FN03")  # Missing solar data still gives a key
+    return {"key": key, **different}
+
+
+def check_cache():
+    """
+    Returns:
+        dict: Model calls after each cache step.
+    """
+    calls = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, 'forecast_cache.json')
+        key = cache_key(171, 1, 118, datetime(2026, 10, 18, 6), "FN03")
+
+        fake = FakeClient([reply()])
+        client = ForecastClient(fake, cache_file=cache_file)
+        forecast = client.forecast(PROMPT, key)
+        assert client.forecast(PROMPT, key) == forecast and client.cache_hits == 1
+        client.forecast(PROMPT)  # Not cached without a key
+        calls["same_key"] = len(fake.requests)
+        assert calls["same_key"] == 2
+
+        # A restart reads the cache file
+        fake = FakeClient([reply()])
+        restarted = ForecastClient(fake, cache_file=cache_file)
+        assert restarted.forecast(PROMPT, key) == forecast and not fake.requests
+        calls["after_restart"] = len(fake.requests)
+
+        # A forecast older than its hour bucket, e.g. one made for the same slot days before, isn't reused
+        assert CACHE_MAX_AGE <= HOUR_BUCKET * 3600
+        restarted.cache[key]["created"] -= CACHE_MAX_AGE
+        fake = FakeClient([reply(rating="Fair")])
+        restarted.client = fake
+        assert restarted.forecast(PROMPT, key)[BAND_GROUPS[0]]["Rating"] == "Fair"
+        calls["expired"] = len(fake.requests)
+        assert calls["expired"] == 1
+
+        # The oldest forecasts are dropped beyond cache_size
+        fake = FakeClient([reply()])
+        small = ForecastClient(fake, cache_file=None, cache_size=2)
+        for hour in (0, 3, 6):
+            small.forecast(PROMPT, cache_key(171, 1, 118, datetime(2026, 10, 18, hour), "FN03"))
+        assert len(small.cache) == 2
+        small.forecast(PROMPT, cache_key(171, 1, 118, datetime(2026, 10, 18, 0), "FN03"))
+        calls["evicted"] = len(fake.requests)
+        assert calls["evicted"] == 4
+    return calls
+
+
+def run():
+    """
+    Returns:
+        dict: The results of every check.
+    """
+    return {"parsing": check_parsing(), "retries": check_retries(), "cache_key": check_cache_key(),
+            "cache": check_cache()}
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(), indent=4))
+    print("OK")
@@ -0,0 +1,112 @@
+"""
+Checks that analysis windows longer than the raw spot retention still count every spot: a database is filled with
+six hours of spots and compacted, so most of them only survive in the per-minute and per-hour history, and the
+spot count of each window of the sql and incremental backends is compared with the spots generated in it, the
+6-hour window restored from the hour tier as well.
+
+Run from the repository root: python3 -m benchmarks.checkHistory [--rate 2] [--hours 0.25,1,6]
+"""
+import argparse
+import os
+import random
+import tempfile
+
+import dbSchema
+import spotHistory
+from zoneAggregator import ZoneAggregator
+from zoneStats import query_grids
+from benchmarks.benchSuite import spot_entries
+
+# Retention of the compacted test database: the 6-hour window reaches past the minute tier into the hour tier
+RAW_RETENTION = spotHistory.RAW_RETENTION
+MINUTE_RETENTION = 2 * 3600
+
+
+def fill_history(db_file, rate, hours, now, seed=0):
+    """
+    Stores spots at a steady rate over the longest window, then compacts them like processData's compactor.
+
+    Args:
+        db_file (str): SQLite database file to create.
+        rate (float): Spots per second.
+        hours (float): Hours of spots before now.
+        now (int): Unix time of the newest spot, and of the compaction.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        list: The timestamp of every spot stored.
+    """
+    rng = random.Random(seed)
+    span = int(hours * 3600)
+    timestamps = sorted(now - rng.randrange(span) for _ in range(int(rate * span)))
+    conn, cursor = dbSchema.setup_database(db_file)
+    with conn:
+        cursor.executemany('INSERT INTO callsigns (zone, band, snr, timestamp, spotter, mode) '
+                           'VALUES (?, ?, ?, ?, ?, ?)', spot_entries(rng, timestamps))
+    spotHistory.compact(conn, now, raw_retention=RAW_RETENTION, minute_retention=MINUTE_RETENTION)
+    conn.close()
+    return timestamps
+
+
+def expected_count(timestamps, start, now):
+    """
+    Returns:
+        int: Spots from start on, with start widened to the bucket the history counts it in.
+    """
+    if now - start > MINUTE_RETENTION:
+        start -= start % 3600
+    else:
+        start -= start % 60
+    return sum(1 for timestamp in timestamps if timestamp >= start)
+
+
+def run(rate=2.0, hours=(0.25, 1, 6), seed=0):
+    """
+    Compacts a test database and checks the spot count of every window.
+
+    Args:
+        rate (float): Spots per second.
+        hours (tuple): Length of each window in hours.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        dict: Expected, sql and incremental count per window.
+    """
+    now = 1_700_000_000
+    starts = [now - int(window * 3600) for window in hours]
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, 'callsigns.db')
+        timestamps = fill_history(db_file, rate, max(hours), now, seed)
+        conn = dbSchema.connect(db_file)
+        try:
+            raw = conn.execute('SELECT COUNT(*) FROM callsigns').fetchone()[0]
+            sql_counts = [int(grid.count.sum()) for grid in query_grids(conn, starts, until=now)]
+            aggregator = ZoneAggregator(window=int(max(hours) * 3600))
+            aggregator.refresh(conn, now + 1)
+            incremental_counts = [int(aggregator.grid(now + 1, int(window * 3600)).count.sum()) for window in hours]
+        finally:
+            conn.close()
+
+    results = {"raw_spots_left": raw, "windows": {}}
+    for window, start, sql_count, incremental_count in zip(hours, starts, sql_counts, incremental_counts):
+        expected = expected_count(timestamps, start, now)
+        results["windows"][f"{window}h"] = {"expected": expected, "sql": sql_count, "incremental": incremental_count}
+        assert sql_count == expected, f"sql backend counted {sql_count} spots in the {window} h window, not {expected}"
+        # The aggregator covers its window by whole minute buckets up to the current one, and widens it to the hour
+        # where it was restored from the hour tier
+        first_bucket = ((now + 1) // 60 - int(window * 60) + 1) * 60
+        expected = expected_count(timestamps, first_bucket, now)
+        assert incremental_count == expected, \
+            f"incremental backend counted {incremental_count} spots in the {window} h window, not {expected}"
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the window counts of a compacted spot database.")
+    parser.add_argument("--rate", help="Spots per second. Default = 2", type=float, default=2.0)
+    parser.add_argument("--hours", help="Comma-separated window lengths in hours. Default = 0.25,1,6",
+                        default="0.25,1,6")
+    args = parser.parse_args()
+
+    print(run(args.rate, tuple(float(window) for window in args.hours.split(','))))
+    print("OK")
@@ -0,0 +1,107 @@
+"""
+Checks the closed-form SNR slope of every backend against a per-cell least squares fit: the slope of each zone and
+band from the pandas (spot_grid), sql (query_grids) and incremental (ZoneAggregator) backends is compared with
+scipy.stats.linregress of the cell's SNRs against their timestamps, the per-cell path the closed form replaced.
+Cells with fewer than MIN_SLOPE_SPOTS spots must have no slope.
+
+Run from the repository root: python3 -m benchmarks.checkSlope [-n 20000]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+import dbSchema
+from spotStats import MIN_SLOPE_SPOTS
+from zoneAggregator import ZoneAggregator
+from zoneStats import ZONES, BANDS, BAND_COLUMNS, query_grids, spot_grid
+from benchmarks.spotGenerator import generate_spot_frame
+
+# Seconds of spots, ending on the last second of a minute so the aggregator's whole buckets hold exactly the spots
+WINDOW = 899
+
+
+def linregress_slope(timestamps, snrs):
+    """
+    Returns:
+        float: The least squares slope of SNR against time, in dB per second, from scipy.stats.linregress if scipy
+        is installed and numpy.polyfit otherwise.
+    """
+    try:
+        from scipy.stats import linregress
+    except ImportError:
+        return np.polyfit(timestamps, snrs, 1)[0]
+    return linregress(timestamps, snrs).slope
+
+
+def reference_slopes(df):
+    """
+    Fits the slope of every zone and band one cell at a time.
+
+    Args:
+        df (pandas.DataFrame): The spots, with zone, band, snr and timestamp columns.
+
+    Returns:
+        numpy.ndarray: The slope of every cell in dB per minute, NaN below MIN_SLOPE_SPOTS spots.
+    """
+    slopes = np.full((len(ZONES), len(BANDS)), np.nan)
+    for (zone, band), cell in df.groupby(['zone', 'band']):
+        if len(cell) >= MIN_SLOPE_SPOTS and cell['timestamp'].nunique() > 1:
+            slope = linregress_slope(cell['timestamp'].to_numpy(dtype=np.float64), cell['snr'].to_numpy(np.float64))
+            slopes[zone - ZONES[0], BAND_COLUMNS[band]] = slope * 60
+    return slopes
+
+
+def run(count=20000, seed=0):
+    """
+    Computes the slopes of a spot frame with every backend and compares them with the per-cell fit.
+
+    Args:
+        count (int): Number of spots.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        dict: Cells with a slope and the largest difference from the per-cell fit, per backend.
+    """
+    end = 1_700_000_039  # The last second of a minute
+    df = generate_spot_frame(count, window=WINDOW, seed=seed, end=end)
+    expected = reference_slopes(df)
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn, cursor = dbSchema.setup_database(os.path.join(directory, 'callsigns.db'))
+        try:
+            with conn:
+                cursor.executemany('INSERT INTO callsigns (zone, band, snr, timestamp, spotter, mode) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)',
+                                   df[['zone', 'band', 'snr', 'timestamp', 'spotter', 'mode']].values.tolist())
+            sql_grid = query_grids(conn, [end - WINDOW], until=end)[0]
+            aggregator = ZoneAggregator(window=WINDOW + 1)
+            aggregator.refresh(conn, end)
+            incremental_grid = aggregator.grid(end)
+        finally:
+            conn.close()
+
+    grids = {
+        "pandas": spot_grid(df['zone'], df['band'], df['snr'], df['timestamp'], df['mode']),
+        "sql": sql_grid,
+        "incremental": incremental_grid,
+    }
+    results = {}
+    for backend, grid in grids.items():
+        assert np.array_equal(np.isnan(grid.slope), np.isnan(expected)), \
+            f"{backend} backend has a slope in other cells than the per-cell fit"
+        difference = float(np.nanmax(np.abs(grid.slope - expected)))
+        assert np.allclose(grid.slope, expected, rtol=1e-9, atol=1e-9, equal_nan=True), \
+            f"{backend} backend slopes differ from the per-cell fit by up to {difference} dB/min"
+        results[backend] = {"cells": int(np.count_nonzero(~np.isnan(grid.slope))), "max_difference": difference}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the closed-form SNR slopes against a per-cell fit.")
+    parser.add_argument("-n", "--spots", help="Number of spots. Default = 20000", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(run(args.spots))
+    print("OK")
@@ -0,0 +1,172 @@
+"""
+Checks the solar data cache against a local stub of the hamqsl.com feed: the first fetch, fresh hits within the TTL,
+conditional revalidation answered 304 Not Modified, new XML under a new ETag, stale data served at once while a slow
+feed revalidates in the background, the retry delay after a failed fetch, and a second process reading the shared
+cache file without fetching.
+
+Run from the repository root: python3 -m benchmarks.checkSolar
+"""
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from solarData import SolarProvider
+
+# Seconds the stub feed takes to answer in the slow feed step; the stale data must be served well before
+SLOW_FEED = 1.0
+
+SOLAR_XML = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<solar><solardata>
+<updated>18 Oct 2026 0600 GMT</updated><solarflux>{sfi}</solarflux><aindex>5</aindex><kindex>1</kindex>
+<xray>C1.0</xray><sunspots>116</sunspots><aurora>1</aurora><latdegree>66.5</latdegree>
+<signalnoise>S1-S2</signalnoise>
+<calculatedconditions>
+<band name="80m-40m" time="day">Fair</band><band name="80m-40m" time="night">Good</band>
+<band name="30m-20m" time="day">Good</band><band name="30m-20m" time="night">Good</band>
+<band name="17m-15m" time="day">Good</band><band name="17m-15m" time="night">Fair</band>
+<band name="12m-10m" time="day">Fair</band><band name="12m-10m" time="night">Poor</band>
+</calculatedconditions>
+</solardata></solar>"""
+
+
+class StubFeed(BaseHTTPRequestHandler):
+    """
+    Serves the server's current XML under its ETag, answering 304 when the request already has it, or fails or
+    stalls as the server is told to.
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        time.sleep(server.delay)
+        if server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        etag = f'"{server.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = SOLAR_XML.format(sfi=server.sfi).encode("iso-8859-1")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_feed():
+    """
+    Returns:
+        ThreadingHTTPServer: The stub feed, serving on a free local port from a daemon thread.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubFeed)
+    server.requests = []  # headers of every request
+    server.version = 1
+    server.sfi = 172
+    server.fail = False
+    server.delay = 0.0
+    threading.Thread(target=server.serve_forever, name='stub-feed', daemon=True).start()
+    return server
+
+
+def expire(provider):
+    """
+    Ages the cached XML past the provider's TTL.
+    """
+    with provider.lock:
+        provider.entry["fetched"] -= provider.ttl + 1
+
+
+def run():
+    """
+    Walks the provider through every cache path against the stub feed.
+
+    Returns:
+        dict: The provider's counters and the requests the feed received, after each step.
+    """
+    feed = start_feed()
+    url = f"http://127.0.0.1:{feed.server_address[1]}/solarxml.php"
+    steps = {}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, 'solar_cache.json')
+            provider = SolarProvider(url, cache_file, ttl=60, retry=60)
+
+            def counters():
+                return {"requests": len(feed.requests), "hits": provider.hits, "stale_hits": provider.stale_hits,
+                        "fetches": provider.fetches, "not_modified": provider.not_modified,
+                        "errors": provider.errors}
+
+            # First fetch: nothing cached, so the call waits for it
+            solar = provider.get()
+            assert solar is not None and solar.sfi == 172 and solar.conditions["30m-20m"]["Day"] == "Good"
+            assert provider.fetches == 1 and len(feed.requests) == 1
+            assert "If-None-Match" not in feed.requests[0]
+            steps["first_fetch"] = counters()
+
+            # Within the TTL: served from memory, no request
+            for _ in range(5):
+                assert provider.get().sfi == 172
+            assert len(feed.requests) == 1 and provider.hits == 5
+            steps["fresh_hits"] = counters()
+
+            # Past the TTL, unchanged feed: revalidated with the cached ETag and answered 304
+            expire(provider)
+            assert provider.get(block=True).sfi == 172
+            assert feed.requests[-1].get("If-None-Match") == '"1"', feed.requests[-1]
+            assert provider.not_modified == 1 and provider.fetches == 1
+            assert provider.get().sfi == 172 and len(feed.requests) == 2  # Fresh again after the 304
+            steps["not_modified"] = counters()
+
+            # Past the TTL, new XML: fetched under its new ETag
+            feed.version, feed.sfi = 2, 180
+            expire(provider)
+            assert provider.get(block=True).sfi == 180 and provider.fetches == 2
+            steps["changed"] = counters()
+
+            # Past the TTL, slow feed: the stale data is served at once and revalidated in the background
+            feed.version, feed.sfi, feed.delay = 3, 190, SLOW_FEED
+            expire(provider)
+            started = time.perf_counter()
+            solar = provider.get()
+            waited = time.perf_counter() - started
+            assert solar.sfi == 180 and waited < SLOW_FEED / 2, f"waited {waited:.2f} s for stale data"
+            provider.refreshing.join(SLOW_FEED * 5)
+            assert provider.get().sfi == 190 and provider.stale_hits == 1
+            steps["stale_while_revalidate"] = counters()
+            steps["stale_while_revalidate"]["stale_wait_ms"] = waited * 1000
+
+            # Past the TTL, failing feed: the stale data is kept, and no new attempt is made within the retry delay
+            feed.delay, feed.fail = 0.0, True
+            expire(provider)
+            assert provider.get(block=True).sfi == 190 and provider.errors == 1
+            requests = len(feed.requests)
+            assert provider.get(block=True).sfi == 190 and len(feed.requests) == requests
+            steps["failed_fetch"] = counters()
+
+            # Another process sharing the cache file: served from the file, without a request
+            feed.fail = False
+            other = SolarProvider(url, cache_file, ttl=60, retry=60)
+            requests = len(feed.requests)
+            solar = other.get()
+            assert solar is not None and solar.sfi == 190 and len(feed.requests) == requests
+            steps["shared_file"] = {"requests": len(feed.requests), "hits": other.hits}
+    finally:
+        feed.shutdown()
+        feed.server_close()
+    return steps
+
+
+if __name__ == '__main__':
+    for step, figures in run().items():
+        print(f"{step}: {figures}")
+    print("OK")
@@ -0,0 +1,168 @@
+import random
+import time
+
+# Callsign prefixes drawn for synthetic spots, weighted roughly like a busy FT8 evening in North America
+PREFIXES = ['K', 'W', 'N', 'AA', 'KD', 'VE3', 'VE7', 'VA2', 'G', 'M', 'DL', 'F', 'EA', 'I', 'PA', 'SP', 'OK',
+            'UA', 'UA9', 'JA', 'BY', 'VK', 'ZL', 'PY', 'LU', 'CE', 'XE', 'KP4', 'ZS', 'CN', 'VU', 'HS', '9A', 'OH']
+
+# Frequencies (kHz) of the FT8, FT4 and CW activity on each band
+DIGITAL_FREQUENCIES = [1840.0, 3573.0, 3575.5, 7074.0, 7047.5, 10136.0, 14074.0, 14080.0, 18100.0, 21074.0,
+                       21140.0, 24915.0, 28074.0, 28180.0, 50313.0]
+CW_FREQUENCIES = [1822.5, 3525.1, 7018.5, 10112.3, 14025.0, 18075.2, 21030.0, 24895.0, 28020.0, 50090.0]
+
+# Lines a cluster sends besides skimmer spots
+OTHER_LINES = [
+    "WWV de W0MU <18>:   SFI=172, A=5, K=1, No Storms -> No Storms",
+    "To ALL de K1TTT: CQ WW CW this weekend, see you there",
+    "DX de W3LPL:     14025.0  K1ABC        tnx qso                        1842Z",
+    "",
+]
+
+# Spot rates (spots per second) of a normal evening and of a contest weekend
+REALISTIC_RATE = 20
+CONTEST_RATES = {'10x': REALISTIC_RATE * 10, '100x': REALISTIC_RATE * 100}
+
+
+def random_call_sign(rng):
+    """
+    Generates a plausible callsign.
+
+    Args:
+        rng (random.Random): Random number generator.
+
+    Returns:
+        str: The callsign.
+    """
+    suffix = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(1, 3)))
+    call_sign = f"{rng.choice(PREFIXES)}{rng.randint(0, 9)}{suffix}"
+    if rng.random() < 0.02:
+        call_sign += rng.choice(['/P', '/M', '/QRP', '/4'])
+    return call_sign
+
+
+def spot_line(rng, spotter, mode=None):
+    """
+    Formats one skimmer spot line as sent by the DX Cluster.
+
+    Args:
+        rng (random.Random): Random number generator.
+        spotter (str): Spotter reporting the spot.
+        mode (str): FT8, FT4 or CW. Drawn at random if not given.
+
+    Returns:
+        str: The spot line, without line terminator.
+    """
+    mode = mode or rng.choice(['FT8', 'FT8', 'FT8', 'FT4', 'CW'])
+    call_sign = random_call_sign(rng)
+    zulu = time.strftime('%H%MZ', time.gmtime())
+    if mode == 'CW':
+        frequency = rng.choice(CW_FREQUENCIES) + rng.randint(0, 20) / 10
+        return f"DX de {spotter}-#: {frequency:8.1f}  {call_sign:<12} {rng.randint(3, 40):2d} dB " \
+               f"{rng.randint(15, 35):2d} WPM CW  CQ      {zulu}"
+    frequency = rng.choice(DIGITAL_FREQUENCIES)
+    return f"DX de {spotter}-#: {frequency:8.1f}  {call_sign:<12} {rng.randint(-24, 12):+03d} dB " \
+           f" 0 {mode}  CQ      {zulu}"
+
+
+def generate_lines(count, spotters=('VE3EID',), seed=0, other_ratio=0.1, share=0.7):
+    """
+    Generates a synthetic DX Cluster stream.
+
+    Args:
+        count (int): Number of lines to generate.
+        spotters (tuple): Spotters the spots are attributed to, the first one being the busiest.
+        seed (int): Seed of the random number generator, so runs are reproducible.
+        other_ratio (float): Share of lines that are not skimmer spots.
+        share (float): Share of the spots reported by the first spotter.
+
+    Returns:
+        list: The lines, without line terminators.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        if rng.random() < other_ratio:
+            lines.append(rng.choice(OTHER_LINES))
+        else:
+            spotter = spotters[0] if rng.random() < share else rng.choice(spotters[1:] or spotters)
+            lines.append(spot_line(rng, spotter))
+    return lines
+
+
+def generate_stream(count, spotters=('VE3EID',), seed=0, other_ratio=0.1, share=0.7):
+    """
+    Generates a synthetic DX Cluster stream as the raw bytes received from the socket.
+
+    Args:
+        count (int): Number of lines to generate.
+        spotters (tuple): Spotters the spots are attributed to.
+        seed (int): Seed of the random number generator.
+        other_ratio (float): Share of lines that are not skimmer spots.
+        share (float): Share of the spots reported by the first spotter.
+
+    Returns:
+        bytes: The stream, with telnet CRLF line terminators.
+    """
+    return ''.join(line + '\r\n' for line in generate_lines(count, spotters, seed, other_ratio, share)).encode('ascii')
+
+
+def generate_capture(count, rate=REALISTIC_RATE, spotters=('VE3EID',), seed=0, lines_per_read=5):
+    """
+    Generates a synthetic capture, as read_capture returns it, with lines arriving at a steady rate.
+
+    Args:
+        count (int): Number of lines to generate.
+        rate (float): Lines per second.
+        spotters (tuple): Spotters the spots are attributed to.
+        seed (int): Seed of the random number generator.
+        lines_per_read (int): Lines delivered by each socket read.
+
+    Returns:
+        list: (seconds since start, bytes) records.
+    """
+    lines = [line + '\r\n' for line in generate_lines(count, spotters, seed)]
+    return [(i / rate, ''.join(lines[i:i + lines_per_read]).encode('ascii'))
+            for i in range(0, len(lines), lines_per_read)]
+
+
+def synthetic_cty_index():
+    """
+    Builds a CtyIndex over the synthetic prefixes, for benchmarks run without a cty.plist.
+
+    Returns:
+        CtyIndex: Index mapping every prefix in PREFIXES to a CQ zone.
+    """
+    from ctyIndex import CtyIndex
+
+    rng = random.Random(0)
+    return CtyIndex.from_plist({prefix: {"CQZone": rng.randint(1, 40)} for prefix in PREFIXES})
+
+
+def generate_spot_frame(count, window=900, spotter='VE3EID', seed=0, end=None):
+    """
+    Generates the spots table analyzeData reads from the database, for benchmarks of the analysis stages.
+
+    Args:
+        count (int): Number of spots.
+        window (int): Seconds the spots are spread over, ending now.
+        spotter (str): Spotter the spots are attributed to.
+        seed (int): Seed of the random number generator.
+        end (int): Unix time of the last spot. Defaults to now.
+
+    Returns:
+        pandas.DataFrame: zone, band, snr, timestamp, spotter and mode columns, like the callsigns table.
+    """
+    import numpy as np
+    import pandas as pd
+    from bandPlan import CONTEST_BANDS, WARC_BANDS
+
+    rng = np.random.default_rng(seed)
+    end = int(time.time()) if end is None else end
+    return pd.DataFrame({
+        'zone': rng.integers(1, 41, count),
+        'band': rng.choice(CONTEST_BANDS + WARC_BANDS, count),
+        'snr': rng.integers(-24, 13, count),
+        'timestamp': np.sort(rng.integers(end - window, end + 1, count)),
+        'spotter': spotter,
+        'mode': rng.choice(['FT8', 'FT8', 'FT8', 'FT4', 'CW'], count),
+    })
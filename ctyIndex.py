@@ -0,0 +1,410 @@
+import argparse
+import bisect
+import functools
+import hashlib
+import logging
+import mmap
+import os
+import plistlib
+import struct
+
+# Suffixes that describe how a station is operating rather than where it is located.
+# These are stripped before the prefix lookup.
+PORTABLE_SUFFIXES = frozenset({'P', 'M', 'QRP', 'QRPP', 'A', 'B', 'LH', 'J', 'R', 'T', 'X'})
+
+# Maritime and aeronautical mobile stations have no fixed CQ zone.
+NO_ZONE_SUFFIXES = frozenset({'MM', 'AM'})
+
+# Default number of distinct callsigns kept in the per-callsign result cache
+DEFAULT_CACHE_SIZE = 65536
+
+# Default locations of the source plist and of its compiled snapshot
+CTY_PLIST = 'cty.plist'
+CTY_SNAPSHOT = 'cty.idx'
+
+# Snapshot layout: header, then for each table (prefixes, exact callsigns) a sorted column of
+# fixed-width NUL-padded keys followed by a column of one-byte CQ zones.
+SNAPSHOT_MAGIC = b'CTYIDX01'
+SNAPSHOT_HEADER = struct.Struct('<8s32sHIII')  # magic, plist sha256, key width, prefixes, exact, length mask
+
+
+class CtyIndex:
+    """
+    Longest-prefix-match index over the cty.plist prefix table, resolving callsigns to CQ zones.
+
+    The index keeps two tables: one with the prefixes of each DXCC entity, and one with exact-callsign
+    overrides (entries flagged ``ExactCallsign`` in cty.plist). Prefix lookups only probe the prefix lengths
+    that actually occur in the table, and every resolved callsign is memoized in a bounded LRU cache.
+    """
+
+    def __init__(self, prefixes, exact, lengths=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            prefixes (Mapping): Prefix to CQ zone table. Only ``get`` is used, so any mapping-like object works.
+            exact (Mapping): Exact callsign to CQ zone table.
+            lengths (iterable): Prefix lengths present in ``prefixes``. Computed from the keys if not given.
+            cache_size (int): Maximum number of callsigns kept in the result cache.
+        """
+        self.prefixes = prefixes
+        self.exact = exact
+        if lengths is None:
+            lengths = {len(prefix) for prefix in prefixes}
+        self.lengths = tuple(sorted(lengths, reverse=True))  # Longest prefix first
+        self._cached_lookup = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    @classmethod
+    def from_plist(cls, cty_list, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Builds the index from the dictionary loaded from cty.plist.
+
+        Args:
+            cty_list (dict): Dictionary loaded from cty.plist, keyed by prefix or exact callsign.
+            cache_size (int): Maximum number of callsigns kept in the result cache.
+
+        Returns:
+            CtyIndex: The compiled index.
+        """
+        prefixes = {}
+        exact = {}
+        for key, entry in cty_list.items():
+            zone = entry.get("CQZone")
+            if not zone:
+                continue
+            if entry.get("ExactCallsign"):
+                exact[key.upper()] = zone
+            else:
+                prefixes[key.upper()] = zone
+        return cls(prefixes, exact, cache_size=cache_size)
+
+    @classmethod
+    def from_file(cls, path="cty.plist", cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Loads cty.plist from disk and builds the index.
+
+        Args:
+            path (str): Path of the cty.plist file.
+            cache_size (int): Maximum number of callsigns kept in the result cache.
+
+        Returns:
+            CtyIndex: The compiled index.
+        """
+        with open(path, 'rb') as infile:
+            cty_list = plistlib.load(infile, dict_type=dict)
+        return cls.from_plist(cty_list, cache_size=cache_size)
+
+    def lookup(self, call_sign):
+        """
+        Resolves a callsign to its CQ zone, using the result cache.
+
+        Args:
+            call_sign (str): The callsign to be looked up.
+
+        Returns:
+            int or None: CQ zone if found, else None.
+        """
+        return self._cached_lookup(call_sign)
+
+    def longest_prefix(self, call_sign):
+        """
+        Finds the CQ zone of the longest prefix in the table that matches the start of the callsign.
+
+        Args:
+            call_sign (str): The callsign or prefix to match.
+
+        Returns:
+            int or None: CQ zone if a prefix matched, else None.
+        """
+        size = len(call_sign)
+        get = self.prefixes.get
+        for length in self.lengths:
+            if length <= size:
+                zone = get(call_sign[:length])
+                if zone is not None:
+                    return zone
+        return None
+
+    def _resolve(self, call_sign):
+        """
+        Resolves a callsign to its CQ zone without going through the cache.
+
+        Exact-callsign overrides win over everything else. Portable callsigns are reduced to the part that
+        identifies the location: operating suffixes such as /P or /QRP are dropped, a single digit suffix
+        replaces the call area digit (K1ABC/4 resolves as K4ABC), and a prefix given before or after the
+        home call (VP2E/K1ABC, K1ABC/VP2E) is looked up on its own.
+
+        Args:
+            call_sign (str): The callsign to be looked up.
+
+        Returns:
+            int or None: CQ zone if found, else None.
+        """
+        call_sign = call_sign.upper()
+        zone = self.exact.get(call_sign)
+        if zone is not None:
+            return zone
+        if '/' not in call_sign:
+            return self.longest_prefix(call_sign)
+
+        parts = [part for part in call_sign.split('/') if part]
+        if not parts or any(part in NO_ZONE_SUFFIXES for part in parts[1:]):
+            return None
+        parts = [parts[0]] + [part for part in parts[1:] if part not in PORTABLE_SUFFIXES]
+
+        if len(parts) == 1:
+            home = parts[0]
+            zone = self.exact.get(home)
+            return zone if zone is not None else self.longest_prefix(home)
+
+        first, second = parts[0], parts[1]
+        if second.isdigit() and len(second) == 1:
+            return self.longest_prefix(_replace_call_area(first, second))
+
+        # The location prefix is the part that is itself a known prefix, e.g. VP2E/K1ABC or K1ABC/VP2E,
+        # otherwise the shorter of the two parts
+        if self.prefixes.get(first) is not None:
+            location = first
+        elif self.prefixes.get(second) is not None:
+            location = second
+        else:
+            location = first if len(first) < len(second) else second
+        zone = self.longest_prefix(location)
+        if zone is None:
+            zone = self.longest_prefix(second if location is first else first)
+        return zone
+
+    def stats(self):
+        """
+        Reports the result cache statistics so the hit rate is visible.
+
+        Returns:
+            dict: Hits, misses, hit rate, current cache size and maximum cache size.
+        """
+        info = self._cached_lookup.cache_info()
+        total = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": info.hits / total if total else 0.0,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+        }
+
+    def clear_cache(self):
+        """
+        Empties the result cache and resets its statistics.
+        """
+        self._cached_lookup.cache_clear()
+
+
+def _replace_call_area(call_sign, digit):
+    """
+    Replaces the first call area digit of a callsign, e.g. K1ABC with digit 4 becomes K4ABC.
+
+    Args:
+        call_sign (str): The home callsign.
+        digit (str): The call area digit from the portable suffix.
+
+    Returns:
+        str: The callsign with its call area replaced, or the callsign unchanged if it has no digit.
+    """
+    for i, char in enumerate(call_sign):
+        if char.isdigit() and i > 0:
+            return call_sign[:i] + digit + call_sign[i + 1:]
+    return call_sign
+
+
+def log_stats(index):
+    """
+    Logs the cache statistics of the CtyIndex.
+
+    Args:
+        index (CtyIndex): The index to report on.
+    """
+    stats = index.stats()
+    logging.info(f"CQ zone cache: {stats['hits']} hits, {stats['misses']} misses, "
+                 f"{stats['hit_rate']:.1%} hit rate, {stats['size']}/{stats['max_size']} callsigns cached.")
+
+
+class SnapshotTable:
+    """
+    Read-only view of one sorted key column and its zone column inside a memory-mapped snapshot.
+
+    Implements ``get`` with a binary search over the fixed-width keys, so it can stand in for the
+    prefix and exact-callsign dictionaries of a CtyIndex without loading them into memory.
+    """
+
+    def __init__(self, buffer, offset, count, width):
+        """
+        Args:
+            buffer (mmap.mmap): The memory-mapped snapshot file.
+            offset (int): Byte offset of the key column.
+            count (int): Number of entries in the table.
+            width (int): Width in bytes of each key.
+        """
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.width = width
+        self.zone_offset = offset + count * width
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * self.width
+        return self.buffer[start:start + self.width]
+
+    def get(self, key, default=None):
+        """
+        Looks up the CQ zone stored for a key.
+
+        Args:
+            key (str): The prefix or callsign to look up.
+            default: Value returned if the key is not in the table.
+
+        Returns:
+            int: The CQ zone, or ``default`` if the key is not in the table.
+        """
+        if len(key) > self.width:
+            return default
+        padded = key.encode('ascii', 'replace').ljust(self.width, b'\0')
+        i = bisect.bisect_left(self, padded)
+        if i < self.count and self[i] == padded:
+            return self.buffer[self.zone_offset + i]
+        return default
+
+
+def plist_digest(path=CTY_PLIST):
+    """
+    Computes the content hash that ties a snapshot to the plist it was built from.
+
+    Args:
+        path (str): Path of the cty.plist file.
+
+    Returns:
+        bytes: SHA-256 digest of the plist file.
+    """
+    with open(path, 'rb') as infile:
+        return hashlib.sha256(infile.read()).digest()
+
+
+def build_snapshot(plist_path=CTY_PLIST, snapshot_path=CTY_SNAPSHOT):
+    """
+    Compiles cty.plist into the on-disk snapshot format.
+
+    The snapshot is written to a temporary file and moved into place, so a reader never sees a partial file.
+
+    Args:
+        plist_path (str): Path of the cty.plist file.
+        snapshot_path (str): Path the snapshot is written to.
+
+    Returns:
+        bytes: SHA-256 digest of the plist the snapshot was built from.
+    """
+    with open(plist_path, 'rb') as infile:
+        data = infile.read()
+    digest = hashlib.sha256(data).digest()
+    index = CtyIndex.from_plist(plistlib.loads(data, dict_type=dict))
+
+    keys = list(index.prefixes) + list(index.exact)
+    width = max((len(key) for key in keys), default=1)
+    length_mask = 0
+    for length in index.lengths:
+        length_mask |= 1 << length
+
+    columns = []
+    for table in (index.prefixes, index.exact):
+        ordered = sorted(key.encode('ascii', 'replace').ljust(width, b'\0') for key in table)
+        columns.append(b''.join(ordered))
+        columns.append(bytes(table[key.rstrip(b'\0').decode('ascii')] for key in ordered))
+
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, digest, width,
+                                           len(index.prefixes), len(index.exact), length_mask))
+        for column in columns:
+            outfile.write(column)
+    os.replace(tmp_path, snapshot_path)
+
+    logging.info(f"Built {snapshot_path} from {plist_path}: {len(index.prefixes)} prefixes, "
+                 f"{len(index.exact)} exact callsigns.")
+    return digest
+
+
+def open_snapshot(snapshot_path=CTY_SNAPSHOT, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Memory-maps a snapshot and wraps it in a CtyIndex.
+
+    Args:
+        snapshot_path (str): Path of the snapshot file.
+        cache_size (int): Maximum number of callsigns kept in the result cache.
+
+    Returns:
+        tuple: The CtyIndex and the plist digest recorded in the snapshot.
+
+    Raises:
+        ValueError: If the file is not a snapshot in a format this version can read.
+    """
+    with open(snapshot_path, 'rb') as infile:
+        buffer = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < SNAPSHOT_HEADER.size:
+        raise ValueError(f"{snapshot_path} is truncated")
+    magic, digest, width, prefix_count, exact_count, length_mask = SNAPSHOT_HEADER.unpack_from(buffer)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{snapshot_path} is not a cty.plist snapshot")
+    if len(buffer) != SNAPSHOT_HEADER.size + (prefix_count + exact_count) * (width + 1):
+        raise ValueError(f"{snapshot_path} is truncated")
+
+    prefixes = SnapshotTable(buffer, SNAPSHOT_HEADER.size, prefix_count, width)
+    exact = SnapshotTable(buffer, prefixes.zone_offset + prefix_count, exact_count, width)
+    lengths = [length for length in range(width + 1) if length_mask & (1 << length)]
+    return CtyIndex(prefixes, exact, lengths=lengths, cache_size=cache_size), digest
+
+
+def load_index(plist_path=CTY_PLIST, snapshot_path=CTY_SNAPSHOT, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Opens the cty.plist snapshot, rebuilding it first if the plist changed since it was built.
+
+    If the plist is missing but a snapshot exists, the snapshot is used as is.
+
+    Args:
+        plist_path (str): Path of the cty.plist file.
+        snapshot_path (str): Path of the snapshot file.
+        cache_size (int): Maximum number of callsigns kept in the result cache.
+
+    Returns:
+        CtyIndex: Index backed by the memory-mapped snapshot.
+
+    Raises:
+        FileNotFoundError: If neither the plist nor a snapshot exists.
+    """
+    try:
+        digest = plist_digest(plist_path)
+    except FileNotFoundError:
+        if not os.path.exists(snapshot_path):
+            raise
+        logging.warning(f"{plist_path} not found, using existing {snapshot_path}.")
+        return open_snapshot(snapshot_path, cache_size)[0]
+
+    try:
+        index, snapshot_digest = open_snapshot(snapshot_path, cache_size)
+        if snapshot_digest == digest:
+            return index
+        logging.info(f"{plist_path} changed since {snapshot_path} was built, rebuilding.")
+    except (FileNotFoundError, ValueError) as e:
+        logging.info(f"Building {snapshot_path}: {e}")
+
+    build_snapshot(plist_path, snapshot_path)
+    return open_snapshot(snapshot_path, cache_size)[0]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Compile cty.plist into a memory-mappable prefix snapshot.")
+    parser.add_argument("-i", "--plist", help="Path of the cty.plist file", default=CTY_PLIST)
+    parser.add_argument("-o", "--snapshot", help="Path of the snapshot to write", default=CTY_SNAPSHOT)
+
+    args = parser.parse_args()
+    build_snapshot(args.plist, args.snapshot)
@@ -0,0 +1,241 @@
+import argparse
+import logging
+import sqlite3
+
+# SQLite database file name
+DB_FILE = 'callsigns.db'
+
+# Connection settings. WAL lets analyzeData read while the writer commits; with WAL, synchronous=NORMAL only
+# syncs at checkpoints, which can lose the last commits on power loss but never corrupts the database.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),  # Read pages through the page cache of the OS instead of copying them
+    ('cache_size', -16000),  # 16 MB page cache; negative sizes are in KiB
+    ('temp_store', 'MEMORY'),  # Sorts and temporary indexes of the GROUP BY queries stay in memory
+    ('busy_timeout', 5000),  # Wait up to 5 s for a lock instead of failing
+)
+
+# STRICT tables reject values of the wrong type; available from SQLite 3.37
+STRICT_TABLES = sqlite3.sqlite_version_info >= (3, 37, 0)
+
+
+def table_options(without_rowid=False):
+    """
+    Builds the table options clause of a CREATE TABLE statement.
+
+    Args:
+        without_rowid (bool): Cluster the table on its primary key instead of a rowid.
+
+    Returns:
+        str: The options, STRICT included where SQLite supports it.
+    """
+    options = (['WITHOUT ROWID'] if without_rowid else []) + (['STRICT'] if STRICT_TABLES else [])
+    return ' ' + ', '.join(options) if options else ''
+
+
+def table_exists(cursor, name):
+    """
+    Checks whether a table exists.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor object.
+        name (str): Table name.
+
+    Returns:
+        bool: True if the table exists.
+    """
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() \
+        is not None
+
+
+def migrate_indexed_callsigns(cursor):
+    """
+    Version 1: rebuild callsigns with an integer primary key, strict integer columns and indexes.
+
+    The rowid primary key keeps rows in arrival order, so old spots sit at the front of the table and the
+    timestamp index turns the retention DELETE and the windowed reads into range scans instead of full scans.
+    WITHOUT ROWID doesn't fit this table: spots have no natural unique key, and rowid tables are cheaper to
+    append to.
+    """
+    cursor.execute(f'''
+        CREATE TABLE callsigns_v1 (
+            id INTEGER PRIMARY KEY,
+            zone INTEGER NOT NULL,
+            band INTEGER NOT NULL,
+            snr INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,  -- Unix time
+            spotter TEXT NOT NULL
+        ){table_options()}
+    ''')
+    if table_exists(cursor, 'callsigns'):
+        # Older databases stored the timestamp as REAL, and had no NOT NULL constraints
+        cursor.execute('''
+            INSERT INTO callsigns_v1 (zone, band, snr, timestamp, spotter)
+            SELECT zone, band, snr, CAST(timestamp AS INTEGER), spotter
+            FROM callsigns
+            WHERE zone IS NOT NULL AND band IS NOT NULL AND snr IS NOT NULL AND timestamp IS NOT NULL
+                AND spotter IS NOT NULL
+            ORDER BY timestamp
+        ''')
+        cursor.execute('DROP TABLE callsigns')
+    cursor.execute('ALTER TABLE callsigns_v1 RENAME TO callsigns')
+    cursor.execute('CREATE INDEX callsigns_timestamp ON callsigns (timestamp)')
+    cursor.execute('CREATE INDEX callsigns_spotter_timestamp ON callsigns (spotter, timestamp)')
+    cursor.execute('CREATE INDEX callsigns_zone_band ON callsigns (zone, band)')
+
+
+def migrate_rollup_tables(cursor):
+    """
+    Version 2: add the per-minute and per-hour rollups of the spot history, and the compactor's progress.
+
+    Each rollup row holds the sums the statistics are derived from, for one spotter, zone and band over one
+    bucket: count, SNR sum and sum of squares, and the regression sums of SNR against the time t in seconds
+    since the start of the bucket. Keeping t relative to the bucket keeps the sums small and exact; they are
+    shifted when buckets are combined. The bucket leads the primary key, so retention deletes and time
+    window queries are range scans of the clustered WITHOUT ROWID tables.
+    """
+    for table in ('spots_minute', 'spots_hour'):
+        cursor.execute(f'''
+            CREATE TABLE {table} (
+                bucket INTEGER NOT NULL,  -- Unix time of the start of the bucket
+                spotter TEXT NOT NULL,
+                zone INTEGER NOT NULL,
+                band INTEGER NOT NULL,
+                n INTEGER NOT NULL,
+                snr_sum INTEGER NOT NULL,
+                snr_sq_sum INTEGER NOT NULL,
+                t_sum INTEGER NOT NULL,
+                t_sq_sum INTEGER NOT NULL,
+                t_snr_sum INTEGER NOT NULL,
+                PRIMARY KEY (bucket, spotter, zone, band)
+            ){table_options(without_rowid=True)}
+        ''')
+    cursor.execute(f'''
+        CREATE TABLE rollup_progress (
+            tier TEXT PRIMARY KEY,
+            position INTEGER NOT NULL  -- Last raw id rolled into minutes, or end of the last hour rolled up
+        ){table_options(without_rowid=True)}
+    ''')
+
+
+def migrate_spot_mode(cursor):
+    """
+    Version 3: record the mode of every spot, so CW spots can be told apart from the digital modes. Spots stored
+    before this version have no mode.
+    """
+    cursor.execute('ALTER TABLE callsigns ADD COLUMN mode TEXT')
+
+
+def migrate_forecasts(cursor):
+    """
+    Version 4: add the Bedrock band condition forecasts, handed from bedrockAnalysis to analyzeData on the same
+    host. AUTOINCREMENT never reuses an id, so the newest id is a version readers can compare cheaply.
+    """
+    cursor.execute(f'''
+        CREATE TABLE forecasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created INTEGER NOT NULL,  -- Unix time
+            body TEXT NOT NULL  -- The forecast JSON
+        ){table_options()}
+    ''')
+
+
+# Schema migrations, in order. The database's user_version is the number of migrations applied to it.
+MIGRATIONS = [
+    migrate_indexed_callsigns,
+    migrate_rollup_tables,
+    migrate_spot_mode,
+    migrate_forecasts,
+]
+
+# Schema version of a database with every migration applied
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    """
+    Returns:
+        int: Number of migrations applied to the database.
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Upgrades the database in place by applying the migrations it hasn't had yet, each in its own transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection object.
+
+    Returns:
+        int: The schema version of the database.
+
+    Raises:
+        RuntimeError: If the database was created by a newer version of the schema.
+    """
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than the supported version {SCHEMA_VERSION}")
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage the transaction explicitly, so the DDL is part of it
+    try:
+        for version, migration in enumerate(MIGRATIONS[version:], version + 1):
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            logging.info(f"Database migrated to schema version {version}: {migration.__name__}")
+    finally:
+        conn.isolation_level = isolation_level
+    return schema_version(conn)
+
+
+def connect(db_file=DB_FILE, **kwargs):
+    """
+    Opens the database with the tuned connection settings.
+
+    Args:
+        db_file (str): SQLite database file name.
+        **kwargs: Passed to sqlite3.connect.
+
+    Returns:
+        sqlite3.Connection: Database connection object.
+    """
+    conn = sqlite3.connect(db_file, **kwargs)
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def setup_database(db_file=DB_FILE):
+    """
+    Opens the database and brings its schema up to date.
+
+    Args:
+        db_file (str): SQLite database file name.
+
+    Returns:
+        tuple: Connection and cursor objects for database operations.
+    """
+    conn = connect(db_file)
+    migrate(conn)
+    return conn, conn.cursor()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Upgrade the callsigns database schema in place.")
+    parser.add_argument("database", nargs='?', help=f"SQLite database file. Default = {DB_FILE}", default=DB_FILE)
+    args = parser.parse_args()
+
+    conn, _ = setup_database(args.database)
+    print(f"{args.database}: schema version {schema_version(conn)}")
+    conn.close()
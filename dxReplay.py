@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import struct
+import time
+from datetime import datetime
+
+# Capture file layout: header (magic, Unix start time), then one record per socket read:
+# seconds since the start of the capture, payload length, payload bytes.
+CAPTURE_MAGIC = b'DXCAP001'
+CAPTURE_HEADER = struct.Struct('<8sd')
+RECORD_HEADER = struct.Struct('<dI')
+
+
+class CaptureWriter:
+    """
+    Records the raw telnet stream of one DX Cluster connection, with the arrival time of every read.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the capture file to create.
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.started = time.monotonic()
+        self.file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, time.time()))
+
+    def write(self, data):
+        """
+        Appends one read to the capture.
+
+        Args:
+            data (bytes-like): Bytes received from the socket.
+        """
+        self.file.write(RECORD_HEADER.pack(time.monotonic() - self.started, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        """
+        Flushes and closes the capture file.
+        """
+        self.file.close()
+
+
+def open_capture(directory, host, port):
+    """
+    Creates a timestamped capture file for a DX Cluster connection.
+
+    Args:
+        directory (str): Directory the captures are written to.
+        host (str): The hostname or IP address of the DX Cluster server.
+        port (int): The port number of the DX Cluster server.
+
+    Returns:
+        CaptureWriter: Writer for the new capture file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{host}_{port}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.dxcap"
+    capture = CaptureWriter(os.path.join(directory, name))
+    logging.info(f"Capturing {host}:{port} to {capture.path}")
+    return capture
+
+
+def read_capture(path):
+    """
+    Loads a capture file. Files without the capture header are treated as a raw stream received all at once.
+
+    Args:
+        path (str): Path of the capture file.
+
+    Returns:
+        list: (seconds since the start of the capture, bytes) records.
+    """
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    if not data.startswith(CAPTURE_MAGIC):
+        return [(0.0, data)]
+
+    records = []
+    position = CAPTURE_HEADER.size
+    while position + RECORD_HEADER.size <= len(data):
+        offset, size = RECORD_HEADER.unpack_from(data, position)
+        position += RECORD_HEADER.size
+        records.append((offset, data[position:position + size]))
+        position += size
+    return records
+
+
+def inject_faults(data, rng, partial_lines, garbage_rate):
+    """
+    Applies the configured faults to one read before it is sent.
+
+    Args:
+        data (bytes): Bytes of the read.
+        rng (random.Random): Random number generator.
+        partial_lines (bool): Split the read at random positions, so lines arrive in pieces.
+        garbage_rate (float): Probability of inserting bytes that are not valid UTF-8 into the read.
+
+    Returns:
+        list: The pieces to send, in order.
+    """
+    if garbage_rate and rng.random() < garbage_rate:
+        position = rng.randrange(len(data) + 1)
+        data = data[:position] + bytes(rng.randrange(0x80, 0x100) for _ in range(rng.randint(1, 4))) + data[position:]
+    if not partial_lines or len(data) < 2:
+        return [data]
+    cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randint(1, 3))))
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+class ReplayServer:
+    """
+    Local stand-in for a DX Cluster that replays a capture to every connected client.
+
+    The capture plays like a live feed: one timeline shared by all clients, started when the first client
+    connects. Replay runs at the recorded pace multiplied by ``speed``, and the reads due while no client is
+    connected are dropped, so a client that is disconnected misses what is sent meanwhile. When ``speed`` is 0
+    there is no pace to keep: replay runs as fast as the clients read and waits for a client to reconnect.
+    Disconnects, lines split across reads and invalid bytes can be injected to exercise the ingester's recovery
+    paths.
+    """
+
+    def __init__(self, records, speed=1.0, repeat=False, disconnect_every=None, partial_lines=False,
+                 garbage_rate=0.0, seed=0):
+        """
+        Args:
+            records (list): (seconds since start, bytes) records, as returned by read_capture.
+            speed (float): Replay speed factor; 1 is real time, 0 is as fast as possible.
+            repeat (bool): Start over at the end of the capture instead of stopping.
+            disconnect_every (float): Drop all clients every this many seconds of replay. Never if None.
+            partial_lines (bool): Split reads at random positions, so lines arrive in pieces.
+            garbage_rate (float): Probability per read of inserting bytes that are not valid UTF-8.
+            seed (int): Seed of the random number generator, so fault injection is reproducible.
+        """
+        self.records = records
+        self.speed = speed
+        self.repeat = repeat
+        self.disconnect_every = disconnect_every
+        self.partial_lines = partial_lines
+        self.garbage_rate = garbage_rate
+        self.rng = random.Random(seed)
+        self.clients = set()
+        self.client_connected = asyncio.Event()
+        self.clients_gone = asyncio.Event()
+        self.server = None
+        self.connections = 0  # Total number of client connections accepted
+        self.disconnects = 0  # Number of injected disconnects
+        self.bytes_sent = 0
+        self.records_missed = 0  # Reads dropped because they were due while no client was connected
+
+    async def start(self, host='127.0.0.1', port=7550):
+        """
+        Starts listening for clients.
+
+        Args:
+            host (str): Address to listen on.
+            port (int): Port to listen on, 0 for any free port.
+
+        Returns:
+            int: The port the server listens on.
+        """
+        self.server = await asyncio.start_server(self._handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle_client(self, reader, writer):
+        self.connections += 1
+        self.clients.add(writer)
+        self.client_connected.set()
+        self.clients_gone.clear()
+        try:
+            while await reader.read(1024):  # Ignore logins and commands, wait for the client to hang up
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            if not self.clients:
+                self.client_connected.clear()
+                self.clients_gone.set()
+            writer.close()
+
+    async def _send(self, data):
+        for writer in list(self.clients):
+            try:
+                for piece in inject_faults(data, self.rng, self.partial_lines, self.garbage_rate):
+                    writer.write(piece)
+                    await writer.drain()
+                self.bytes_sent += len(data)
+            except ConnectionError:
+                self.clients.discard(writer)
+
+    def _drop_clients(self):
+        for writer in list(self.clients):
+            writer.transport.abort()
+        self.clients.clear()
+        self.client_connected.clear()
+        self.disconnects += 1
+
+    async def replay(self):
+        """
+        Plays the capture to the connected clients, once a first client is connected. Reads due while no client
+        is connected are dropped at a paced speed, and waited with when replaying as fast as possible.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.client_connected.wait()
+            started = loop.time()
+            last_disconnect = started
+            for offset, data in self.records:
+                if self.speed > 0:
+                    delay = offset / self.speed - (loop.time() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if self.disconnect_every and loop.time() - last_disconnect >= self.disconnect_every:
+                    self._drop_clients()
+                    last_disconnect = loop.time()
+                if not self.clients:
+                    if self.speed > 0:
+                        self.records_missed += 1  # The feed goes on without the client, as a live cluster's does
+                        continue
+                    await self.client_connected.wait()
+                await self._send(data)
+            if not self.repeat:
+                return
+
+    async def close(self, timeout=10):
+        """
+        Ends the stream, waits for the clients to read the rest and hang up, then stops listening.
+
+        Args:
+            timeout (float): Seconds to wait for the clients before disconnecting them.
+        """
+        for writer in list(self.clients):
+            if writer.can_write_eof():
+                writer.write_eof()
+        if self.clients:
+            try:
+                await asyncio.wait_for(self.clients_gone.wait(), timeout)
+            except asyncio.TimeoutError:
+                self._drop_clients()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def serve(records, host, port, **options):
+    """
+    Runs a replay server until the capture has been played.
+
+    Args:
+        records (list): (seconds since start, bytes) records, as returned by read_capture.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        **options: Replay options passed to ReplayServer.
+    """
+    server = ReplayServer(records, **options)
+    port = await server.start(host, port)
+    logging.info(f"Replaying {len(records)} reads on {host}:{port}")
+    try:
+        await server.replay()
+    finally:
+        await server.close()
+    logging.info(f"Replay finished: {server.bytes_sent} bytes sent over {server.connections} connections, "
+                 f"{server.disconnects} injected disconnects, {server.records_missed} reads missed while "
+                 f"disconnected.")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Replay a DX Cluster capture from a local stand-in server.")
+    parser.add_argument("capture", help="Capture file written by processData.py --capture, or a raw stream")
+    parser.add_argument("-a", "--address", help="Specify the address to listen on. Default = 127.0.0.1",
+                        default="127.0.0.1")
+    parser.add_argument("-p", "--port", help="Specify the port to listen on. Default = 7550", type=int, default=7550)
+    parser.add_argument("-x", "--speed", help="Specify the replay speed factor, 0 for as fast as possible. Default = 1",
+                        type=float, default=1)
+    parser.add_argument("--repeat", help="Start over at the end of the capture", action="store_true")
+    parser.add_argument("--disconnect-every", help="Drop the clients every this many seconds", type=float)
+    parser.add_argument("--partial-lines", help="Split reads at random positions", action="store_true")
+    parser.add_argument("--garbage-rate", help="Probability per read of inserting invalid bytes. Default = 0",
+                        type=float, default=0.0)
+    parser.add_argument("--seed", help="Seed for fault injection. Default = 0", type=int, default=0)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(read_capture(args.capture), args.address, args.port, speed=args.speed, repeat=args.repeat,
+                          disconnect_every=args.disconnect_every, partial_lines=args.partial_lines,
+                          garbage_rate=args.garbage_rate, seed=args.seed))
+    except KeyboardInterrupt:
+        pass
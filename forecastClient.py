@@ -0,0 +1,295 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+MODEL = "us.anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+# Band groups of a forecast, in the order they are shown, and the ratings a band group can get
+BAND_GROUPS = ("Low_Bands", "Medium_Bands", "Upper_Bands", "High_Bands", "Magic_Band")
+RATINGS = ("Poor", "Fair", "Good", "Excellent")
+
+# Output format appended to the prompt. The reply is prefilled with its opening brace, so the model continues a
+# JSON object instead of introducing it.
+OUTPUT_FORMAT = """
+Reply with one JSON object and nothing else, in this exact format:
+{
+    "Summary": "200 word summary of current solar and geomagnetic conditions and their impact on short wave propagation",
+""" + ",\n".join(f'    "{group}": {{"Rating": "{" or ".join(RATINGS)}", "Explanation": "propagation prediction"}}'
+                 for group in BAND_GROUPS) + """
+}
+Escape any double quote inside a string as \\".
+"""
+
+# Retries of a reply that isn't a valid forecast, on top of the first call
+RETRIES = 2
+
+# File the forecasts are cached in between runs and restarts
+CACHE_FILE = "forecast_cache.json"
+
+# Quantization of the cache key: solar flux and sunspot steps, hours per bucket of the UTC day, and the locator
+# characters kept (the 4-character square)
+SFI_STEP = 10
+SUNSPOT_STEP = 20
+HOUR_BUCKET = 3
+LOCATOR_LENGTH = 4
+
+# Seconds a cached forecast is reused for, and the most forecasts cached. The prompt carries the date, time and
+# sunrise/sunset, so a forecast is only reused within its hour bucket of the same day
+CACHE_MAX_AGE = HOUR_BUCKET * 3600
+CACHE_SIZE = 256
+
+
+class ForecastError(ValueError):
+    """
+    The model's reply isn't a valid forecast.
+    """
+
+
+def validate_forecast(data):
+    """
+    Checks a parsed reply against the forecast schema: a non-empty Summary string, and for every band group a
+    Rating out of RATINGS and a non-empty Explanation string. Other keys are dropped.
+
+    Args:
+        data (object): The parsed JSON reply.
+
+    Returns:
+        OrderedDict: The forecast, Summary first and then the band groups in order.
+
+    Raises:
+        ForecastError: If the reply doesn't match the schema.
+    """
+    if not isinstance(data, dict):
+        raise ForecastError(f"expected a JSON object, got {type(data).__name__}")
+    summary = data.get("Summary")
+    if not isinstance(summary, str) or not summary.strip():
+        raise ForecastError("Summary must be a non-empty string")
+
+    forecast = OrderedDict(Summary=summary.strip())
+    for group in BAND_GROUPS:
+        band = data.get(group)
+        if not isinstance(band, dict):
+            raise ForecastError(f"{group} must be an object with Rating and Explanation")
+        rating = band.get("Rating")
+        if rating not in RATINGS:
+            raise ForecastError(f"{group}.Rating must be one of {', '.join(RATINGS)}, got {rating!r}")
+        explanation = band.get("Explanation")
+        if not isinstance(explanation, str) or not explanation.strip():
+            raise ForecastError(f"{group}.Explanation must be a non-empty string")
+        forecast[group] = {"Rating": rating, "Explanation": explanation.strip()}
+    return forecast
+
+
+def parse_forecast(text):
+    """
+    Parses and validates the model's reply. Text around the JSON object, like a code fence, is ignored.
+
+    Args:
+        text (str): The reply, including the prefilled opening brace.
+
+    Returns:
+        OrderedDict: The forecast, as returned by validate_forecast.
+
+    Raises:
+        ForecastError: If the reply isn't a valid forecast.
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start < 0 or end < start:
+        raise ForecastError("no JSON object in the reply")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ForecastError(f"invalid JSON: {e}") from None
+    return validate_forecast(data)
+
+
+def quantize(value, step):
+    """
+    Returns:
+        int or None: value rounded to the nearest multiple of step, None if value is None.
+    """
+    return None if value is None else int(round(value / step)) * step
+
+
+def cache_key(sfi, k_index, sunspots, when, locator):
+    """
+    Builds the cache key of a forecast from its quantized inputs, so nearly identical conditions share a forecast.
+
+    Args:
+        sfi (float): The solar flux index.
+        k_index (float): The K-index, kept whole.
+        sunspots (float): The sunspot number.
+        when (datetime.datetime): The UTC time of the forecast.
+        locator (str): The Maidenhead grid locator of the station.
+
+    Returns:
+        str: The key.
+    """
+    return "|".join([
+        f"sfi={quantize(sfi, SFI_STEP)}",
+        f"k={quantize(k_index, 1)}",
+        f"ssn={quantize(sunspots, SUNSPOT_STEP)}",
+        f"hour={when.hour // HOUR_BUCKET * HOUR_BUCKET}",
+        f"grid={locator.upper()[:LOCATOR_LENGTH]}",
+    ])
+
+
+class FakeClient:
+    """
+    Stand-in for the Anthropic Bedrock client, replying with canned texts in turn, for dry runs without AWS.
+    """
+
+    def __init__(self, replies):
+        """
+        Args:
+            replies (list): The reply texts, without the prefilled opening brace. The last one is repeated.
+        """
+        self.replies = list(replies)
+        self.requests = []  # keyword arguments of every messages.create call
+        self.messages = SimpleNamespace(create=self.create)
+
+    def create(self, **kwargs):
+        """
+        Returns:
+            SimpleNamespace: A message with the next reply as its only content block.
+        """
+        self.requests.append(kwargs)
+        reply = self.replies[min(len(self.requests), len(self.replies)) - 1]
+        return SimpleNamespace(content=[SimpleNamespace(text=reply)])
+
+
+class ForecastClient:
+    """
+    Asks the model for the band forecast as strict JSON and validates the reply, asking again with the validation
+    error when it doesn't fit the schema. Forecasts are cached in memory and on disk by their quantized inputs, so
+    the same conditions reuse a forecast instead of calling the model again.
+    """
+
+    def __init__(self, client=None, model=MODEL, retries=RETRIES, cache_file=CACHE_FILE, max_age=CACHE_MAX_AGE,
+                 cache_size=CACHE_SIZE):
+        """
+        Args:
+            client (object): Client with the messages.create method of anthropic.AnthropicBedrock, like a
+                FakeClient. The shared Bedrock client of awsClients if None.
+            model (str): The model id.
+            retries (int): Calls after the first one when the reply isn't a valid forecast.
+            cache_file (str): File forecasts are cached in between runs. Memory only if None.
+            max_age (float): Seconds a cached forecast is reused for.
+            cache_size (int): Most forecasts cached; the oldest are dropped first.
+        """
+        self.client = client
+        self.model = model
+        self.retries = retries
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # {"created", "forecast"} per cache key, oldest first
+        self.calls = 0  # model calls
+        self.cache_hits = 0  # forecasts served from the cache
+        self.invalid_replies = 0  # replies that weren't a valid forecast
+        self._load()
+
+    def forecast(self, prompt, key=None):
+        """
+        Returns the forecast of a prompt, from the cache if one was made for the same key recently enough.
+
+        Args:
+            prompt (str): The prompt, without the output format, which is appended.
+            key (str): The cache key, as returned by cache_key. Not cached if None.
+
+        Returns:
+            OrderedDict: The forecast, as returned by validate_forecast.
+
+        Raises:
+            ForecastError: If no reply was a valid forecast.
+        """
+        with self.lock:
+            entry = self.cache.get(key) if key is not None else None
+            if entry is not None and time.time() - entry["created"] < self.max_age:
+                self.cache_hits += 1
+                return OrderedDict(entry["forecast"])
+
+        forecast = self._ask(prompt)
+        if key is not None:
+            with self.lock:
+                self.cache.pop(key, None)
+                self.cache[key] = {"created": time.time(), "forecast": forecast}
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+                self._save()
+        return forecast
+
+    def _ask(self, prompt):
+        if self.client is None:
+            from awsClients import get_bedrock_client
+            self.client = get_bedrock_client()
+
+        messages = [{"role": "user", "content": prompt + OUTPUT_FORMAT}, {"role": "assistant", "content": "{"}]
+        for attempt in range(self.retries + 1):
+            self.calls += 1
+            message = self.client.messages.create(model=self.model, messages=messages, temperature=0.1,
+                                                  max_tokens=1500)
+            reply = "{" + message.content[0].text
+            try:
+                return parse_forecast(reply)
+            except ForecastError as e:
+                self.invalid_replies += 1
+                logging.warning(f"Invalid forecast reply, attempt {attempt + 1} of {self.retries + 1}: {e}")
+                error = e
+            # Ask again with the invalid reply and what is wrong with it
+            messages = messages[:1] + [
+                {"role": "assistant", "content": reply},
+                {"role": "user", "content": f"That reply isn't valid: {error}. Reply again with the corrected JSON "
+                                            f"object only."},
+                {"role": "assistant", "content": "{"},
+            ]
+        raise ForecastError(f"no valid forecast after {self.retries + 1} calls: {error}")
+
+    def _load(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, encoding="utf-8") as infile:
+                entries = json.load(infile)
+            for key, entry in entries.items():
+                self.cache[key] = {"created": entry["created"], "forecast": validate_forecast(entry["forecast"])}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable forecast cache {self.cache_file}: {e}")
+            self.cache.clear()
+
+    def _save(self):
+        # Called with the lock held; written to a temporary file and renamed, so a crash never leaves half a cache
+        if self.cache_file is None:
+            return
+        temporary = f"{self.cache_file}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as outfile:
+                json.dump(self.cache, outfile)
+            os.replace(temporary, self.cache_file)
+        except OSError as e:
+            logging.warning(f"Unable to write the forecast cache {self.cache_file}: {e}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Ask for a band forecast, through the forecast cache.")
+    parser.add_argument("prompt", help="The prompt")
+    parser.add_argument("-k", "--key", help="Cache key. Not cached if not given")
+    parser.add_argument("--fake", help="Reply with this JSON file instead of calling Bedrock, e.g. bedrock.json")
+    args = parser.parse_args()
+
+    if args.fake:
+        with open(args.fake, encoding="utf-8") as infile:
+            fake_reply = infile.read().strip()[1:]  # Without the opening brace, as if prefilled
+        forecast_client = ForecastClient(client=FakeClient([fake_reply]), cache_file=None)
+    else:
+        forecast_client = ForecastClient()
+    print(json.dumps(forecast_client.forecast(args.prompt, args.key), indent=4))
@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from awsClients import get_client
+from dbSchema import DB_FILE, connect, setup_database
+
+# File the forecast is handed over in by the file store
+FORECAST_FILE = "bedrock.json"
+
+# S3 key of the forecast
+FORECAST_KEY = "bedrock.json"
+
+# Forecasts kept by the sqlite store, newest first
+KEEP_FORECASTS = 48
+
+# Kinds of store, for the command lines of bedrockAnalysis and analyzeData
+STORES = ("file", "sqlite", "s3")
+
+
+class FileStore:
+    """
+    Keeps the forecast in a local file, versioned by its modification time and size.
+    """
+
+    def __init__(self, path=FORECAST_FILE):
+        """
+        Args:
+            path (str): The forecast file.
+        """
+        self.path = path
+
+    def version(self):
+        """
+        Returns:
+            tuple or None: The version of the stored forecast, None if there is none.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """
+        Returns:
+            tuple: The version and the forecast, (None, None) if there is none.
+        """
+        version = self.version()
+        try:
+            with open(self.path, encoding="utf-8") as infile:
+                return version, json.load(infile)
+        except FileNotFoundError:
+            return None, None
+
+    def save(self, forecast_json):
+        """
+        Stores a forecast, written to a temporary file and renamed so readers never see a partial one.
+
+        Args:
+            forecast_json (str): The forecast JSON.
+        """
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as outfile:
+            outfile.write(forecast_json)
+        os.replace(temporary, self.path)
+
+
+class SqliteStore:
+    """
+    Keeps the recent forecasts in the forecasts table of the spot database, versioned by their id.
+    """
+
+    def __init__(self, db_file=DB_FILE, keep=KEEP_FORECASTS):
+        """
+        Args:
+            db_file (str): SQLite database file name. Its schema is brought up to date.
+            keep (int): Forecasts kept, the older ones are deleted when a new one is stored.
+        """
+        self.db_file = db_file
+        self.keep = keep
+        conn, _ = setup_database(db_file)
+        conn.close()
+
+    def version(self):
+        """
+        Returns:
+            int or None: The id of the newest forecast, None if there is none.
+        """
+        conn = connect(self.db_file)
+        try:
+            return conn.execute('SELECT MAX(id) FROM forecasts').fetchone()[0]
+        finally:
+            conn.close()
+
+    def load(self):
+        """
+        Returns:
+            tuple: The id and the newest forecast, (None, None) if there is none.
+        """
+        conn = connect(self.db_file)
+        try:
+            row = conn.execute('SELECT id, body FROM forecasts ORDER BY id DESC LIMIT 1').fetchone()
+        finally:
+            conn.close()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def save(self, forecast_json):
+        """
+        Stores a forecast as the newest one.
+
+        Args:
+            forecast_json (str): The forecast JSON.
+        """
+        conn = connect(self.db_file)
+        try:
+            with conn:
+                forecast_id = conn.execute('INSERT INTO forecasts (created, body) VALUES (?, ?)',
+                                           (int(time.time()), forecast_json)).lastrowid
+                conn.execute('DELETE FROM forecasts WHERE id <= ?', (forecast_id - self.keep,))
+        finally:
+            conn.close()
+
+
+class S3Store:
+    """
+    Keeps the forecast as an S3 object, versioned by its ETag. For a reader on another host than bedrockAnalysis;
+    checking the version is a HEAD request, and the object is only downloaded when it changed.
+    """
+
+    def __init__(self, bucket, key=FORECAST_KEY):
+        """
+        Args:
+            bucket (str): The bucket name.
+            key (str): The object key.
+        """
+        self.bucket = bucket
+        self.key = key
+
+    def version(self):
+        """
+        Returns:
+            str or None: The ETag of the stored forecast, None if there is none.
+        """
+        try:
+            return get_client('s3').head_object(Bucket=self.bucket, Key=self.key)['ETag']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def load(self):
+        """
+        Returns:
+            tuple: The ETag and the forecast, (None, None) if there is none.
+        """
+        s3_client = get_client('s3')
+        try:
+            response = s3_client.get_object(Bucket=self.bucket, Key=self.key)
+        except s3_client.exceptions.NoSuchKey:
+            return None, None
+        return response['ETag'], json.loads(response['Body'].read().decode('utf-8'))
+
+    def save(self, forecast_json):
+        """
+        Stores a forecast.
+
+        Args:
+            forecast_json (str): The forecast JSON.
+        """
+        get_client('s3').put_object(Bucket=self.bucket, Key=self.key, Body=forecast_json.encode('utf-8'),
+                                    ContentType='application/json; charset=utf-8')
+
+
+def open_store(kind, bucket=None, path=FORECAST_FILE, db_file=DB_FILE):
+    """
+    Opens a forecast store.
+
+    Args:
+        kind (str): One of STORES.
+        bucket (str): The bucket of the s3 store.
+        path (str): The file of the file store.
+        db_file (str): The database of the sqlite store.
+
+    Returns:
+        FileStore or SqliteStore or S3Store: The store.
+    """
+    if kind == "file":
+        return FileStore(path)
+    if kind == "sqlite":
+        return SqliteStore(db_file)
+    if kind == "s3":
+        return S3Store(bucket)
+    raise ValueError(f"Unknown forecast store {kind}, expected one of {', '.join(STORES)}")
+
+
+class ForecastCache:
+    """
+    Keeps the forecast of a store in memory, reloading it only when the store's version changes. The version check is
+    a stat, a one-row query or a HEAD request, depending on the store.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store (FileStore or SqliteStore or S3Store): The store.
+        """
+        self.store = store
+        self.lock = threading.Lock()
+        self.version = None  # version of the forecast in memory
+        self.forecast = None
+        self.checks = 0  # version checks
+        self.loads = 0  # forecasts loaded from the store
+
+    def get(self):
+        """
+        Returns:
+            dict or None: The newest forecast, None if the store has none.
+        """
+        with self.lock:
+            self.checks += 1
+            version = self.store.version()
+            if version is not None and version != self.version:
+                self.version, self.forecast = self.store.load()
+                self.loads += 1
+            return self.forecast
@@ -0,0 +1,94 @@
+import logging
+
+# Default number of bytes requested from the socket per read
+DEFAULT_READ_SIZE = 65536
+
+
+class LineFramer:
+    """
+    Splits a byte stream into blocks of complete lines without re-copying the unconsumed tail on every read.
+
+    Data is received straight into a reusable ``bytearray`` through ``recv_into``. Each read hands back the
+    offsets of the complete lines received so far, so a caller can scan them in place with byte-level
+    patterns and only copy and decode what it actually wants. The partial line left at the end of a read is
+    moved to the front of the buffer only when the free space runs low.
+
+    Byte 0 of the buffer always holds a newline, and data is stored from byte 1, so every line in the buffer,
+    including the first one, is preceded by a newline that patterns can anchor on.
+
+    Offsets returned by ``complete_lines`` are only valid until the next call to ``reserve``.
+    """
+
+    def __init__(self, read_size=DEFAULT_READ_SIZE):
+        """
+        Args:
+            read_size (int): Minimum free space offered to each read. Lines longer than this are discarded.
+        """
+        self.read_size = read_size
+        self.buffer = bytearray(read_size * 2 + 1)
+        self.buffer[0] = ord('\n')
+        self.view = memoryview(self.buffer)
+        self.start = 1  # First byte not yet returned as part of a complete line
+        self.end = 1  # End of the received data
+        self.discarded = 0  # Number of overlong partial lines dropped
+
+    def reserve(self):
+        """
+        Makes room for the next read.
+
+        Returns:
+            memoryview: Writable view of the free space at the end of the buffer, at least ``read_size`` bytes.
+        """
+        if self.start == self.end:
+            self.start = self.end = 1
+        elif len(self.buffer) - self.end < self.read_size:
+            pending = self.end - self.start
+            if pending > len(self.buffer) - 1 - self.read_size:
+                # A "line" this long is noise, not a spot; drop it rather than growing the buffer
+                logging.warning(f"Discarding {pending} bytes without a line break.")
+                self.discarded += 1
+                self.start = self.end = 1
+            else:
+                self.buffer[1:pending + 1] = self.view[self.start:self.end]
+                self.start = 1
+                self.end = pending + 1
+        return self.view[self.end:]
+
+    def commit(self, size):
+        """
+        Records that a read stored ``size`` bytes in the view returned by ``reserve``.
+
+        Args:
+            size (int): Number of bytes received.
+        """
+        self.end += size
+
+    def complete_lines(self):
+        """
+        Returns the block of complete lines received since the last call and marks it consumed.
+
+        Returns:
+            tuple: (start, end) offsets in ``buffer``. The block starts with the newline that precedes its first
+            line and ends with the newline of its last line; it is empty if no line was completed.
+        """
+        last = self.buffer.rfind(b'\n', self.start, self.end)
+        start = self.start - 1
+        if last < 0:
+            return start, start
+        self.start = last + 1
+        return start, last + 1
+
+    async def recv_from(self, loop, sock):
+        """
+        Reads once from a non-blocking socket into the buffer on the event loop.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The running event loop.
+            sock (socket.socket): Connected non-blocking socket to read from.
+
+        Returns:
+            int: Number of bytes received, 0 when the peer closed the connection.
+        """
+        size = await loop.sock_recv_into(sock, self.reserve())
+        self.commit(size)
+        return size
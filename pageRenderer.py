@@ -0,0 +1,200 @@
+import re
+
+import htmlmin
+from jinja2 import Environment
+from markupsafe import Markup
+
+# Background color of each SNR class of the zone table cells, also used by the legend swatches
+SNR_COLORS = {
+    'nodata': '#f0f0f0',
+    'marginal': '#a3cce9',
+    'normal': '#b6e3b5',
+    'above': '#f7c896',
+    'hot': '#e57373',
+}
+
+# Placeholders left in the shell where the parts rendered every cycle go
+SOLAR_SLOT = '@@solar@@'
+TABLES_SLOT = '@@tables@@'
+
+# Styles of the page, the zone table cells colored by SNR class
+STYLE_TEMPLATE = """
+        body { margin: 0; padding: 0; overflow-y: hidden; }
+        html { height: 100%; }
+        {% for name, color in colors.items() %}
+        .{{ name }} { background-color: {{ color }}; }
+        {% endfor %}
+        table.zones { width: 60vw; table-layout: fixed; margin-left: auto; margin-right: auto; }
+        .zones caption { font-size: 13pt; font-weight: bold; }
+        .zones th { font-size: 12pt; word-wrap: break-word; position: sticky; top: 0;
+                    background-color: rgba(255, 255, 255, 0.75); z-index: 1; }
+        .zones td { font-size: 10pt; text-align: center; padding: 4px calc(5px + 1vw); }
+        .zones td:first-child { font-size: 12pt; font-weight: bold; }
+        .solar { position: fixed; left: 2%; padding: 10px; z-index: 1000; font-family: 'Roboto', monospace; }
+        .solar .title { width: 100%; text-align: center; font-weight: bold; margin-bottom: 5px; }
+        .solar .row { display: flex; justify-content: center; align-items: center; width: 100%;
+                      white-space: nowrap; font-weight: bold; margin-bottom: 5px; }
+        .solar .row div { margin-right: 10px; }
+        .solar .row div:last-child { margin-right: 0; }
+        .solar table { width: 60%; margin: 0 auto; border-collapse: collapse; font-size: 15px; }
+        .solar td { padding: 5px; text-align: center; font-weight: bold; white-space: nowrap; position: relative; }
+        .solar .summary { width: 300px; margin: 10px auto; text-align: left; font-size: 12px; color: #333; }
+        .tooltip { position: relative; display: inline-block; cursor: pointer; }
+        .tooltip .tooltiptext { visibility: hidden; width: 450px; background-color: #333; color: #fff;
+                                text-align: left; border-radius: 5px; padding: 8px; position: absolute; z-index: 1;
+                                left: 111%; top: 50%; transform: translateY(-50%); opacity: 0;
+                                transition: opacity 0.3s, transform 0.3s; white-space: normal; font-size: 12px; }
+        .tooltip .tooltiptext::after { content: ""; position: absolute; top: 50%; right: 100%; margin-top: -5px;
+                                       border-width: 5px; border-style: solid;
+                                       border-color: transparent #333 transparent transparent; }
+        .tooltip:hover .tooltiptext { visibility: visible; opacity: 1; }
+        .legend { position: fixed; bottom: 0; left: 50%; transform: translateX(-50%); width: 90%;
+                  background-color: rgba(255, 255, 255, 0.75); font-weight: bold; padding: 10px;
+                  border: 1px solid gray; box-sizing: border-box; z-index: 1000; }
+        .legend .items { display: flex; justify-content: space-around; }
+        .legend .items + .items { margin-top: 10px; }
+        .legend .item { display: flex; align-items: center; margin-right: 20px; font-size: 12pt; }
+        .legend .item:last-child { margin-right: 0; }
+        .legend .swatch { width: 20px; height: 20px; margin-right: 5px; }
+        .legend .symbol { font-size: 20px; margin-right: 5px; }
+"""
+
+# Everything on the page that doesn't change between cycles: styles, layout and legend. Rendered and minified once.
+SHELL_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta http-equiv="refresh" content="{{ refresh }}">
+    <style>{{ style }}</style>
+</head>
+<body>
+<div style="display: flex; width: 100%; height: 100%;">
+    <div class="solar">{{ solar_slot }}</div>
+    <div style="position: relative; flex-grow: 1; padding-left: 160px; overflow-y: auto; font-family: 'Roboto', monospace;">
+        <div style="max-height: 80vh; overflow-y: auto; padding-top: 0.75%; padding-bottom: 10%;">{{ tables_slot }}</div>
+        <div class="legend">
+            <div class="items">
+                <div class="item"><div class="swatch marginal"></div><div>Marginal (≤ -15 dB)</div></div>
+                <div class="item"><div class="swatch normal"></div><div>Normal (-15 to -10 dB)</div></div>
+                <div class="item"><div class="swatch above"></div><div>Above Average (-10 to -3 dB)</div></div>
+                <div class="item"><div class="swatch hot"></div><div>Hot (> -3 dB)</div></div>
+            </div>
+            <div class="items">
+                <div class="item"><div class="symbol">○</div><div>Quiet (≤ {{ sparse }} spots)</div></div>
+                <div class="item"><div class="symbol">◑</div><div>Moderate ({{ sparse + 1 }} to {{ busy - 1 }} spots)</div></div>
+                <div class="item"><div class="symbol">●</div><div>Busy (≥ {{ busy }} spots)</div></div>
+                <div class="item"><div class="symbol">+</div><div>CW spotted</div></div>
+            </div>
+        </div>
+    </div>
+</div>
+</body>
+</html>
+"""
+
+# The templates rendered every cycle are written without whitespace between tags, so their output needs no
+# minification pass
+TABLE_TEMPLATE = (
+    '<table class="zones"><caption>{{ caption }}</caption>'
+    '<thead><tr>{% for header in headers %}<th>{{ header }}</th>{% endfor %}</tr></thead>'
+    '<tbody>{% for row in rows %}<tr>'
+    '{% for css_class, text in row %}<td{% if css_class %} class="{{ css_class }}"{% endif %}>{{ text }}</td>'
+    '{% endfor %}</tr>{% endfor %}</tbody></table>'
+)
+
+SOLAR_TEMPLATE = (
+    '<div class="title">Solar Data by N0NBH</div><hr>'
+    '<div class="row"><div>SFI: {{ solar["SFI"] }}</div><div>SSN: {{ solar["Sunspots"] }}</div></div>'
+    '<div class="row"><div>A: {{ solar["A-Index"] }}</div><div>K: {{ solar["K-Index"] }}</div>'
+    '<div>X: {{ solar["X-Ray"] }}</div></div>'
+    '<div class="row"><div>Aurora: {{ solar["Aurora"] }}</div><div>Lat.: {{ solar["Lat."] }}</div></div><hr>'
+    '<div class="title" style="margin: 10px 0">Band Conditions</div><table><tbody>'
+    '{% for band, rating, color, explanation in bands %}'
+    '<tr><td>{{ band }}</td><td style="color: {{ color }}">'
+    '<span class="tooltip">{{ rating }}<span class="tooltiptext">{{ explanation }}</span></span></td></tr>'
+    '{% endfor %}</tbody></table><div class="summary">{{ summary }}</div>'
+)
+
+
+def minify_css(css):
+    """
+    Strips the whitespace htmlmin leaves in style sheets: around braces, colons, semicolons, commas and child
+    selectors, and runs of it anywhere else. Spaces around '+' are kept, as calc() needs them.
+
+    Args:
+        css (str): The style sheet.
+
+    Returns:
+        str: The minified style sheet.
+    """
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r' ?([{};:,>]) ?', r'\1', css).replace(';}', '}').strip()
+
+
+class PageRenderer:
+    """
+    Renders the zone table page from precompiled Jinja2 templates. The static shell of the page, its styles,
+    layout and legend, is rendered and minified once; every cycle only renders the zone tables and the solar panel
+    into it.
+    """
+
+    def __init__(self, sparse, busy, refresh=60):
+        """
+        Args:
+            sparse (int): Most spots of a quiet zone and band, shown in the legend.
+            busy (int): Fewest spots of a busy zone and band, shown in the legend.
+            refresh (int): Seconds between browser reloads of the page.
+        """
+        environment = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+        style = minify_css(environment.from_string(STYLE_TEMPLATE).render(colors=SNR_COLORS))
+        shell = environment.from_string(SHELL_TEMPLATE).render(
+            refresh=refresh, style=Markup(style), sparse=sparse, busy=busy, solar_slot=SOLAR_SLOT,
+            tables_slot=TABLES_SLOT)
+        shell = htmlmin.minify(shell, remove_empty_space=True, remove_comments=True)
+        self.head, rest = shell.split(SOLAR_SLOT)
+        self.middle, self.tail = rest.split(TABLES_SLOT)
+        self.table_template = environment.from_string(TABLE_TEMPLATE)
+        self.solar_template = environment.from_string(SOLAR_TEMPLATE)
+
+    def render_table(self, caption, headers, rows):
+        """
+        Renders one zone table.
+
+        Args:
+            caption (str): The table caption.
+            headers (list): The column headers.
+            rows (list): The cells of each row, as (CSS class, text) pairs. Cells without a class have an empty one;
+                text that is already markup, like the zone tooltips, is wrapped in markupsafe.Markup.
+
+        Returns:
+            Markup: The HTML of the table.
+        """
+        return Markup(self.table_template.render(caption=caption, headers=headers, rows=rows))
+
+    def render_solar(self, solar_data, bands, summary):
+        """
+        Renders the solar data and band conditions panel.
+
+        Args:
+            solar_data (dict): The solar data, as returned by analyzeData.fetch_solar_data.
+            bands (list): (band name, rating, rating color, explanation) of every band group.
+            summary (str): The summary of the band conditions.
+
+        Returns:
+            Markup: The HTML of the panel.
+        """
+        return Markup(self.solar_template.render(solar=solar_data, bands=bands, summary=summary))
+
+    def render_page(self, solar_html, tables_html):
+        """
+        Fills the shell with the parts rendered this cycle.
+
+        Args:
+            solar_html (str): The HTML of the solar panel, as returned by render_solar.
+            tables_html (str): The HTML of the zone tables.
+
+        Returns:
+            str: The HTML of the page.
+        """
+        return ''.join((self.head, solar_html, self.middle, tables_html, self.tail))
@@ -1,279 +1,332 @@
-import re
 import socket
-import plistlib
-from datetime import datetime, timedelta
-import sqlite3
+import asyncio
 import argparse
 import os
-import select
 import time
 import logging
+from ctyIndex import load_index
+from lineFramer import LineFramer
+from spotParser import SpotParser, DEFAULT_MODES
+from bandPlan import BAND_PLANS, DEFAULT_PLAN, get_band_plan
+from dxReplay import open_capture
+from spotWriter import DB_FILE, DEFAULT_QUEUE_SIZE, QUEUE_POLICIES, SpotWriter, WriterError
+from spotHistory import HistoryCompactor, RAW_RETENTION, MINUTE_RETENTION, HOUR_RETENTION
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# Precompiled regular expression pattern for filtering relevant lines from the DX Cluster data stream
-DX_PATTERN = re.compile(r'(\d+\.\d{1,2})\s+([A-Z0-9/]+)\s+([+-]?\s?\d{1,2})\s*dB\s+\d+\s+(?:FT8|FT4|CW)')
-# old regex for testing purposes. comment out when done using
-# DX_PATTERN = re.compile(r'(\d+\.\d{2})\s+([A-Z0-9/]+)\s+(?:FT8|FT4|CW)\s+([+-]?\s?\d{1,2})\s*dB')
+# Band plan used unless another region is selected
+DEFAULT_BAND_PLAN = get_band_plan(DEFAULT_PLAN)
 
-# SQLite database file name
-DB_FILE = 'callsigns.db'
+# Seconds between checks that the database writer thread is still running
+WRITER_CHECK_INTERVAL = 5
 
 
-def setup_database():
+def get_cq_zone(call_sign, cty_index):
     """
-    Sets up the SQLite database and creates the necessary table if it doesn't exist.
+    Resolve the CQZone for the provided callsign using the compiled cty.plist prefix index.
+
+    Args:
+        call_sign (str): The callsign to be looked up.
+        cty_index (CtyIndex): Prefix index built from cty.plist.
 
     Returns:
-        tuple: Connection and cursor objects for database operations.
+        int or None: CQZone if found, else None.
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    return cty_index.lookup(call_sign)
 
-    # Create table to store callsign information if it doesn't already exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS callsigns (
-            zone INTEGER,
-            band INTEGER,
-            snr INTEGER,
-            timestamp INTEGER,  -- Changed to INTEGER for Unix timestamps
-            spotter TEXT
-        )
-    ''')
 
-    # Enable WAL mode for concurrent reads and writes
-    cursor.execute('PRAGMA journal_mode=WAL;')
-
-    conn.commit()
-    return conn, cursor
-
-
-def insert_batch(cursor, callsign_entries):
+def calculate_band(freq, band_plan=DEFAULT_BAND_PLAN):
     """
-    Inserts a batch of callsign data into the SQLite database.
+    Calculate the ham radio band based on the frequency.
 
     Args:
-        cursor (sqlite3.Cursor): Database cursor object.
-        callsign_entries (list): List of callsign data tuples to be inserted.
-    """
-    cursor.executemany('''
-        INSERT INTO callsigns (zone, band, snr, timestamp, spotter)
-        VALUES (?, ?, ?, ?, ?)
-    ''', callsign_entries)
-
-
-def delete_old_entries(cursor):
-    """
-    Deletes entries older than 15 minutes from the SQLite database to keep the data current.
+        freq (float): The frequency in kilohertz (kHz).
+        band_plan (BandPlan): Band edges of the region the spots are collected in.
 
-    Args:
-        cursor (sqlite3.Cursor): Database cursor object.
+    Returns:
+        int or None: Band number corresponding to the frequency, or None if outside known bands.
     """
-    time_ago = int(datetime.now().timestamp()) - 900  # 15 minutes ago
-    cursor.execute('DELETE FROM callsigns WHERE timestamp <= ?', (time_ago,))
+    return band_plan.band(freq)
 
 
-def get_cq_zone(call_sign, cty_list):
+async def connect(host, port):
     """
-    Search through the cty.plist file to find CQZone information for the provided callsign.
+    Open a non-blocking TCP connection to a DX Cluster server on the running event loop.
 
     Args:
-        call_sign (str): The callsign to be looked up.
-        cty_list (dict): Dictionary containing callsign to CQZone mappings.
+        host (str): The hostname or IP address of the DX Cluster server.
+        port (int): The port number to connect to.
 
     Returns:
-        int or None: CQZone if found, else None.
+        socket.socket: Connected non-blocking socket object.
     """
-    original_call_sign = call_sign  # Keep the original callsign for reference
-    while len(call_sign) >= 1 and call_sign not in cty_list:
-        call_sign = call_sign[:-1]
-    if len(call_sign) == 0:
-        return None
-    else:
-        return cty_list[call_sign]["CQZone"]
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    family, socktype, proto, _, address = infos[0]
+    s = socket.socket(family, socktype, proto)
+    s.setblocking(False)
+    try:
+        await loop.sock_connect(s, address)
+    except BaseException:
+        s.close()
+        raise
+    return s
 
 
-def calculate_band(freq):
+def enhance_spot(spot, cty_index, band_plan, current_timestamp):
     """
-    Calculate the ham radio band based on the frequency.
+    Enhance a parsed spot with its CQ zone and band into a callsign entry for the database.
 
     Args:
-        freq (float): The frequency in kilohertz (kHz).
+        spot (Spot): Spot parsed from the DX Cluster stream.
+        cty_index (CtyIndex): Prefix index built from cty.plist.
+        band_plan (BandPlan): Band edges of the region the spots are collected in.
+        current_timestamp (int): Unix time at which the spot was received.
 
     Returns:
-        int or None: Band number corresponding to the frequency, or None if outside known bands.
+        tuple or None: (zone, band, snr, timestamp, spotter, mode) entry, or None if the zone or band is unknown.
     """
-    if 1800 <= freq <= 2000:
-        return 160
-    elif 3500 <= freq <= 4000:
-        return 80
-    elif 7000 <= freq <= 7300:
-        return 40
-    elif 10100 <= freq <= 10150:
-        return 30
-    elif 14000 <= freq <= 14350:
-        return 20
-    elif 18068 <= freq <= 18168:
-        return 17
-    elif 21000 <= freq <= 21450:
-        return 15
-    elif 24890 <= freq <= 24990:
-        return 12
-    elif 28000 <= freq <= 29700:
-        return 10
-    elif 50000 <= freq <= 54000:
-        return 6
+    cq_zone = get_cq_zone(spot.call_sign, cty_index)
+    band = calculate_band(spot.frequency, band_plan)
+
+    if band and cq_zone:  # Skip invalid entries
+        return cq_zone, band, spot.snr, current_timestamp, spot.spotter, spot.mode
     return None
 
 
-def reconnect(host, port, max_retries=10):
+async def follow_cluster(host, port, parser, cty_index, band_plan, writer, capture_dir=None, initial_backoff=5,
+                         max_backoff=300):
     """
-    Attempt to reconnect to the DX Cluster server using an exponential backoff strategy.
+    Keep one DX Cluster connection open, feeding the spots of the tracked spotters to the shared writer.
+    Reconnects with exponential backoff whenever the connection fails or is closed by the server.
 
     Args:
         host (str): The hostname or IP address of the DX Cluster server.
         port (int): The port number to connect to.
-        max_retries (int): Maximum number of reconnection attempts.
-
-    Returns:
-        socket.socket: Connected socket object, or None if all attempts fail.
+        parser (SpotParser): Parser for the spot lines of the tracked spotters and modes.
+        cty_index (CtyIndex): Prefix index built from cty.plist.
+        band_plan (BandPlan): Band edges of the region the spots are collected in.
+        writer (SpotWriter): Shared writer the entries are queued on.
+        capture_dir (str): Directory to record the raw stream of each connection to. Not recorded if None.
+        initial_backoff (float): Wait in seconds before the first reconnection attempt.
+        max_backoff (float): Upper bound in seconds for the wait between reconnection attempts.
     """
-    retries = 0
-    backoff_time = 5  # Start with 5 seconds of wait time, then double for each retry
+    loop = asyncio.get_running_loop()
+    backoff_time = initial_backoff  # Double the wait time for each retry, reset once connected
 
-    while retries < max_retries:
+    while True:
+        s = None
+        capture = None
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((host, port))  # Try reconnecting
-            s.setblocking(0)  # Set socket to non-blocking mode
-            logging.info(f"Reconnected to {host}:{port}")
-            return s
-        except (socket.error, socket.timeout) as e:
-            retries += 1
-            logging.error(f"Reconnection attempt {retries} failed. Error: {e}")
+            s = await connect(host, port)
+            logging.info(f"Connected to {host}:{port}")
+            backoff_time = initial_backoff
+            if capture_dir:
+                capture = open_capture(capture_dir, host, port)
+
+            # for testing purposes -- comment out or delete when not in use
+            # await loop.sock_sendall(s, b'LZ3NY\n')
+            # await loop.sock_sendall(s, b'SET/SKIMMER\nSET/NORTTY\nSET/FT4\nSET/FT8\nSET/CW\n')
+
+            framer = LineFramer()  # Reusable receive buffer; a partial line is dropped on reconnect
+            buffer = framer.buffer
+            parse = parser.parse
+            while True:
+                size = await framer.recv_from(loop, s)
+                if not size:
+                    logging.info(f"Connection closed by server {host}:{port}.")
+                    break
+                if capture:
+                    capture.write(framer.view[framer.end - size:framer.end])
+
+                current_timestamp = int(time.time())  # Use Unix time as an integer
+                start, end = framer.complete_lines()
+                for spot in parse(buffer, start, end):  # Process all complete lines
+                    entry = enhance_spot(spot, cty_index, band_plan, current_timestamp)
+                    if entry and not writer.offer(entry):
+                        # The queue is full under the block policy: wait for room off the event loop, so only this
+                        # connection stops reading while the other connections and the writer watch keep running
+                        await asyncio.to_thread(writer.add, entry)
+
+                # sock_recv_into returns without suspending while data is already buffered, so yield explicitly
+                # to keep a busy connection from starving the other connections and the writer
+                await asyncio.sleep(0)
+        except OSError as e:
+            logging.error(f"Socket error on {host}:{port}: {e}")
+        finally:
+            if s is not None:
+                s.close()
+            if capture is not None:
+                capture.close()
+
+        logging.info(f"Reconnecting to {host}:{port} in {backoff_time} seconds...")
+        await asyncio.sleep(backoff_time)
+        backoff_time = min(backoff_time * 2, max_backoff)  # Exponential backoff: double the wait time
+
+
+async def watch_writer(writer, interval=WRITER_CHECK_INTERVAL):
+    """
+    Check that the writer thread is still running, so ingest stops when it does even while no spots arrive.
+
+    Args:
+        writer (SpotWriter): Shared writer the entries are queued on.
+        interval (float): Seconds between checks.
 
-            if retries >= max_retries:
-                logging.error("Max retries reached. Exiting.")
-                raise Exception("Unable to reconnect after multiple attempts.")
+    Raises:
+        WriterError: Once the writer thread has stopped.
+    """
+    while True:
+        writer.check()
+        await asyncio.sleep(interval)
 
-            logging.info(f"Retrying in {backoff_time} seconds...")
-            time.sleep(backoff_time)
-            backoff_time *= 2  # Exponential backoff: double the wait time
 
-    return None  # In case the loop exits without success
+async def ingest(clusters, spotters, cty_index, modes=DEFAULT_MODES, band_plan=DEFAULT_BAND_PLAN, capture_dir=None,
+                 queue_size=DEFAULT_QUEUE_SIZE, queue_policy='drop_oldest', retention=None):
+    """
+    Follow every DX Cluster connection concurrently and store their spots through one shared writer, while
+    a background compactor rolls them up into the long-term history.
 
+    Args:
+        clusters (list): (host, port) tuples of the DX Cluster servers to connect to.
+        spotters (list): Identifiers of the spotters to track on every connection.
+        cty_index (CtyIndex): Prefix index built from cty.plist.
+        modes (iterable): Modes to store, out of FT8, FT4 and CW.
+        band_plan (BandPlan): Band edges of the region the spots are collected in.
+        capture_dir (str): Directory to record the raw stream of each connection to. Not recorded if None.
+        queue_size (int): Maximum number of entries waiting for the database writer.
+        queue_policy (str): What to do when the writer queue is full, one of QUEUE_POLICIES.
+        retention (dict): raw_retention, minute_retention and hour_retention of the history, in seconds.
+    """
+    # The SQLite connection is owned by the writer thread; the event loop only queues entries
+    writer = SpotWriter(DB_FILE, cty_index, queue_size=queue_size, policy=queue_policy)
+    writer.start()  # Opens the database and brings its schema up to date
+    compactor = HistoryCompactor(DB_FILE, **(retention or {}))
+    compactor.start()
+    parser = SpotParser(spotters, modes)
+
+    cluster_tasks = [
+        asyncio.create_task(follow_cluster(host, port, parser, cty_index, band_plan, writer, capture_dir))
+        for host, port in clusters
+    ]
+    # A writer that stopped would leave every connection queueing spots nobody stores; stop the service instead
+    cluster_tasks.append(asyncio.create_task(watch_writer(writer)))
 
-def run(host, port, spotter):
+    try:
+        done, _ = await asyncio.wait(cluster_tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            try:
+                task.result()  # Surface the error that stopped the service
+            except WriterError as e:
+                logging.error(f"Stopping, the database writer failed: {e.__cause__ or e}")
+                raise
+    finally:
+        # Stop reading first, then let the writer store what is still queued before closing the database
+        for task in cluster_tasks:
+            task.cancel()
+        await asyncio.gather(*cluster_tasks, return_exceptions=True)
+        await asyncio.to_thread(writer.close)
+        logging.info(f"Writer stopped: {writer.stats()}")
+        await asyncio.to_thread(compactor.close)  # Rolls up the spots the writer stored last
+
+
+def run(clusters, spotters, modes=DEFAULT_MODES, band_plan=DEFAULT_BAND_PLAN, capture_dir=None,
+        queue_size=DEFAULT_QUEUE_SIZE, queue_policy='drop_oldest', retention=None):
     """
-    Main function to connect to the DX Cluster, receive, process data, and store it in the SQLite database.
+    Main function to connect to the DX Clusters, receive, process data, and store it in the SQLite database.
     Handles connection timeouts, data processing, and reconnection attempts.
 
     Args:
-        host (str): The hostname or IP address of the DX Cluster server.
-        port (int): The port number to connect to.
-        spotter (str): Identifier of the spotter to track.
+        clusters (list): (host, port) tuples of the DX Cluster servers to connect to.
+        spotters (list): Identifiers of the spotters to track.
+        modes (iterable): Modes to store, out of FT8, FT4 and CW.
+        band_plan (BandPlan): Band edges of the region the spots are collected in.
+        capture_dir (str): Directory to record the raw stream of each connection to. Not recorded if None.
+        queue_size (int): Maximum number of entries waiting for the database writer.
+        queue_policy (str): What to do when the writer queue is full, one of QUEUE_POLICIES.
+        retention (dict): raw_retention, minute_retention and hour_retention of the history, in seconds.
     """
-    last_update_time = datetime.now().timestamp()
-
-    # Load the cty.plist file with callsign information
+    # Open the compiled cty.plist snapshot, rebuilding it if cty.plist changed
     try:
-        with open("cty.plist", 'rb') as infile:
-            cty_list = plistlib.load(infile, dict_type=dict)
+        cty_index = load_index("cty.plist", "cty.idx")
     except FileNotFoundError:
         logging.error(f"Error: cty.plist not found.")
         return
 
-    # Establish the initial socket connection
-    s = reconnect(host, port)
-
-    # for testing purposes -- comment out or delete when not in use
-    # s.sendall(b'LZ3NY\n')
-    # s.sendall(b'SET/SKIMMER\nSET/NORTTY\nSET/FT4\nSET/FT8\nSET/CW\n')
-
-    # Set up the SQLite database
-    conn, cursor = setup_database()
-
-    buffer = ""  # Buffer to store incoming data
-    processed_entry_count = 0  # Track how many valid entries are processed between updates
-    callsign_entries = []  # List to hold data entries before inserting into the database
-
-    while True:
-        now = datetime.now()  # Cache the current time
-        ready_to_read, _, _ = select.select([s], [], [], 1)  # Wait up to 1 second for data
-
-        if ready_to_read:
-            try:
-                data = s.recv(1024).decode()  # Non-blocking read, only if data is available
-
-                if not data:
-                    logging.info("Connection closed by server.")
-                    s = reconnect(host, port)  # Reconnect if the connection is closed
-                    continue
-
-                buffer += data  # Append the received data to the buffer
-
-            except UnicodeDecodeError as e:
-                logging.error(f"Decoding error: {e}")
-                continue
-            except socket.error as e:
-                logging.error(f"Socket error: {e}. Reconnecting...")
-                s = reconnect(host, port)
-                continue
-
-            # Split the buffer by newlines; the last part may be incomplete
-            lines = buffer.split('\n')
-            buffer = lines[-1]  # Save the incomplete line back to the buffer
-
-            for line in lines[:-1]:  # Process all complete lines
-                spotter_string = spotter + "-#:"  # Identify the specific spotter in the line
-                if ((" FT4 " in line) or (" FT8 " in line)) and spotter_string in line:
-                    current_timestamp = int(now.timestamp())  # Use Unix time as an integer
-
-                    match = DX_PATTERN.search(line)  # Use the precompiled regex
-
-                    if match:
-                        frequency = match.group(1)
-                        call_sign = match.group(2)
-                        snr = match.group(3).replace(" ", "")
-                        cq_zone = get_cq_zone(call_sign, cty_list)
-                        band = calculate_band(float(frequency))
-
-                        if band and cq_zone and snr:  # Skip invalid entries
-                            # Add the enhanced callsign info to the callsign_entries list
-                            callsign_entries.append((cq_zone, band, snr, current_timestamp, spotter))
-
-                            processed_entry_count += 1  # Increment the count of valid entries processed
+    try:
+        asyncio.run(ingest(clusters, spotters, cty_index, modes, band_plan, capture_dir, queue_size, queue_policy,
+                           retention))
+    except KeyboardInterrupt:
+        logging.info("Stopped.")
 
-        # Every 500 lines or 30 seconds, update the database with the new info
-        if ((processed_entry_count >= 500) or (now.timestamp() - last_update_time > 30)) and callsign_entries:
-            insert_batch(cursor, callsign_entries)
-            delete_old_entries(cursor)  # Keep the database size manageable
-            conn.commit()  # Commit the changes
 
-            last_update_time = now.timestamp()
+def parse_cluster(value):
+    """
+    Parse a HOST:PORT command line value.
 
-            # Get the current time and print it along with the update message
-            current_time = now.strftime("%Y-%m-%d %H:%M:%S")
-            logging.info(f"Database updated on {current_time}. Processed {processed_entry_count} total entries.")
+    Args:
+        value (str): The DX Cluster address, with the port after the last colon.
 
-            # Reset entry count and list after each update
-            processed_entry_count = 0
-            callsign_entries = []
+    Returns:
+        tuple: (host, port) of the DX Cluster server.
+    """
+    host, sep, port = value.rpartition(':')
+    if not sep or not host:
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got {value!r}")
+    try:
+        return host, int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port in {value!r}")
 
 
 if __name__ == '__main__':
     # Argument parser for command-line options
     parser = argparse.ArgumentParser(
-        description="Connect to a DX Cluster, collect spotted callsigns, and store them in an SQLite database.")
+        description="Connect to DX Clusters, collect spotted callsigns, and store them in an SQLite database.")
     parser.add_argument("-a", "--address", help="Specify hostname/address of the DX Cluster",
                         default=os.getenv("DX_CLUSTER_HOST", "100.68.66.71"))
     parser.add_argument("-p", "--port", help="Specify port for the DX Cluster", type=int,
                         default=int(os.getenv("DX_CLUSTER_PORT", 7550)))
-    parser.add_argument("-s", "--spotter", help="Specify the spotter name to track",
+    parser.add_argument("-c", "--cluster", help="Specify a DX Cluster as HOST:PORT, replacing -a/-p. Can be repeated",
+                        type=parse_cluster, action="append", default=[])
+    parser.add_argument("-s", "--spotter", help="Specify the spotter name(s) to track, separated by commas",
                         default=os.getenv("SPOTTER_NAME", "VE3EID"))
+    parser.add_argument("-m", "--modes", help="Specify the modes to store, separated by commas. Add CW, e.g. "
+                                              "FT8,FT4,CW, for analyzeData.py to mark the cells where CW was spotted "
+                                              "with '+'; CW spots are then counted in the tables too. "
+                                              "Default = FT8,FT4",
+                        default=os.getenv("SPOT_MODES", ",".join(DEFAULT_MODES)))
+    parser.add_argument("-b", "--band-plan", help=f"Specify the IARU region band plan. Default = {DEFAULT_PLAN}",
+                        choices=sorted(BAND_PLANS), default=os.getenv("BAND_PLAN", DEFAULT_PLAN))
+    parser.add_argument("--capture", help="Record the raw stream of each connection to timestamped files in this "
+                                          "directory, for replay with dxReplay.py")
+    parser.add_argument("--queue-size", help=f"Specify the maximum number of spots waiting for the database writer. "
+                                             f"Default = {DEFAULT_QUEUE_SIZE}", type=int,
+                        default=int(os.getenv("QUEUE_SIZE", DEFAULT_QUEUE_SIZE)))
+    parser.add_argument("--queue-policy", help="Specify what to do with new spots when the writer queue is full: "
+                                               "block reading the connection that filled it, drop the newest or drop "
+                                               "the oldest. "
+                                               "Default = drop_oldest",
+                        choices=QUEUE_POLICIES, default=os.getenv("QUEUE_POLICY", "drop_oldest"))
+    parser.add_argument("--raw-retention", help=f"Specify how many minutes raw spots are kept. "
+                                                f"Default = {RAW_RETENTION // 60}", type=float,
+                        default=float(os.getenv("RAW_RETENTION", RAW_RETENTION // 60)))
+    parser.add_argument("--minute-retention", help=f"Specify how many days per-minute history is kept. "
+                                                   f"Default = {MINUTE_RETENTION // 86400}", type=float,
+                        default=float(os.getenv("MINUTE_RETENTION", MINUTE_RETENTION // 86400)))
+    parser.add_argument("--hour-retention", help=f"Specify how many days per-hour history is kept. "
+                                                 f"Default = {HOUR_RETENTION // 86400}", type=float,
+                        default=float(os.getenv("HOUR_RETENTION", HOUR_RETENTION // 86400)))
 
     args = parser.parse_args()
+    clusters = args.cluster or [(args.address, args.port)]
+    spotters = [spotter.strip() for spotter in args.spotter.split(',') if spotter.strip()]
+
+    modes = [mode.strip().upper() for mode in args.modes.split(',') if mode.strip()]
 
     # Run the main function with provided arguments
-    run(args.address, args.port, args.spotter)
+    retention = {"raw_retention": int(args.raw_retention * 60),
+                 "minute_retention": int(args.minute_retention * 86400),
+                 "hour_retention": int(args.hour_retention * 86400)}
+    run(clusters, spotters, modes, get_band_plan(args.band_plan), args.capture, args.queue_size, args.queue_policy,
+        retention)
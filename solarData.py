@@ -0,0 +1,249 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from awsClients import http_get
+
+SOLAR_URL = "https://www.hamqsl.com/solarxml.php"
+
+# File both daemons share the fetched XML through, so each fetch serves every process
+CACHE_FILE = "solar_cache.json"
+
+# Seconds the XML is served without revalidation. N0NBH updates it every few hours
+TTL = 1800
+
+# Seconds after a failed fetch before the next attempt, while the stale XML keeps being served
+RETRY = 120
+
+# Band groups of the calculated conditions
+CONDITION_BANDS = ("80m-40m", "30m-20m", "17m-15m", "12m-10m")
+
+# Solar and geomagnetic data of the hamqsl.com widget. Numbers are int or float, None where the feed has no
+# number; conditions maps each band group to its "Day" and "Night" rating.
+SolarData = namedtuple('SolarData', ['updated', 'sfi', 'sunspots', 'a_index', 'k_index', 'xray', 'signal_noise',
+                                     'aurora', 'aurora_latitude', 'helium_line', 'proton_flux', 'electron_flux',
+                                     'solar_wind', 'bz', 'conditions'])
+
+
+def parse_number(text):
+    """
+    Returns:
+        int or float or None: The number in text, None if there is none.
+    """
+    if text is None:
+        return None
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_solar_xml(xml_data):
+    """
+    Parses the hamqsl.com solar widget XML.
+
+    Args:
+        xml_data (bytes or str): The XML.
+
+    Returns:
+        SolarData: The solar data.
+    """
+    root = ET.fromstring(xml_data)
+
+    def text(tag):
+        value = root.findtext(f"solardata/{tag}")
+        return value.strip() if value is not None else None
+
+    def number(tag):
+        return parse_number(root.findtext(f"solardata/{tag}"))
+
+    conditions = {band: {"Day": "", "Night": ""} for band in CONDITION_BANDS}
+    for band in root.findall("solardata/calculatedconditions/band"):
+        name = band.get("name")
+        period = (band.get("time") or "").capitalize()
+        if name in conditions and period in conditions[name]:
+            conditions[name][period] = (band.text or "").strip()
+
+    return SolarData(
+        updated=text("updated"),
+        sfi=number("solarflux"),
+        sunspots=number("sunspots"),
+        a_index=number("aindex"),
+        k_index=number("kindex"),
+        xray=text("xray"),
+        signal_noise=text("signalnoise"),
+        aurora=number("aurora"),
+        aurora_latitude=number("latdegree"),
+        helium_line=number("heliumline"),
+        proton_flux=number("protonflux"),
+        electron_flux=number("electonflux"),  # sic, the feed's tag
+        solar_wind=number("solarwind"),
+        bz=number("magneticfield"),
+        conditions=conditions,
+    )
+
+
+class SolarProvider:
+    """
+    Serves the hamqsl.com solar data from an in-memory and on-disk TTL cache. Stale data is served at once while a
+    background thread revalidates it with a conditional request, so callers never wait on the feed once it was
+    fetched, by this process or another one sharing the cache file.
+    """
+
+    def __init__(self, url=SOLAR_URL, cache_file=CACHE_FILE, ttl=TTL, retry=RETRY):
+        """
+        Args:
+            url (str): The URL of the solar XML.
+            cache_file (str): File the XML is cached in between processes and restarts. Memory only if None.
+            ttl (float): Seconds the XML is served without revalidation.
+            retry (float): Seconds after a failed fetch before the next attempt.
+        """
+        self.url = url
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.retry = retry
+        self.lock = threading.Lock()
+        self.entry = None  # {"fetched", "etag", "last_modified", "xml"} of the cached XML
+        self.data = None  # SolarData parsed from the cached XML
+        self.loaded_mtime = None  # modification time of the cache file when it was last read or written
+        self.next_attempt = 0.0  # time.time() before which no fetch is attempted after a failure
+        self.refreshing = None  # Thread revalidating the cache, if one is running
+        self.hits = 0  # get calls served from the cache while fresh
+        self.stale_hits = 0  # get calls served stale while revalidating
+        self.fetches = 0  # fetches returning new XML
+        self.not_modified = 0  # fetches answered 304 Not Modified
+        self.errors = 0  # fetches that failed
+        self._load()
+
+    def get(self, block=False):
+        """
+        Returns the solar data. Fresh data is returned from the cache. Stale data is returned at once, and
+        revalidated in the background unless block is set. Only without any cached data does the call wait for the
+        fetch.
+
+        Args:
+            block (bool): Revalidate stale data before returning, falling back to the stale data if that fails.
+
+        Returns:
+            SolarData or None: The solar data, None if it was never fetched and can't be.
+        """
+        with self.lock:
+            self._reload_if_newer()
+            age = time.time() - self.entry["fetched"] if self.entry is not None else None
+            if age is not None and age < self.ttl:
+                self.hits += 1
+                return self.data
+            if self.data is not None and not block:
+                self.stale_hits += 1
+                self._start_refresh()
+                return self.data
+        self.refresh()
+        return self.data
+
+    def refresh(self):
+        """
+        Fetches the XML if it changed since it was cached, conditionally on its ETag and Last-Modified, unless
+        the last attempt failed less than retry seconds ago.
+        """
+        with self.lock:
+            if time.time() < self.next_attempt:
+                return
+            headers = {}
+            if self.entry is not None:
+                if self.entry.get("etag"):
+                    headers["If-None-Match"] = self.entry["etag"]
+                if self.entry.get("last_modified"):
+                    headers["If-Modified-Since"] = self.entry["last_modified"]
+
+        try:
+            response = http_get(self.url, headers=headers)
+            if response.status_code == 304 and self.entry is not None:
+                entry = dict(self.entry, fetched=time.time())
+                data = self.data
+            else:
+                response.raise_for_status()
+                data = parse_solar_xml(response.content)
+                entry = {"fetched": time.time(), "etag": response.headers.get("ETag"),
+                         "last_modified": response.headers.get("Last-Modified"),
+                         "xml": response.content.decode("utf-8", errors="replace")}
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+                self.next_attempt = time.time() + self.retry
+            logging.warning(f"Solar data fetch from {self.url} failed: {e}")
+            return
+
+        with self.lock:
+            if response.status_code == 304:
+                self.not_modified += 1
+            else:
+                self.fetches += 1
+            self.entry, self.data = entry, data
+            self.next_attempt = 0.0
+            self._save()
+
+    def _start_refresh(self):
+        # Called with the lock held
+        if self.refreshing is not None and self.refreshing.is_alive():
+            return
+        if time.time() < self.next_attempt:
+            return
+        self.refreshing = threading.Thread(target=self.refresh, name='solar-refresh', daemon=True)
+        self.refreshing.start()
+
+    def _load(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, encoding="utf-8") as infile:
+                entry = json.load(infile)
+            data = parse_solar_xml(entry["xml"])
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable solar data cache {self.cache_file}: {e}")
+            return
+        self.entry, self.data = entry, data
+        self.loaded_mtime = os.path.getmtime(self.cache_file)
+
+    def _reload_if_newer(self):
+        # Another process sharing the cache file may have fetched newer XML; called with the lock held
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        if os.path.getmtime(self.cache_file) != self.loaded_mtime:
+            self._load()
+
+    def _save(self):
+        # Written to a temporary file and renamed, so the other process never reads a partial file
+        if self.cache_file is None:
+            return
+        temporary = f"{self.cache_file}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as outfile:
+                json.dump(self.entry, outfile)
+            os.replace(temporary, self.cache_file)
+            self.loaded_mtime = os.path.getmtime(self.cache_file)
+        except OSError as e:
+            logging.warning(f"Unable to write the solar data cache {self.cache_file}: {e}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Fetch the solar data through the shared cache and print it.")
+    parser.add_argument("-u", "--url", help=f"Solar XML URL. Default = {SOLAR_URL}", default=SOLAR_URL)
+    parser.add_argument("--cache", help=f"Cache file. Default = {CACHE_FILE}", default=CACHE_FILE)
+    parser.add_argument("--refresh", help="Revalidate the cached data first", action="store_true")
+    args = parser.parse_args()
+
+    provider = SolarProvider(args.url, args.cache, ttl=0 if args.refresh else TTL)
+    solar = provider.get(block=True)
+    print(json.dumps(solar._asdict() if solar else None, indent=4))
@@ -0,0 +1,306 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from dbSchema import DB_FILE, connect, setup_database, table_exists
+from spotStats import mean_from_sums, std_from_sums, slope_from_sums
+
+# Default retention of each tier, in seconds
+RAW_RETENTION = 900  # Raw spots, the window analyzeData works on
+MINUTE_RETENTION = 7 * 86400
+HOUR_RETENTION = 365 * 86400
+
+# Seconds between compactions
+COMPACT_INTERVAL = 60
+
+# Seconds an hour is left open after it ends, for spots still waiting in the writer queue
+SETTLE = 300
+
+# Rollup table and bucket length in seconds of each tier
+TIERS = {
+    'minute': ('spots_minute', 60),
+    'hour': ('spots_hour', 3600),
+}
+
+# Statistics of one zone and band over a time window
+HistoryStats = namedtuple('HistoryStats', ['zone', 'band', 'count', 'mean', 'std', 'slope'])
+
+# Upsert clause adding the sums of new spots to an existing rollup row
+ROLLUP_UPDATE = '''
+    ON CONFLICT (bucket, spotter, zone, band) DO UPDATE SET
+        n = n + excluded.n,
+        snr_sum = snr_sum + excluded.snr_sum,
+        snr_sq_sum = snr_sq_sum + excluded.snr_sq_sum,
+        t_sum = t_sum + excluded.t_sum,
+        t_sq_sum = t_sq_sum + excluded.t_sq_sum,
+        t_snr_sum = t_snr_sum + excluded.t_snr_sum
+'''
+
+
+def get_progress(cursor, tier):
+    """
+    Returns:
+        int: The compactor's position in a tier, 0 if it never ran.
+    """
+    row = cursor.execute('SELECT position FROM rollup_progress WHERE tier = ?', (tier,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_progress(cursor, tier, position):
+    """
+    Records the compactor's position in a tier.
+    """
+    cursor.execute('INSERT INTO rollup_progress (tier, position) VALUES (?, ?) '
+                   'ON CONFLICT (tier) DO UPDATE SET position = excluded.position', (tier, position))
+
+
+def compact(conn, now=None, raw_retention=RAW_RETENTION, minute_retention=MINUTE_RETENTION,
+            hour_retention=HOUR_RETENTION, settle=SETTLE):
+    """
+    Runs one compaction pass in a single transaction: rolls the new raw spots into the minute tier and the
+    settled hours of the minute tier into the hour tier, then applies the retention of every tier.
+
+    Raw spots are tracked by id, so each one is rolled up exactly once, and only spots already rolled up are
+    deleted. Rollups are additive, so a minute or hour that receives more spots later is simply updated.
+
+    Args:
+        conn (sqlite3.Connection): Database connection object.
+        now (int): Unix time of the pass. Defaults to now.
+        raw_retention (int): Seconds raw spots are kept.
+        minute_retention (int): Seconds minute rollups are kept.
+        hour_retention (int): Seconds hour rollups are kept.
+        settle (int): Seconds after its end before an hour is rolled up.
+
+    Returns:
+        dict: Rollup rows written per tier and rows deleted per tier.
+    """
+    now = int(time.time()) if now is None else int(now)
+    with conn:
+        cursor = conn.cursor()
+        last_id = get_progress(cursor, 'minute')
+        max_id = cursor.execute('SELECT MAX(id) FROM callsigns').fetchone()[0] or last_id
+        cursor.execute('''
+            INSERT INTO spots_minute (bucket, spotter, zone, band, n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum)
+            SELECT bucket, spotter, zone, band, COUNT(*), SUM(snr), SUM(snr * snr), SUM(t), SUM(t * t), SUM(t * snr)
+            FROM (SELECT timestamp - timestamp % 60 AS bucket, timestamp % 60 AS t, spotter, zone, band, snr
+                  FROM callsigns WHERE id > ? AND id <= ?)
+            GROUP BY bucket, spotter, zone, band
+        ''' + ROLLUP_UPDATE, (last_id, max_id))
+        minute_rows = cursor.rowcount
+        set_progress(cursor, 'minute', max_id)
+
+        # Shift the time sums of each minute from the start of the minute to the start of its hour
+        hour_start = get_progress(cursor, 'hour')
+        hour_end = (now - settle) - (now - settle) % 3600
+        hour_rows = 0
+        if hour_end > hour_start:
+            cursor.execute('''
+                INSERT INTO spots_hour (bucket, spotter, zone, band, n, snr_sum, snr_sq_sum, t_sum, t_sq_sum,
+                                        t_snr_sum)
+                SELECT bucket - shift, spotter, zone, band, SUM(n), SUM(snr_sum), SUM(snr_sq_sum),
+                    SUM(t_sum + n * shift), SUM(t_sq_sum + 2 * shift * t_sum + n * shift * shift),
+                    SUM(t_snr_sum + shift * snr_sum)
+                FROM (SELECT *, bucket % 3600 AS shift FROM spots_minute WHERE bucket >= ? AND bucket < ?)
+                GROUP BY bucket - shift, spotter, zone, band
+            ''' + ROLLUP_UPDATE, (hour_start, hour_end))
+            hour_rows = cursor.rowcount
+            set_progress(cursor, 'hour', hour_end)
+            hour_start = hour_end
+
+        # The newest raw spot is always kept, so ids keep growing and are never reused for new spots
+        raw_deleted = cursor.execute('DELETE FROM callsigns WHERE timestamp <= ? AND id < ?',
+                                     (now - raw_retention, max_id)).rowcount
+        minutes_deleted = cursor.execute('DELETE FROM spots_minute WHERE bucket < ?',
+                                         (min(now - minute_retention, hour_start),)).rowcount
+        hours_deleted = cursor.execute('DELETE FROM spots_hour WHERE bucket < ?', (now - hour_retention,)).rowcount
+
+    return {"minute_rows": minute_rows, "hour_rows": hour_rows, "raw_deleted": raw_deleted,
+            "minutes_deleted": minutes_deleted, "hours_deleted": hours_deleted}
+
+
+def raw_boundary(conn, since, now):
+    """
+    Finds where the raw spots stop covering a window because the compactor deleted the older ones.
+
+    The compactor deletes rolled up spots by age, so the rolled up spots still raw are complete from the minute after
+    the oldest one left, or none are left. The newest spot of each pass is kept whatever its age, so it is left out.
+
+    Args:
+        conn (sqlite3.Connection): Database connection object.
+        since (int): Unix time of the start of the window.
+        now (float): Unix time the window ends at.
+
+    Returns:
+        tuple or None: (position, complete): the compactor's position in the raw spots, and the start of the first
+        minute whose rolled up spots are all still raw. Spots up to position older than complete are only in the
+        rollups. None if the raw spots cover the whole window.
+    """
+    if not table_exists(conn.cursor(), 'spots_minute'):
+        return None
+    position = get_progress(conn.cursor(), 'minute')
+    if not position:
+        return None
+    oldest = conn.execute('SELECT MIN(timestamp) FROM callsigns WHERE id < ?', (position,)).fetchone()[0]
+    if oldest is not None and oldest < since:
+        return None
+    oldest = int(now) if oldest is None else oldest
+    length = TIERS['minute'][1]
+    return position, (oldest // length + 1) * length
+
+
+def rollup_ranges(conn, start, end):
+    """
+    Picks the rollups that hold the spots of a time range: the minute tier as far back as it goes, and the hour tier
+    before that. The range is widened to whole buckets, minutes or, from the hour tier, hours.
+
+    Args:
+        conn (sqlite3.Connection): Database connection object.
+        start (int): Unix time of the start of the range.
+        end (int): Unix time of the end of the range, exclusive; the start of a minute.
+
+    Returns:
+        list: (tier, first bucket, end bucket exclusive) of each tier to read, oldest first.
+    """
+    minute_table, minute_length = TIERS['minute']
+    hour_length = TIERS['hour'][1]
+    start_minute = start - start % minute_length
+    # Minutes are only deleted once their hour was rolled up, so the hour tier holds every hour the minute tier
+    # no longer starts with
+    first_minute = conn.execute(f'SELECT MIN(bucket) FROM {minute_table}').fetchone()[0]
+    split = end if first_minute is None else first_minute
+    if split <= start_minute:
+        return [('minute', start_minute, end)]
+    split = min(-(-split // hour_length) * hour_length, end)
+    return [('hour', start - start % hour_length, split), ('minute', split, end)]
+
+
+def query_history(conn, start, end, tier='hour', spotter=None):
+    """
+    Statistics per zone and band over a time window, combined from the buckets of one tier.
+
+    Args:
+        conn (sqlite3.Connection): Database connection object.
+        start (int): Unix time of the start of the window; rounded down to the tier's buckets.
+        end (int): Unix time of the end of the window, exclusive.
+        tier (str): 'minute' or 'hour'.
+        spotter (str): Only count the spots of this spotter. All spotters if None.
+
+    Returns:
+        list: HistoryStats per zone and band, with the mean and standard deviation of SNR in dB and the SNR
+        slope in dB per minute.
+    """
+    table, length = TIERS[tier]
+    start -= start % length
+    # Time sums are shifted from the start of each bucket to the start of the window; as REAL, since the
+    # shifted sums of squares of long windows don't fit 64-bit integers
+    query = f'''
+        SELECT zone, band, SUM(n), SUM(snr_sum), SUM(snr_sq_sum), SUM(t_sum + n * shift),
+            SUM(t_sq_sum + 2 * shift * t_sum + n * shift * shift), SUM(t_snr_sum + shift * snr_sum)
+        FROM (SELECT *, CAST(bucket - ? AS REAL) AS shift FROM {table} WHERE bucket >= ? AND bucket < ?
+              {'AND spotter = ?' if spotter else ''})
+        GROUP BY zone, band
+        ORDER BY zone, band
+    '''
+    params = (start, start, end) + ((spotter,) if spotter else ())
+    rows = conn.execute(query, params).fetchall()
+    if not rows:
+        return []
+
+    zones, bands, n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum = zip(*rows)
+    means = mean_from_sums(n, snr_sum)
+    stds = std_from_sums(n, snr_sum, snr_sq_sum)
+    slopes = slope_from_sums(n, t_sum, t_sq_sum, snr_sum, t_snr_sum) * 60  # dB per second to dB per minute
+    return [HistoryStats(*row) for row in zip(zones, bands, n, means.tolist(), stds.tolist(), slopes.tolist())]
+
+
+class HistoryCompactor:
+    """
+    Background thread that periodically compacts the spot history, on its own database connection.
+    """
+
+    def __init__(self, db_file=DB_FILE, interval=COMPACT_INTERVAL, raw_retention=RAW_RETENTION,
+                 minute_retention=MINUTE_RETENTION, hour_retention=HOUR_RETENTION, settle=SETTLE):
+        """
+        Args:
+            db_file (str): SQLite database file name. Its schema must be up to date.
+            interval (float): Seconds between compactions.
+            raw_retention (int): Seconds raw spots are kept.
+            minute_retention (int): Seconds minute rollups are kept.
+            hour_retention (int): Seconds hour rollups are kept.
+            settle (int): Seconds after its end before an hour is rolled up.
+        """
+        self.db_file = db_file
+        self.interval = interval
+        self.retention = {"raw_retention": raw_retention, "minute_retention": minute_retention,
+                          "hour_retention": hour_retention, "settle": settle}
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='history-compactor', daemon=True)
+        self.passes = 0  # Compactions completed
+        self.errors = 0  # Compactions that failed
+        self.last_compact_latency = 0.0  # Seconds spent in the most recent compaction
+        self.max_compact_latency = 0.0  # Slowest compaction so far
+
+    def start(self):
+        """
+        Starts the compactor thread.
+        """
+        self.thread.start()
+
+    def close(self, timeout=None):
+        """
+        Stops the compactor thread after a final compaction.
+
+        Args:
+            timeout (float): Seconds to wait for the thread. Wait until it is done if None.
+        """
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def _run(self):
+        conn = connect(self.db_file)
+        try:
+            self._compact(conn)
+            while not self.stop.wait(self.interval):
+                self._compact(conn)
+            self._compact(conn)  # Roll up the last spots stored before shutdown
+        finally:
+            conn.close()
+
+    def _compact(self, conn):
+        started = time.perf_counter()
+        try:
+            result = compact(conn, **self.retention)
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"History compaction failed: {e}")
+            return
+        self.last_compact_latency = time.perf_counter() - started
+        self.max_compact_latency = max(self.max_compact_latency, self.last_compact_latency)
+        self.passes += 1
+        logging.info(f"History compacted in {self.last_compact_latency * 1000:.1f} ms: "
+                     f"{result['minute_rows']} minute and {result['hour_rows']} hour rollups updated, "
+                     f"{result['raw_deleted']} raw spots expired.")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Compact and query the long-term spot history.")
+    parser.add_argument("-d", "--database", help=f"SQLite database file. Default = {DB_FILE}", default=DB_FILE)
+    parser.add_argument("--compact", help="Run one compaction pass first", action="store_true")
+    parser.add_argument("--hours", help="Hours of history to summarize. Default = 24", type=float, default=24)
+    parser.add_argument("--tier", help="Rollup tier to read. Default = hour", choices=sorted(TIERS), default="hour")
+    parser.add_argument("-s", "--spotter", help="Only summarize the spots of this spotter")
+    args = parser.parse_args()
+
+    conn, _ = setup_database(args.database)
+    if args.compact:
+        print(json.dumps(compact(conn), indent=4))
+    end = int(time.time())
+    for stats in query_history(conn, int(end - args.hours * 3600), end + 1, args.tier, args.spotter):
+        print(json.dumps(stats._asdict()))
+    conn.close()
@@ -0,0 +1,98 @@
+import re
+from collections import namedtuple
+
+# Modes stored by default. CW spots report SNR on a different scale than the digital modes.
+DEFAULT_MODES = ('FT8', 'FT4')
+
+# Skimmer spot line as sent by DX Spider / CC Cluster, e.g.
+# "DX de VE3EID-#:  14074.0  K1ABC        -12 dB  0 FT8  CQ  1842Z"
+# "DX de VE3EID-#:   7018.5  K1ABC         18 dB 25 WPM CW  CQ  1842Z"
+# The spotter and mode alternatives are filled in per parser, and every match is anchored on the newline that
+# precedes the line, so one scan over a block of lines finds every spot without splitting the block. Control bytes
+# such as BEL may precede "DX de", and fields may be separated by tabs as well as spaces.
+SPOT_PATTERN = (
+    rb'\n[\x00-\x1f]*DX de (%(spotters)s)-#:[ \t]+'
+    rb'(\d+\.\d{1,2})[ \t]+'  # frequency
+    rb'([A-Z0-9/]+)[ \t]+'  # callsign
+    rb'([+-]?[ \t]?\d{1,2})[ \t]*dB[ \t]+'  # SNR
+    rb'(\d+)[ \t]+(?:WPM[ \t]+)?'  # WPM, 0 for the digital modes
+    rb'(%(modes)s)\b'
+)
+
+# A parsed skimmer spot
+Spot = namedtuple('Spot', ['frequency', 'call_sign', 'mode', 'snr', 'wpm', 'spotter'])
+
+
+def compile_pattern(spotters, modes):
+    """
+    Compiles the spot pattern for a set of spotters and modes.
+
+    Args:
+        spotters (iterable): Identifiers of the spotters to track.
+        modes (iterable): Modes to accept, out of FT8, FT4 and CW.
+
+    Returns:
+        re.Pattern: Bytes pattern with one group per Spot field, spotter first.
+    """
+    def alternatives(values):
+        # Longest first, so a spotter is never cut short by another spotter that is a prefix of it
+        return b'|'.join(re.escape(value.encode('ascii')) for value in sorted(values, key=len, reverse=True))
+
+    return re.compile(SPOT_PATTERN % {b'spotters': alternatives(spotters), b'modes': alternatives(modes)})
+
+
+class SpotParser:
+    """
+    Parses the skimmer spots of the tracked spotters and modes straight out of the receive buffer.
+
+    A block of complete lines is scanned once with a single compiled pattern that only matches at the start
+    of a line, for one of the tracked spotters and modes, and pulls out frequency, callsign, SNR, WPM, mode
+    and spotter in the same pass. Lines that are not wanted spots are skipped inside the regular expression
+    engine, and only the fields of the spots found are converted to Python values.
+    """
+
+    def __init__(self, spotters, modes=DEFAULT_MODES):
+        """
+        Args:
+            spotters (iterable): Identifiers of the spotters to track.
+            modes (iterable): Modes to accept, out of FT8, FT4 and CW.
+        """
+        spotters = list(spotters)
+        modes = [mode.upper() for mode in modes]
+        self.pattern = compile_pattern(spotters, modes)
+        self.spotters = {spotter.encode('ascii'): spotter for spotter in spotters}
+        self.modes = {mode.encode('ascii'): mode for mode in modes}
+
+    def parse(self, buffer, start=0, end=None):
+        """
+        Parses every spot in a block of lines.
+
+        Args:
+            buffer (bytes or bytearray): Buffer holding the block.
+            start (int): Offset of the block, which must begin with the newline preceding its first line.
+            end (int): Offset just past the block. Defaults to the end of the buffer.
+
+        Returns:
+            list: The parsed Spot records, in stream order.
+        """
+        if end is None:
+            end = len(buffer)
+        spotters = self.spotters
+        modes = self.modes
+        new = tuple.__new__
+        return [new(Spot, (float(frequency), call_sign.decode('ascii'), modes[mode],
+                           int(snr.translate(None, b' \t')), int(wpm), spotters[spotter]))
+                for spotter, frequency, call_sign, snr, wpm, mode in self.pattern.findall(buffer, start, end)]
+
+    def parse_line(self, line):
+        """
+        Parses a single line.
+
+        Args:
+            line (bytes): The line, without the preceding newline.
+
+        Returns:
+            Spot or None: The parsed spot, or None if the line is not a spot of a tracked spotter and mode.
+        """
+        spots = self.parse(b'\n' + line)
+        return spots[0] if spots else None
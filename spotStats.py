@@ -0,0 +1,67 @@
+import numpy as np
+
+# Fewest spots a slope is reported for; fewer points give meaningless trends
+MIN_SLOPE_SPOTS = 5
+
+
+def mean_from_sums(n, snr_sum):
+    """
+    Mean SNR from the running sums of a group of spots.
+
+    Args:
+        n (array_like): Number of spots per group.
+        snr_sum (array_like): Sum of SNR per group.
+
+    Returns:
+        numpy.ndarray: Mean SNR per group, NaN for empty groups.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n > 0, np.asarray(snr_sum, dtype=np.float64) / n, np.nan)
+
+
+def std_from_sums(n, snr_sum, snr_sq_sum):
+    """
+    Sample standard deviation of SNR (ddof=1, like pandas) from the running sums of a group of spots.
+
+    Args:
+        n (array_like): Number of spots per group.
+        snr_sum (array_like): Sum of SNR per group.
+        snr_sq_sum (array_like): Sum of squared SNR per group.
+
+    Returns:
+        numpy.ndarray: Standard deviation per group, NaN for groups of fewer than 2 spots.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    snr_sum = np.asarray(snr_sum, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (np.asarray(snr_sq_sum, dtype=np.float64) - snr_sum * snr_sum / n) / (n - 1)
+        return np.where(n > 1, np.sqrt(np.maximum(variance, 0)), np.nan)
+
+
+def slope_from_sums(n, x_sum, x_sq_sum, y_sum, xy_sum, min_count=MIN_SLOPE_SPOTS):
+    """
+    Least squares slope of y against x from the running sums of a group of points, the closed form of
+    scipy.stats.linregress's slope.
+
+    Args:
+        n (array_like): Number of points per group.
+        x_sum (array_like): Sum of x per group.
+        x_sq_sum (array_like): Sum of squared x per group.
+        y_sum (array_like): Sum of y per group.
+        xy_sum (array_like): Sum of x * y per group.
+        min_count (int): Fewest points a slope is computed for.
+
+    Returns:
+        numpy.ndarray: Slope per group, in units of y per unit of x. NaN for groups with fewer than
+        ``min_count`` points or no spread in x.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    x_sum = np.asarray(x_sum, dtype=np.float64)
+    x_sq_sum = np.asarray(x_sq_sum, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx = x_sq_sum - x_sum * x_sum / n
+        sxy = np.asarray(xy_sum, dtype=np.float64) - x_sum * np.asarray(y_sum, dtype=np.float64) / n
+        # A spread lost in the rounding of the sums counts as no spread
+        spread = sxx > 1e-12 * np.abs(x_sq_sum)
+        return np.where((n >= max(min_count, 2)) & spread, sxy / sxx, np.nan)
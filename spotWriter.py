@@ -0,0 +1,306 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from ctyIndex import log_stats
+from dbSchema import DB_FILE, setup_database
+
+# What to do with a new entry when the writer queue is full
+QUEUE_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+# Default bound of the writer queue, in entries; a few minutes of a 100x contest rate
+DEFAULT_QUEUE_SIZE = 100000
+
+# Seconds a blocked add or close waits for room before checking that the writer thread is still running
+PUT_TIMEOUT = 1.0
+
+# Marks the end of the stream on the writer queue
+_STOP = object()
+
+
+class WriterError(RuntimeError):
+    """
+    The writer thread has stopped, so queued entries would never be stored.
+    """
+
+
+def insert_batch(cursor, callsign_entries):
+    """
+    Inserts a batch of callsign data into the SQLite database.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor object.
+        callsign_entries (list): List of callsign data tuples to be inserted.
+    """
+    cursor.executemany('''
+        INSERT INTO callsigns (zone, band, snr, timestamp, spotter, mode)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', callsign_entries)
+
+
+class SpotWriter:
+    """
+    Owns the SQLite connection on a dedicated thread and stores the entries of every cluster connection.
+
+    Parsed entries are handed over through a bounded queue, so the socket loop never waits on an insert or a
+    WAL checkpoint. Expiring old spots is left to the HistoryCompactor. The writer thread groups whatever has
+    accumulated into one transaction, every ``batch_size`` entries or ``flush_interval`` seconds, whichever comes
+    first.
+
+    When the queue is full, the policy decides:
+
+    * ``block``: ``add`` waits for room. Reading stops, and the backlog stays in the kernel socket buffers and
+      TCP flow control; nothing is lost unless the cluster gives up on the connection. ``offer`` doesn't wait, so
+      an event loop can wait for room off the loop and keep serving its other connections.
+    * ``drop_newest``: the new entry is dropped.
+    * ``drop_oldest``: the oldest queued entry is dropped to make room, favoring current propagation.
+
+    If the writer thread stops on an error, ``add`` raises WriterError instead of queueing entries nobody stores.
+    """
+
+    def __init__(self, db_file=DB_FILE, cty_index=None, batch_size=500, flush_interval=30,
+                 queue_size=DEFAULT_QUEUE_SIZE, policy='drop_oldest'):
+        """
+        Args:
+            db_file (str): SQLite database file name.
+            cty_index (CtyIndex): Prefix index, used to report its cache statistics after each update.
+            batch_size (int): Number of entries that triggers an immediate update.
+            flush_interval (float): Maximum number of seconds between updates while entries are pending.
+            queue_size (int): Maximum number of entries waiting for the writer.
+            policy (str): What to do when the queue is full, one of QUEUE_POLICIES.
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {', '.join(QUEUE_POLICIES)}")
+        self.db_file = db_file
+        self.cty_index = cty_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name='spot-writer', daemon=True)
+        self.ready = threading.Event()
+        self.error = None  # Exception that stopped the writer thread, if any
+        self.max_queue_depth = 0  # Deepest the queue has been
+        self.dropped = 0  # Entries dropped because the queue was full
+        self.write_errors = 0  # Updates that failed and were rolled back
+        self.spots_written = 0  # Total number of entries committed
+        self.commit_count = 0  # Total number of updates committed
+        self.last_commit_latency = 0.0  # Seconds spent in the most recent update
+        self.max_commit_latency = 0.0  # Slowest update so far
+        self.total_commit_time = 0.0  # Seconds spent in all updates
+
+    @property
+    def queue_depth(self):
+        """
+        Returns:
+            int: Number of entries waiting for the writer.
+        """
+        return self.queue.qsize()
+
+    def start(self):
+        """
+        Starts the writer thread and waits until the database is open.
+
+        Raises:
+            sqlite3.Error: If the database can't be opened.
+            RuntimeError: If the database schema is newer than this version supports.
+        """
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+
+    def check(self):
+        """
+        Raises:
+            WriterError: If the writer thread isn't running, chained to the error that stopped it.
+        """
+        if not self.thread.is_alive():
+            raise WriterError(f"Spot writer is not running: {self.error or 'stopped'}") from self.error
+
+    def add(self, entry):
+        """
+        Queue one callsign entry for the writer, applying the queue policy if the queue is full.
+
+        Args:
+            entry (tuple): (zone, band, snr, timestamp, spotter, mode) entry.
+
+        Returns:
+            bool: True if the entry was queued, False if it was dropped.
+
+        Raises:
+            WriterError: If the writer thread has stopped.
+        """
+        self.check()
+        if self.policy == 'block':
+            self._put(entry)
+        else:
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                self._put(entry)
+
+        self._track_depth()
+        return True
+
+    def offer(self, entry):
+        """
+        Queue one callsign entry without waiting: like add, except that under the block policy a full queue leaves
+        the entry to the caller instead of waiting for room.
+
+        Args:
+            entry (tuple): (zone, band, snr, timestamp, spotter, mode) entry.
+
+        Returns:
+            bool: False if the block policy's queue is full and the entry still needs an add, True otherwise.
+
+        Raises:
+            WriterError: If the writer thread has stopped.
+        """
+        if self.policy != 'block':
+            self.add(entry)
+            return True
+        self.check()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            return False
+        self._track_depth()
+        return True
+
+    def _track_depth(self):
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def close(self, timeout=None):
+        """
+        Stores the entries still queued, then closes the database and stops the writer thread.
+
+        Args:
+            timeout (float): Seconds to wait for the writer thread. Wait until it is done if None.
+        """
+        if not self.thread.is_alive():
+            return  # Never started, or stopped on an error; nothing drains the queue any more
+        try:
+            self._put(_STOP)
+        except WriterError:
+            return
+        self.thread.join(timeout)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Queue depth, drop and commit counters.
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "spots_written": self.spots_written,
+            "commits": self.commit_count,
+            "last_commit_ms": self.last_commit_latency * 1000,
+            "max_commit_ms": self.max_commit_latency * 1000,
+            "mean_commit_ms": self.total_commit_time / self.commit_count * 1000 if self.commit_count else 0.0,
+        }
+
+    def _put(self, entry):
+        # Waits for room in bounded steps, so a writer thread that stopped meanwhile can't block the caller forever
+        while True:
+            try:
+                self.queue.put(entry, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                self.check()
+
+    def _run(self):
+        try:
+            conn, cursor = setup_database(self.db_file)
+        except (sqlite3.Error, RuntimeError) as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+
+        try:
+            pending = []
+            deadline = None
+            stopping = False
+            while not stopping:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    entry = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    entry = None
+
+                # Take everything else that is already queued, up to a full batch
+                while entry is not None:
+                    if entry is _STOP:
+                        stopping = True
+                        break
+                    pending.append(entry)
+                    if len(pending) >= self.batch_size:
+                        break
+                    try:
+                        entry = self.queue.get_nowait()
+                    except queue.Empty:
+                        entry = None
+
+                if pending and deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending and (stopping or len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                    self._write(conn, cursor, pending)
+                    pending = []
+                    deadline = None
+
+            # Store the entries added while stopping as well
+            while True:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not _STOP:
+                    pending.append(entry)
+            if pending:
+                self._write(conn, cursor, pending)
+        except Exception as e:
+            self.error = e
+            logging.exception("Spot writer stopped")
+        finally:
+            conn.close()
+
+    def _write(self, conn, cursor, callsign_entries):
+        started = time.perf_counter()
+        try:
+            insert_batch(cursor, callsign_entries)
+            conn.commit()  # Commit the changes
+        except sqlite3.Error as e:
+            conn.rollback()
+            self.write_errors += 1
+            logging.error(f"Database update of {len(callsign_entries)} entries failed: {e}")
+            return
+        self.last_commit_latency = time.perf_counter() - started
+        self.max_commit_latency = max(self.max_commit_latency, self.last_commit_latency)
+        self.total_commit_time += self.last_commit_latency
+        self.spots_written += len(callsign_entries)
+        self.commit_count += 1
+
+        # Get the current time and print it along with the update message
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logging.info(f"Database updated on {current_time}. Processed {len(callsign_entries)} total entries "
+                     f"in {self.last_commit_latency * 1000:.1f} ms. Queue depth {self.queue_depth}, "
+                     f"{self.dropped} dropped.")
+        if self.cty_index is not None:
+            log_stats(self.cty_index)
@@ -0,0 +1,360 @@
+import time
+
+import numpy as np
+
+from spotHistory import TIERS, raw_boundary, rollup_ranges
+from zoneStats import ZONES, BANDS, grid_cells, grid_from_sums
+
+# Default length of the sliding window and of its buckets, in seconds
+WINDOW = 900
+BUCKET_SECONDS = 60
+
+
+class ZoneAggregator:
+    """
+    Keeps running SNR statistics per zone and band over a sliding time window, updated with new spots only.
+
+    The window is a ring of buckets, each holding per zone and band the spot and CW spot counts, SNR sum, sum of
+    squares, min and max, and the regression sums of SNR against the time since the start of the bucket. New spots are
+    added to the bucket of their timestamp; when time moves past a bucket, its slot is cleared and reused.
+    A refresh reads only the rows past the highest id seen so far, so its cost depends on the number of new
+    spots, and building the grid sums a few buckets regardless of how many spots the window holds.
+
+    The window advances a bucket at a time, so it covers between ``window - bucket_seconds`` and ``window``
+    seconds of spots. Percentiles can't be kept as running sums, so they are left NaN.
+    """
+
+    def __init__(self, window=WINDOW, bucket_seconds=BUCKET_SECONDS, spotter=None):
+        """
+        Args:
+            window (int): Length of the window in seconds.
+            bucket_seconds (int): Length of a bucket in seconds.
+            spotter (str): Only count the spots of this spotter. All spotters if None.
+        """
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.spotter = spotter
+        self.bucket_count = -(-window // bucket_seconds)
+        shape = (self.bucket_count, len(ZONES), len(BANDS))
+        self.n = np.zeros(shape)
+        self.snr_sum = np.zeros(shape)
+        self.snr_sq_sum = np.zeros(shape)
+        self.t_sum = np.zeros(shape)
+        self.t_sq_sum = np.zeros(shape)
+        self.t_snr_sum = np.zeros(shape)
+        self.cw = np.zeros(shape)
+        self.sums = (self.n, self.snr_sum, self.snr_sq_sum, self.t_sum, self.t_sq_sum, self.t_snr_sum, self.cw)
+        self.snr_min = np.full(shape, np.inf)
+        self.snr_max = np.full(shape, -np.inf)
+        self.current = None  # Newest bucket, as Unix time // bucket_seconds
+        self.last_id = 0  # High-water mark: highest callsigns id consumed
+        self.last_spotter = spotter  # Spotter of the newest spot consumed
+        self.spots_added = 0  # Spots counted since the aggregator was created
+
+    def reset(self):
+        """
+        Forgets every spot and the high-water mark.
+        """
+        for sums in self.sums:
+            sums.fill(0)
+        self.snr_min.fill(np.inf)
+        self.snr_max.fill(-np.inf)
+        self.current = None
+        self.last_id = 0
+
+    def advance(self, now):
+        """
+        Moves the window forward, clearing the buckets that fall out of it.
+
+        Args:
+            now (float): Unix time the window ends at.
+        """
+        bucket = int(now) // self.bucket_seconds
+        if self.current is not None and bucket <= self.current:
+            return
+        if self.current is None or bucket - self.current >= self.bucket_count:
+            expired = range(self.bucket_count)
+        else:
+            expired = [b % self.bucket_count for b in range(self.current + 1, bucket + 1)]
+        for slot in expired:
+            for sums in self.sums:
+                sums[slot] = 0
+            self.snr_min[slot] = np.inf
+            self.snr_max[slot] = -np.inf
+        self.current = bucket
+
+    def add(self, zones, bands, snrs, timestamps, modes=None):
+        """
+        Adds spots to the window. Spots older than the window are ignored.
+
+        Args:
+            zones (array_like): CQ zone of every spot.
+            bands (array_like): Band of every spot.
+            snrs (array_like): SNR of every spot in dB.
+            timestamps (array_like): Unix time of every spot.
+            modes (array_like): Mode of every spot. CW spots aren't counted if None.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if not len(timestamps):
+            return
+        self.advance(timestamps.max())
+        buckets = timestamps // self.bucket_seconds
+        cells, inside = grid_cells(zones, bands)
+        keep = inside & (buckets > self.current - self.bucket_count)
+        buckets = buckets[keep]
+        snrs = np.asarray(snrs, dtype=np.float64)[keep]
+        t = (timestamps[keep] - buckets * self.bucket_seconds).astype(np.float64)
+        cells = (buckets % self.bucket_count) * (len(ZONES) * len(BANDS)) + cells[keep]
+
+        size = self.n.size
+        updates = [(self.n, None), (self.snr_sum, snrs), (self.snr_sq_sum, snrs * snrs), (self.t_sum, t),
+                   (self.t_sq_sum, t * t), (self.t_snr_sum, t * snrs)]
+        if modes is not None:
+            updates.append((self.cw, np.asarray(modes, dtype=object)[keep] == 'CW'))
+        for sums, weights in updates:
+            sums.reshape(-1)[:] += np.bincount(cells, weights=weights, minlength=size)
+        np.minimum.at(self.snr_min.reshape(-1), cells, snrs)
+        np.maximum.at(self.snr_max.reshape(-1), cells, snrs)
+        self.spots_added += len(cells)
+
+    def add_entries(self, callsign_entries):
+        """
+        Adds the entries queued by the ingester or rows of the callsigns table, as (zone, band, snr, timestamp,
+        spotter, mode) tuples.
+
+        Args:
+            callsign_entries (list): The entries.
+        """
+        if self.spotter is not None:
+            callsign_entries = [entry for entry in callsign_entries if entry[4] == self.spotter]
+        if not callsign_entries:
+            return
+        zones, bands, snrs, timestamps, spotters, modes = zip(*callsign_entries)
+        self.last_spotter = spotters[-1]
+        self.add(zones, bands, snrs, timestamps, modes)
+
+    def add_sums(self, buckets, zones, bands, n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum, length=None):
+        """
+        Adds rollups of the spot history to the window: the sums of the spots of one zone and band over one bucket,
+        with times relative to the start of the bucket. Rollups older than the window are ignored. The min, max and
+        CW count of their spots are unknown.
+
+        A rollup longer than the aggregator's buckets, like an hour of the hour tier, is counted in the last bucket
+        it spans, so it stays in the window as long as any part of it does, the way the sql backend widens a window
+        to whole hours.
+
+        Args:
+            buckets (array_like): Unix time of the start of the bucket of every rollup.
+            zones (array_like): CQ zone of every rollup.
+            bands (array_like): Band of every rollup.
+            n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum (array_like): Sums of every rollup.
+            length (int): Seconds of each rollup bucket. The aggregator's bucket length if None.
+        """
+        offset = 0 if length is None else max(length - self.bucket_seconds, 0)
+        buckets = (np.asarray(buckets, dtype=np.int64) + offset) // self.bucket_seconds
+        if not len(buckets):
+            return
+        if offset:
+            # Move the time origin of the sums from the start of the rollup to the start of its last bucket
+            n, snr_sum, t_sum = (np.asarray(sums, dtype=np.float64) for sums in (n, snr_sum, t_sum))
+            t_sq_sum = np.asarray(t_sq_sum, dtype=np.float64) - 2 * offset * t_sum + offset * offset * n
+            t_snr_sum = np.asarray(t_snr_sum, dtype=np.float64) - offset * snr_sum
+            t_sum = t_sum - offset * n
+        self.advance(buckets.max() * self.bucket_seconds)
+        cells, inside = grid_cells(zones, bands)
+        keep = inside & (buckets > self.current - self.bucket_count)
+        cells = (buckets[keep] % self.bucket_count) * (len(ZONES) * len(BANDS)) + cells[keep]
+        size = self.n.size
+        for sums, weights in zip(self.sums, (n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum)):
+            sums.reshape(-1)[:] += np.bincount(cells, weights=np.asarray(weights, dtype=np.float64)[keep],
+                                               minlength=size)
+        self.spots_added += int(np.asarray(n)[keep].sum())
+
+    def add_rollups(self, rollups, length=None):
+        """
+        Adds rows of the per-minute or per-hour history, as (bucket, spotter, zone, band, n, snr_sum, snr_sq_sum,
+        t_sum, t_sq_sum, t_snr_sum) tuples.
+
+        Args:
+            rollups (list): The rows.
+            length (int): Seconds of each rollup bucket. The aggregator's bucket length if None.
+        """
+        if self.spotter is not None:
+            rollups = [rollup for rollup in rollups if rollup[1] == self.spotter]
+        if not rollups:
+            return
+        buckets, spotters, *sums = zip(*rollups)
+        self.add_sums(buckets, *sums, length=length)
+
+    def seed(self, conn, now):
+        """
+        Fills the window on the first refresh. Raw spots are only kept for a few minutes, so the part of a longer
+        window the raw table no longer holds is restored from the per-minute history, and from the per-hour history
+        before the oldest minute kept.
+
+        Args:
+            conn (sqlite3.Connection): Database connection object.
+            now (float): Unix time the window ends at.
+
+        Returns:
+            int: Upper bound of the raw ids already counted; spots up to it that aren't counted yet are read by the
+            refresh.
+        """
+        since = int(now) - self.window
+        if self.bucket_seconds != TIERS['minute'][1]:
+            return 0
+        boundary = raw_boundary(conn, since, now)
+        if boundary is None:
+            return 0
+        # The rollups of the minutes before complete hold the spots up to the compactor's position; later spots of
+        # those minutes are still raw, and read by the refresh.
+        position, complete = boundary
+        for tier, first, end in rollup_ranges(conn, since, complete):
+            table, length = TIERS[tier]
+            query = f'''SELECT bucket, spotter, zone, band, n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum
+                        FROM {table} WHERE bucket >= ? AND bucket < ?'''
+            params = [first, end]
+            if self.spotter is not None:
+                query += ' AND spotter = ?'
+                params.append(self.spotter)
+            self.add_rollups(conn.execute(query, params).fetchall(), length)
+
+        query = '''SELECT zone, band, snr, timestamp, spotter, mode FROM callsigns
+                   WHERE id <= ? AND timestamp >= ? AND timestamp >= ?'''
+        params = [position, since, complete]
+        if self.spotter is not None:
+            query += ' AND spotter = ?'
+            params.append(self.spotter)
+        self.add_entries(conn.execute(query + ' ORDER BY id', params).fetchall())
+        return position
+
+    def refresh(self, conn, now=None):
+        """
+        Adds the spots stored since the last refresh.
+
+        Args:
+            conn (sqlite3.Connection): Database connection object.
+            now (float): Unix time the window ends at. Defaults to now.
+
+        Returns:
+            int: Number of new rows read.
+        """
+        now = time.time() if now is None else now
+        snapshot = not conn.in_transaction
+        if snapshot:
+            conn.execute('BEGIN')  # Read everything from one snapshot, so a compaction can't move spots in between
+        try:
+            return self._refresh(conn, now)
+        finally:
+            if snapshot:
+                conn.commit()
+
+    def _refresh(self, conn, now):
+        max_id = conn.execute('SELECT MAX(id) FROM callsigns').fetchone()[0] or 0
+        if max_id < self.last_id:
+            self.reset()  # The database was recreated; ids started over
+        if self.current is None:
+            self.last_id = min(self.seed(conn, now), max_id)
+
+        # Rows committed after MAX(id) was read are left for the next refresh
+        query = '''SELECT zone, band, snr, timestamp, spotter, mode FROM callsigns
+                   WHERE id > ? AND id <= ? AND timestamp >= ?'''
+        params = [self.last_id, max_id, int(now) - self.window]
+        if self.spotter is not None:
+            query += ' AND spotter = ?'
+            params.append(self.spotter)
+        rows = conn.execute(query + ' ORDER BY id', params).fetchall()
+
+        self.add_entries(rows)
+        self.last_id = max_id
+        self.advance(now)
+        return len(rows)
+
+    def grid(self, now=None, window=None):
+        """
+        Combines the buckets of the window, or of its most recent part, into statistics per zone and band.
+
+        Args:
+            now (float): Unix time the window ends at. Defaults to now.
+            window (int): Seconds of spots to combine, at most the aggregator's window. The whole window if None.
+
+        Returns:
+            ZoneGrid: The statistics of the window.
+        """
+        self.advance(time.time() if now is None else now)
+        count = self.bucket_count if window is None else min(-(-window // self.bucket_seconds), self.bucket_count)
+        # Shift the time sums of each slot from the start of its bucket to the start of the window; slots older
+        # than the window get no weight
+        age = (self.current - np.arange(self.bucket_count)) % self.bucket_count
+        recent = age < count
+        weight = recent.astype(np.float64)[:, None, None]
+        shift = ((count - 1 - age) * self.bucket_seconds).astype(np.float64)[:, None, None]
+
+        def combine(sums):
+            return (sums * weight).sum(axis=0)
+
+        n = combine(self.n)
+        snr_sum = combine(self.snr_sum)
+        t_sum = combine(self.t_sum + self.n * shift)
+        t_sq_sum = combine(self.t_sq_sum + 2 * shift * self.t_sum + self.n * shift * shift)
+        t_snr_sum = combine(self.t_snr_sum + shift * self.snr_sum)
+
+        # Spots restored from the history have no min or max
+        snr_min = self.snr_min[recent].min(axis=0)
+        snr_max = self.snr_max[recent].max(axis=0)
+        return grid_from_sums(n, snr_sum, combine(self.snr_sq_sum), t_sum, t_sq_sum, t_snr_sum,
+                              np.where(np.isfinite(snr_min), snr_min, np.nan),
+                              np.where(np.isfinite(snr_max), snr_max, np.nan), combine(self.cw))
+
+
+class SpotterAggregator(ZoneAggregator):
+    """
+    A ZoneAggregator of every spotter's spots, that also keeps a ZoneAggregator per spotter. Each refresh reads
+    the new spots once and hands every spot to the merged totals and to its spotter's; spotters are added as
+    their first spot arrives.
+    """
+
+    def __init__(self, window=WINDOW, bucket_seconds=BUCKET_SECONDS):
+        """
+        Args:
+            window (int): Length of the window in seconds.
+            bucket_seconds (int): Length of a bucket in seconds.
+        """
+        super().__init__(window, bucket_seconds)
+        self.spotters = {}  # Spotter call sign to its ZoneAggregator
+
+    def reset(self):
+        super().reset()
+        self.spotters.clear()
+
+    def spotter_aggregator(self, spotter):
+        """
+        Returns:
+            ZoneAggregator: The totals of a spotter, created empty on first use.
+        """
+        if spotter not in self.spotters:
+            self.spotters[spotter] = ZoneAggregator(self.window, self.bucket_seconds, spotter)
+        return self.spotters[spotter]
+
+    def add_entries(self, callsign_entries):
+        super().add_entries(callsign_entries)
+        for spotter, entries in partition(callsign_entries, 4).items():
+            self.spotter_aggregator(spotter).add_entries(entries)
+
+    def add_rollups(self, rollups, length=None):
+        super().add_rollups(rollups, length)
+        for spotter, spotter_rollups in partition(rollups, 1).items():
+            self.spotter_aggregator(spotter).add_rollups(spotter_rollups, length)
+
+
+def partition(rows, column):
+    """
+    Groups rows by the value of one of their columns.
+
+    Returns:
+        dict: Value to the list of its rows, in their original order.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[column], []).append(row)
+    return groups
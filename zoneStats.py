@@ -0,0 +1,264 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from bandPlan import ALL_BANDS
+from spotHistory import TIERS, raw_boundary, rollup_ranges
+from spotStats import mean_from_sums, std_from_sums, slope_from_sums
+
+# Axes of the dense zone x band grids: CQ zones 1-40 by row, bands by column
+ZONES = np.arange(1, 41)
+BANDS = np.array(ALL_BANDS)
+
+# Column of each band number in the grids, -1 for numbers that aren't bands
+BAND_COLUMNS = np.full(max(ALL_BANDS) + 1, -1, dtype=np.intp)
+BAND_COLUMNS[BANDS] = np.arange(len(BANDS))
+
+# SNR percentiles computed per zone and band
+PERCENTILES = (10, 50, 90)
+
+# Per zone and band statistics, each a len(ZONES) x len(BANDS) array; percentiles has a last axis of
+# len(PERCENTILES). Mean, std, slope, min, max and percentiles are NaN where there are no spots; slope is in dB per
+# minute. cw_count is the number of CW spots among count.
+ZoneGrid = namedtuple('ZoneGrid', ['count', 'mean', 'std', 'slope', 'min', 'max', 'percentiles', 'cw_count'])
+
+
+def grid_cells(zones, bands):
+    """
+    Maps zones and bands to their cells in the flattened grid.
+
+    Args:
+        zones (numpy.ndarray): CQ zone of every spot.
+        bands (numpy.ndarray): Band of every spot.
+
+    Returns:
+        tuple: (cell index of every spot in the flattened grid, mask of the spots that fall in the grid).
+    """
+    zones = np.asarray(zones, dtype=np.intp)
+    bands = np.asarray(bands, dtype=np.intp)
+    columns = np.full(len(bands), -1, dtype=np.intp)
+    known = (bands >= 0) & (bands < len(BAND_COLUMNS))
+    columns[known] = BAND_COLUMNS[bands[known]]
+    inside = (zones >= ZONES[0]) & (zones <= ZONES[-1]) & (columns >= 0)
+    return (zones - ZONES[0]) * len(BANDS) + columns, inside
+
+
+def grid_from_sums(n, snr_sum, snr_sq_sum, t_sum, t_sq_sum, t_snr_sum, snr_min, snr_max, cw_count,
+                   percentiles=None):
+    """
+    Derives the statistics of every zone and band from their running sums.
+
+    Args:
+        n (numpy.ndarray): Spots per cell, a len(ZONES) x len(BANDS) array like all of the sums.
+        snr_sum (numpy.ndarray): Sum of SNR per cell.
+        snr_sq_sum (numpy.ndarray): Sum of squared SNR per cell.
+        t_sum (numpy.ndarray): Sum of the spot times in seconds per cell, all relative to the same origin.
+        t_sq_sum (numpy.ndarray): Sum of squared times per cell.
+        t_snr_sum (numpy.ndarray): Sum of time * SNR per cell.
+        snr_min (numpy.ndarray): Lowest SNR per cell; ignored where there are no spots.
+        snr_max (numpy.ndarray): Highest SNR per cell; ignored where there are no spots.
+        cw_count (numpy.ndarray): CW spots per cell.
+        percentiles (numpy.ndarray): SNR percentiles per cell. NaN if None.
+
+    Returns:
+        ZoneGrid: The statistics.
+    """
+    empty = n == 0
+    if percentiles is None:
+        percentiles = np.full(n.shape + (len(PERCENTILES),), np.nan)
+    return ZoneGrid(
+        count=n.astype(np.int64),
+        mean=mean_from_sums(n, snr_sum),
+        std=std_from_sums(n, snr_sum, snr_sq_sum),
+        slope=slope_from_sums(n, t_sum, t_sq_sum, snr_sum, t_snr_sum) * 60,  # dB per second to dB per minute
+        min=np.where(empty, np.nan, snr_min),
+        max=np.where(empty, np.nan, snr_max),
+        percentiles=percentiles,
+        cw_count=cw_count.astype(np.int64),
+    )
+
+
+def spot_grid(zones, bands, snrs, timestamps, modes=None):
+    """
+    Computes every per zone and band statistic of a set of spots in a single pass: the spots are mapped to their
+    grid cells once, the running sums of every cell are accumulated with one bincount each, and a single sort by
+    cell and SNR yields the min, max and percentiles.
+
+    Args:
+        zones (array_like): CQ zone of every spot.
+        bands (array_like): Band of every spot.
+        snrs (array_like): SNR of every spot in dB.
+        timestamps (array_like): Unix time of every spot.
+        modes (array_like): Mode of every spot. CW spots aren't counted if None.
+
+    Returns:
+        ZoneGrid: The statistics.
+    """
+    cells, inside = grid_cells(zones, bands)
+    cells = cells[inside]
+    snrs = np.asarray(snrs, dtype=np.float64)[inside]
+    timestamps = np.asarray(timestamps, dtype=np.int64)[inside]
+    size = len(ZONES) * len(BANDS)
+    shape = (len(ZONES), len(BANDS))
+
+    def cell_sums(weights=None):
+        return np.bincount(cells, weights=weights, minlength=size)
+
+    # Seconds since the oldest spot keep the regression sums small and exact
+    t = (timestamps - timestamps.min()).astype(np.float64) if len(timestamps) else np.zeros(0)
+    n = cell_sums()
+    snr_sum = cell_sums(snrs)
+    t_sum = cell_sums(t)
+
+    # Sorted by cell, then SNR: each cell's SNRs are a contiguous, ordered run starting at its offset. Sorting one
+    # key of cell * span + SNR is several times faster than an argsort on both; it is exact for the integer SNRs of
+    # the callsigns table.
+    low_snr = snrs.min() if len(snrs) else 0.0
+    span = (snrs.max() - low_snr + 1) if len(snrs) else 1.0
+    sorted_cells = np.repeat(np.arange(size), n.astype(np.intp))
+    sorted_snrs = np.sort(cells * span + (snrs - low_snr)) - sorted_cells * span + low_snr
+    starts = np.concatenate(([0], np.cumsum(n)[:-1])).astype(np.intp)
+    present = n > 0
+    first = starts[present]
+    last = first + n[present].astype(np.intp) - 1
+    snr_min = np.full(size, np.nan)
+    snr_max = np.full(size, np.nan)
+    snr_min[present] = sorted_snrs[first]
+    snr_max[present] = sorted_snrs[last]
+    percentiles = np.full((size, len(PERCENTILES)), np.nan)
+    for i, q in enumerate(PERCENTILES):
+        # Linear interpolation between the closest ranks, like numpy.percentile and pandas.quantile
+        position = (n[present] - 1) * q / 100
+        low = np.floor(position).astype(np.intp)
+        high = np.ceil(position).astype(np.intp)
+        lower = sorted_snrs[first + low]
+        upper = sorted_snrs[first + high]
+        percentiles[present, i] = lower + (upper - lower) * (position - low)
+
+    if modes is None:
+        cw_count = np.zeros(size, dtype=np.int64)
+    else:
+        cw_count = cell_sums(np.asarray(modes, dtype=object)[inside] == 'CW').astype(np.int64)
+
+    return grid_from_sums(n.reshape(shape), snr_sum.reshape(shape), cell_sums(snrs * snrs).reshape(shape),
+                          t_sum.reshape(shape), cell_sums(t * t).reshape(shape), cell_sums(t * snrs).reshape(shape),
+                          snr_min.reshape(shape), snr_max.reshape(shape), cw_count.reshape(shape),
+                          percentiles.reshape(shape + (len(PERCENTILES),)))
+
+
+def query_grids(conn, starts, until=None, spotter=None, by_spotter=False):
+    """
+    Computes the statistics of every zone and band inside the database, for several time ranges ending together,
+    in a single scan: one GROUP BY query returns the running sums of each zone and band over each segment between
+    consecutive range starts, so only a few hundred rows per range reach Python however many spots the ranges
+    hold. Each range combines the segments it covers. Percentiles are left NaN.
+
+    The part of the ranges the compactor already deleted from the raw spots is read from the rollups of the spot
+    history, in the same query. It is counted by whole minutes, or whole hours past the minute tier's retention, and
+    has no min, max or CW count.
+
+    Args:
+        conn (sqlite3.Connection): Database connection object.
+        starts (list): Unix time of the oldest spot counted in each range.
+        until (int): Unix time of the newest spot counted. No limit if None.
+        spotter (str): Only count the spots of this spotter. All spotters if None.
+        by_spotter (bool): Also compute the ranges of each spotter, from the same scan.
+
+    Returns:
+        list or dict: The ZoneGrid of each range, in the order of starts. With by_spotter, a dict of these lists
+        per spotter, with the ranges of all spotters together under None.
+    """
+    # Segment 0 is the newest, from the latest start on; segment i runs from the (i+1)-th latest start. A rollup
+    # bucket belongs to the segment of its last second, so a range counts the whole bucket its start falls in.
+    bounds = sorted(set(starts), reverse=True)
+
+    def segment(column):
+        return 'CASE ' + ' '.join(f'WHEN {column} >= {int(bound)} THEN {i}' for i, bound in enumerate(bounds)) + \
+            f' ELSE {len(bounds) - 1} END'
+
+    origin = bounds[-1]
+    spotter_condition = ['spotter = ?'] if spotter else []
+    spotter_params = (spotter,) if spotter else ()
+    conditions = ['timestamp >= ?'] + (['timestamp <= ?'] if until is not None else []) + spotter_condition
+    params = [origin, origin] + ([until] if until is not None else []) + list(spotter_params)
+
+    # Times relative to the start of the oldest range, as REAL, since the sums of squares of long ranges don't fit
+    # 64-bit integers
+    parts = []
+    boundary = raw_boundary(conn, origin, time.time() if until is None else until)
+    if boundary is not None:
+        position, complete = boundary
+        conditions.append('(id > ? OR timestamp >= ?)')  # The older rolled up spots are read from the rollups
+        params += [position, complete]
+        end = complete if until is None else min(complete, until + 1)
+        for tier, first, last in rollup_ranges(conn, origin, end):
+            table, length = TIERS[tier]
+            # Time sums are shifted from the start of each bucket to the start of the oldest range
+            parts.append((f'''
+                SELECT spotter, {segment(f'bucket + {length - 1}')} AS segment, zone, band, n, snr_sum, snr_sq_sum,
+                    t_sum + n * shift AS t_sum, t_sq_sum + 2 * shift * t_sum + n * shift * shift AS t_sq_sum,
+                    t_snr_sum + shift * snr_sum AS t_snr_sum, NULL AS snr_min, NULL AS snr_max, 0 AS cw
+                FROM (SELECT *, CAST(bucket - ? AS REAL) AS shift FROM {table}
+                      WHERE {' AND '.join(['bucket >= ?', 'bucket < ?'] + spotter_condition)})
+            ''', [origin, first, last] + list(spotter_params)))
+    parts.insert(0, (f'''
+        SELECT spotter, {segment('timestamp')} AS segment, zone, band, 1 AS n, snr AS snr_sum, snr * snr AS snr_sq_sum,
+            t AS t_sum, t * t AS t_sq_sum, t * snr AS t_snr_sum, snr AS snr_min, snr AS snr_max, mode = 'CW' AS cw
+        FROM (SELECT *, CAST(timestamp - ? AS REAL) AS t FROM callsigns WHERE {' AND '.join(conditions)})
+    ''', params))
+
+    query = f'''
+        SELECT {'spotter' if by_spotter else "''"}, segment, zone, band, SUM(n), SUM(snr_sum), SUM(snr_sq_sum),
+            SUM(t_sum), SUM(t_sq_sum), SUM(t_snr_sum), MIN(snr_min), MAX(snr_max), TOTAL(cw)
+        FROM ({' UNION ALL '.join(sql for sql, _ in parts)})
+        GROUP BY {'spotter, ' if by_spotter else ''}segment, zone, band
+    '''
+    rows = conn.execute(query, [param for _, part_params in parts for param in part_params]).fetchall()
+    spotters = sorted({row[0] for row in rows})
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 12)
+    values[np.isnan(values[:, 9]), 9] = np.inf  # Min of cells only counted in the rollups
+    values[np.isnan(values[:, 10]), 10] = -np.inf  # Max of cells only counted in the rollups
+    keys = np.searchsorted(spotters, [row[0] for row in rows]) if rows else np.zeros(0, dtype=np.intp)
+
+    size = len(ZONES) * len(BANDS)
+    cells, inside = grid_cells(values[:, 1], values[:, 2])
+    sums = np.zeros((max(len(spotters), 1), len(bounds), values.shape[1] - 3, size))
+    sums[:, :, 6] = np.inf  # Min of segments without spots
+    sums[:, :, 7] = -np.inf  # Max of segments without spots
+    sums[keys[inside], values[inside, 0].astype(np.intp), :, cells[inside]] = values[inside, 3:]
+
+    if not by_spotter:
+        return segment_grids(sums[0], bounds, starts)
+    merged = sums.sum(axis=0)
+    merged[:, 6] = sums[:, :, 6].min(axis=0)
+    merged[:, 7] = sums[:, :, 7].max(axis=0)
+    grids = {name: segment_grids(spotter_sums, bounds, starts) for name, spotter_sums in zip(spotters, sums)}
+    grids[None] = segment_grids(merged, bounds, starts)
+    return grids
+
+
+def segment_grids(sums, bounds, starts):
+    """
+    Combines the sums of the segments between range starts into the statistics of each range.
+
+    Args:
+        sums (numpy.ndarray): Sums of each segment, newest first: count, SNR sum, sum of squares, the three
+            regression sums, min, max and CW count of every cell.
+        bounds (list): Start of each segment, newest first.
+        starts (list): Start of each range.
+
+    Returns:
+        list: The ZoneGrid of each range, in the order of starts.
+    """
+    sums = sums.copy()
+    # Each range adds up the segments from the newest one to its own
+    sums[:, 6] = np.minimum.accumulate(sums[:, 6])
+    sums[:, 7] = np.maximum.accumulate(sums[:, 7])
+    for column in (0, 1, 2, 3, 4, 5, 8):
+        sums[:, column] = np.cumsum(sums[:, column], axis=0)
+    # Cells only counted in the rollups have no min or max
+    sums[:, 6:8] = np.where(np.isfinite(sums[:, 6:8]), sums[:, 6:8], np.nan)
+    grids = [grid_from_sums(*segment_sums.reshape(len(segment_sums), len(ZONES), len(BANDS)))
+             for segment_sums in sums]
+    return [grids[bounds.index(start)] for start in starts]